@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Iterator
+
+
+def _ascii_word(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def on_word_boundaries(text: str, start: int, end: int) -> bool:
+    """False when text[start:end] cuts through an ASCII word, e.g. "tel" in "hotel".
+
+    CJK text has no word boundaries, so matches there always pass.
+    """
+    if start > 0 and _ascii_word(text[start]) and _ascii_word(text[start - 1]):
+        return False
+    if end < len(text) and _ascii_word(text[end - 1]) and _ascii_word(text[end]):
+        return False
+    return True
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher.
+
+    All patterns are found in one left-to-right pass over the haystack,
+    independent of how many patterns there are. Build once, search many.
+    """
+
+    def __init__(self, patterns: list[str] | None = None):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._own: list[list[int]] = [[]]  # patterns ending exactly at each node
+        self._out: list[list[int]] = [[]]  # own patterns plus those of the failure chain
+        self.patterns: list[str] = []
+        self._built = False
+        for pattern in patterns or []:
+            self.add(pattern)
+
+    def add(self, pattern: str) -> int:
+        """Add a pattern and return its id. Empty patterns are ignored (-1)."""
+        if not pattern:
+            return -1
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+                self._out.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+        pid = len(self.patterns)
+        self.patterns.append(pattern)
+        self._own[node].append(pid)
+        self._built = False
+        return pid
+
+    def build(self) -> None:
+        """Compute failure links and outputs (breadth-first).
+
+        Outputs are recomputed from each node's own patterns, so building
+        again after add() does not report a match twice.
+        """
+        self._out = [list(own) for own in self._own]
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, haystack: str) -> Iterator[tuple[int, int, int]]:
+        """Yield (start, end, pattern_id) for every, possibly overlapping, match."""
+        if not self._built:
+            self.build()
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for i, ch in enumerate(haystack):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield i + 1 - len(patterns[pid]), i + 1, pid
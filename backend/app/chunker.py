@@ -0,0 +1,98 @@
+from typing import NamedTuple
+
+
+# Break candidates, strongest first: paragraph, line, sentence, clause, word
+_BREAKS = (
+    ("\n\n",),
+    ("\n",),
+    ("。", "！", "？", ". ", "! ", "? "),
+    ("；", ";", "，", ", "),
+    (" ", "\t"),
+)
+
+
+class TextChunk(NamedTuple):
+    start: int
+    text: str
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+
+def _find_break(text: str, lo: int, hi: int) -> int:
+    """Return the best cut position in text[lo:hi], or hi if none is found."""
+    for separators in _BREAKS:
+        best = -1
+        for sep in separators:
+            pos = text.rfind(sep, lo, hi)
+            if pos != -1:
+                best = max(best, pos + len(sep))
+        if best > lo:
+            return best
+    return hi
+
+
+def _find_restart(text: str, lo: int, hi: int) -> int:
+    """Return the first boundary in text[lo:hi] to start an overlapping chunk at."""
+    for separators in _BREAKS:
+        best = -1
+        for sep in separators:
+            pos = text.find(sep, lo, hi)
+            if pos != -1 and pos + len(sep) < hi:
+                best = pos + len(sep) if best == -1 else min(best, pos + len(sep))
+        if best != -1:
+            return best
+    return lo
+
+
+def split_text(text: str, max_chars: int, overlap: int = 0) -> list[TextChunk]:
+    """Split text into chunks of at most max_chars on natural boundaries.
+
+    Cuts prefer paragraph, then line, sentence, clause and word boundaries.
+    Consecutive chunks share up to `overlap` characters so that entities
+    straddling a cut are still seen whole by one of them.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [TextChunk(0, text)]
+
+    overlap = max(0, min(overlap, max_chars // 2))
+    chunks = []
+    pos = 0
+    while pos < len(text):
+        hi = min(pos + max_chars, len(text))
+        end = hi if hi == len(text) else _find_break(text, pos + max_chars // 2, hi)
+        chunks.append(TextChunk(pos, text[pos:end]))
+        if end >= len(text):
+            break
+        restart = _find_restart(text, end - overlap, end) if overlap else end
+        pos = max(restart, pos + 1)
+    return chunks
+
+
+def split_lines(text: str) -> list[TextChunk]:
+    """Return the non-empty lines of text with their offsets."""
+    lines = []
+    pos = 0
+    for line in text.split("\n"):
+        if line:
+            lines.append(TextChunk(pos, line))
+        pos += len(line) + 1
+    return lines
+
+
+def merge_detections(detections: list[dict]) -> list[dict]:
+    """Sort detections by position and drop duplicates.
+
+    Duplicates come from overlapping chunks or from rule and model hits on
+    the same span; types are compared case-insensitively.
+    """
+    seen = set()
+    merged = []
+    for det in sorted(detections, key=lambda d: (d["start"], d["end"])):
+        key = (det["start"], det["end"], det["type"].lower())
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(det)
+    return merged
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
@@ -11,6 +12,113 @@ class Settings:
     )
     LLM_API_KEY: str = os.getenv("LLM_API_KEY", "EMPTY")
     LLM_MODEL: str = os.getenv("LLM_MODEL", "qwen3-0.6b")
+    # Async client connection pool / request limits
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "120"))
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_POOL_SIZE: int = int(os.getenv("LLM_POOL_SIZE", "64"))
+    LLM_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "32"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    # Multi-backend routing: JSON list of backends (empty = the single
+    # LLM_API_BASE/LLM_MODEL backend above), routing strategy
+    # ("least_outstanding" or "latency"), failover, circuit breaker and hedging
+    LLM_BACKENDS: str = os.getenv("LLM_BACKENDS", "")
+    LLM_ROUTING_STRATEGY: str = os.getenv("LLM_ROUTING_STRATEGY", "least_outstanding")
+    LLM_FAILOVER_ATTEMPTS: int = int(os.getenv("LLM_FAILOVER_ATTEMPTS", "1"))
+    LLM_CIRCUIT_FAILURES: int = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+    LLM_CIRCUIT_COOLDOWN: float = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+    LLM_HEALTH_CHECK_INTERVAL: float = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "15"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    # Cascade: backends of a larger model (LLM_BACKENDS format; empty
+    # disables) that re-check chunks the primary model is uncertain about.
+    # Policy triggers: "anchors" (a contact anchor with no detection within
+    # LLM_CASCADE_ANCHOR_WINDOW characters after it), "rules" (the model
+    # found less than LLM_CASCADE_MIN_RULE_AGREEMENT of the rule hits; never
+    # fires in DETECTION_MODE=rules) and "parse_failure" (no usable reply)
+    LLM_CASCADE_BACKENDS: str = os.getenv("LLM_CASCADE_BACKENDS", "")
+    LLM_CASCADE_POLICY: str = os.getenv("LLM_CASCADE_POLICY", "anchors,rules,parse_failure")
+    LLM_CASCADE_ANCHORS: str = os.getenv(
+        "LLM_CASCADE_ANCHORS",
+        "联系方式,联系电话,联系人,律师事务所,电话,传真,邮箱,地址,tel,fax,email,contact",
+    )
+    LLM_CASCADE_ANCHOR_WINDOW: int = int(os.getenv("LLM_CASCADE_ANCHOR_WINDOW", "50"))
+    LLM_CASCADE_MIN_RULE_AGREEMENT: float = float(os.getenv("LLM_CASCADE_MIN_RULE_AGREEMENT", "1.0"))
+    # Scheduler: queued model calls allowed per priority before new requests
+    # get 429, per-request deadline (s), and the size limit for "interactive"
+    LLM_QUEUE_MAX_INTERACTIVE: int = int(os.getenv("LLM_QUEUE_MAX_INTERACTIVE", "256"))
+    LLM_QUEUE_MAX_BULK: int = int(os.getenv("LLM_QUEUE_MAX_BULK", "64"))
+    LLM_REQUEST_DEADLINE: float = float(os.getenv("LLM_REQUEST_DEADLINE", "300"))
+    LLM_INTERACTIVE_MAX_CHARS: int = int(os.getenv("LLM_INTERACTIVE_MAX_CHARS", "20000"))
+    # Prompt registry version (see prompts.py) and explicit context caching
+    # of the static system prompt on DashScope. vLLM prefix caching is a
+    # server flag (--enable-prefix-caching) set where vLLM is launched.
+    LLM_PROMPT_VERSION: str = os.getenv("LLM_PROMPT_VERSION", "v2")
+    LLM_CONTEXT_CACHING: bool = os.getenv("LLM_CONTEXT_CACHING", "false").lower() == "true"
+    # Structured output: "off", "auto" (JSON schema on vLLM, JSON mode on
+    # DashScope), "json_schema", "guided_json" or "json_object"; replies that
+    # still fail to parse are retried this many times with a repair prompt
+    LLM_STRUCTURED_OUTPUT: str = os.getenv("LLM_STRUCTURED_OUTPUT", "off")
+    LLM_JSON_REPAIR_ATTEMPTS: int = int(os.getenv("LLM_JSON_REPAIR_ATTEMPTS", "1"))
+    # Long-document chunking (sizes in characters)
+    LLM_CHUNK_SIZE: int = int(os.getenv("LLM_CHUNK_SIZE", "2000"))
+    LLM_CHUNK_OVERLAP: int = int(os.getenv("LLM_CHUNK_OVERLAP", "200"))
+    LLM_CHUNK_CONCURRENCY: int = int(os.getenv("LLM_CHUNK_CONCURRENCY", "8"))
+    # Batch masking: short records packed into one prompt
+    LLM_BATCH_PACK_CHARS: int = int(os.getenv("LLM_BATCH_PACK_CHARS", "2000"))
+    LLM_BATCH_PACK_ITEMS: int = int(os.getenv("LLM_BATCH_PACK_ITEMS", "20"))
+    MAX_BATCH_ITEMS: int = int(os.getenv("MAX_BATCH_ITEMS", "1000"))
+    # Detection cache: in-process LRU entries, TTL in seconds, optional sqlite
+    # file holding at most DETECTION_CACHE_MAX_ROWS rows (0 = no cap)
+    DETECTION_CACHE_SIZE: int = int(os.getenv("DETECTION_CACHE_SIZE", "4096"))
+    DETECTION_CACHE_TTL: float = float(os.getenv("DETECTION_CACHE_TTL", "86400"))
+    DETECTION_CACHE_PATH: str = os.getenv("DETECTION_CACHE_PATH", "")
+    DETECTION_CACHE_MAX_ROWS: int = int(os.getenv("DETECTION_CACHE_MAX_ROWS", "100000"))
+    DETECTION_CACHE_MIN_PARAGRAPH: int = int(os.getenv("DETECTION_CACHE_MIN_PARAGRAPH", "64"))
+    # Per-tenant dictionary of known entities (sqlite file; empty disables),
+    # learned from detections and matched before the model; STRIP replaces
+    # known entities by placeholders in the text the model sees
+    ENTITY_DICT_PATH: str = os.getenv("ENTITY_DICT_PATH", "")
+    ENTITY_DICT_LEARN: bool = os.getenv("ENTITY_DICT_LEARN", "false").lower() == "true"
+    ENTITY_DICT_STRIP: bool = os.getenv("ENTITY_DICT_STRIP", "true").lower() == "true"
+    ENTITY_DICT_MIN_LENGTH: int = int(os.getenv("ENTITY_DICT_MIN_LENGTH", "2"))
+    # Bearer token for /api/entities; empty disables those endpoints
+    ENTITY_DICT_ADMIN_TOKEN: str = os.getenv("ENTITY_DICT_ADMIN_TOKEN", "")
+    # "llm", "rules" (rule-covered categories skip the model) or "hybrid"
+    DETECTION_MODE: str = os.getenv("DETECTION_MODE", "llm")
+    # Chunks whose pre-filter score (app/prefilter.py) is below this skip
+    # the model; 0 disables the pre-filter, 1 needs one strong PII signal
+    PREFILTER_THRESHOLD: float = float(os.getenv("PREFILTER_THRESHOLD", "0"))
+    # Key for the deterministic "pseudonym" mask strategy; the strategy is
+    # rejected while it is empty
+    MASK_PSEUDONYM_SECRET: str = os.getenv("MASK_PSEUDONYM_SECRET", "")
+    # Document parsing pool: "process", "thread" or "inline" (on the event loop)
+    PARSE_EXECUTOR: str = os.getenv("PARSE_EXECUTOR", "process")
+    PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+    PARSE_TIMEOUT: float = float(os.getenv("PARSE_TIMEOUT", "120"))
+    PARSE_MAX_TASKS_PER_CHILD: int = int(os.getenv("PARSE_MAX_TASKS_PER_CHILD", "50"))
+    # PDF text backend: "auto" (first installed of pypdfium2, pdfminer,
+    # pypdf2) or one of them; PDFs with at least PDF_PARALLEL_MIN_PAGES pages
+    # are split into page ranges across the parse pool (0 disables)
+    PDF_BACKEND: str = os.getenv("PDF_BACKEND", "auto")
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+    # Tabular masking of CSV/XLSX: distinct values sampled per column for
+    # profiling, and the share of them that must be one PII type for the
+    # whole column to be masked without further detection
+    TABULAR_SAMPLE_ROWS: int = int(os.getenv("TABULAR_SAMPLE_ROWS", "50"))
+    TABULAR_WHOLE_COLUMN_RATIO: float = float(os.getenv("TABULAR_WHOLE_COLUMN_RATIO", "0.8"))
+    # Background jobs (/api/jobs): sqlite store and spooled uploads live in
+    # JOBS_DIR; failed chunks are retried up to JOBS_MAX_ATTEMPTS runs and
+    # finished jobs are deleted after JOBS_RETENTION seconds
+    JOBS_DIR: str = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "pii-masking-jobs"))
+    JOBS_WORKERS: int = int(os.getenv("JOBS_WORKERS", "2"))
+    JOBS_MAX_ATTEMPTS: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+    JOBS_RETENTION: float = float(os.getenv("JOBS_RETENTION", str(7 * 86400)))
+    # Metrics at /api/metrics; Server-Timing adds per-request stage timings
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_SERVER_TIMING: bool = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
     BACKEND_HOST: str = os.getenv("BACKEND_HOST", "0.0.0.0")
     BACKEND_PORT: int = int(os.getenv("BACKEND_PORT", "8000"))
 
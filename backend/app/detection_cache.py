@@ -0,0 +1,145 @@
+"""Content-addressed cache of chunk-level detections.
+
+Entries are keyed on a hash of the text, the sorted categories, the model
+and the prompt version, so a change to any of them never serves stale
+detections. An in-process LRU with a TTL sits in front of an optional
+sqlite file that survives restarts. Writes to the file are batched and
+committed in a worker thread, and expired rows and rows beyond the row
+cap are deleted at most every PRUNE_INTERVAL seconds, so detected PII
+does not stay on disk past the TTL.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 60.0
+
+
+def make_cache_key(text: str, categories: list[str], model: str, prompt_version: str) -> str:
+    h = hashlib.sha256()
+    for part in (prompt_version, model, "\x1f".join(sorted(c.lower() for c in categories)), text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class DetectionCache:
+    """LRU + TTL cache of detection lists, optionally backed by sqlite."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400, path: str = "", max_rows: int = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._entries: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        # Rows waiting to be written, and whether a writer is running
+        self._pending: list[tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+        self._writing = False
+        self._last_prune = 0.0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS detections "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS detections_created ON detections (created)")
+            self._prune()
+            self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, key: str) -> list[dict] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                metrics.CACHE_REQUESTS.inc("hit")
+                return entry[1]
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT created, value FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not self._expired(row[0]):
+                detections = json.loads(row[1])
+                self._remember(key, row[0], detections)
+                metrics.CACHE_REQUESTS.inc("hit_disk")
+                return detections
+
+        metrics.CACHE_REQUESTS.inc("miss")
+        return None
+
+    def set(self, key: str, detections: list[dict]) -> None:
+        """Cache detections; on an event loop, the sqlite write runs in a thread."""
+        created = time.time()
+        self._remember(key, created, detections)
+        if self._db is None:
+            return
+        with self._lock:
+            self._pending.append((key, created, json.dumps(detections, ensure_ascii=False)))
+            if self._writing:
+                return
+            self._writing = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush()
+        else:
+            loop.run_in_executor(None, self._flush)
+
+    def _flush(self) -> None:
+        """Write pending rows in one transaction per batch until none are left."""
+        while True:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                if not rows:
+                    self._writing = False
+                    return
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO detections (key, created, value) VALUES (?, ?, ?)", rows
+                )
+                if time.monotonic() - self._last_prune >= PRUNE_INTERVAL:
+                    self._prune()
+                self._db.commit()
+            except sqlite3.Error:
+                logger.exception("Failed to persist detection cache entries")
+
+    def _prune(self) -> None:
+        """Delete expired rows and the oldest rows beyond max_rows (uncommitted)."""
+        self._last_prune = time.monotonic()
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM detections WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_rows > 0:
+            self._db.execute(
+                "DELETE FROM detections WHERE key IN "
+                "(SELECT key FROM detections ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+
+    def _remember(self, key: str, created: float, detections: list[dict]) -> None:
+        self._entries[key] = (created, detections)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        with self._lock:
+            self._pending.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM detections")
+            self._db.commit()
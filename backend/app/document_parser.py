@@ -1,53 +1,234 @@
+"""Document text extraction.
+
+Every supported format has an extractor in EXTRACTORS that returns the
+document text together with a source map: SourceSpans tying text offsets
+back to PDF pages or DOCX paragraph runs, so detections can be located in
+(and written back into) the original file. PDF text comes from the
+fastest installed backend in PDF_BACKENDS unless PDF_BACKEND picks one.
+"""
+
+import codecs
+import importlib.util
 import io
+from typing import BinaryIO, Callable, Iterator, NamedTuple
+
 import pandas as pd
+from docx import Document
+from docx.document import Document as DocxDocument
+from docx.table import Table
+from docx.text.hyperlink import Hyperlink
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from openpyxl import load_workbook
 from PyPDF2 import PdfReader
-from docx2python import docx2python
+
+from .config import settings
 
 
 SUPPORTED_EXTENSIONS = {".txt", ".pdf", ".docx", ".csv", ".xlsx"}
 
+# Streaming parsers: bytes read per text block, rows per table batch
+TEXT_BLOCK_SIZE = 1024 * 1024
+ROW_BATCH_SIZE = 10000
+
+
+class SourceSpan(NamedTuple):
+    """text[start:end] comes from location: (page,) in a PDF,
+    (paragraph, run) in a DOCX, () for formats without a finer map."""
+    start: int
+    end: int
+    location: tuple[int, ...]
+
+
+class Extraction(NamedTuple):
+    text: str
+    spans: list[SourceSpan]
+
+    def locate(self, start: int, end: int) -> Iterator[tuple[SourceSpan, int, int]]:
+        """Yield (span, local_start, local_end) for every span overlapping text[start:end]."""
+        for span in self.spans:
+            if span.start < end and start < span.end:
+                yield span, max(start, span.start) - span.start, min(end, span.end) - span.start
+
+
+class _TextBuilder:
+    """Join pieces with a separator while recording their source spans."""
+
+    def __init__(self, separator: str = "\n"):
+        self.separator = separator
+        self.parts: list[str] = []
+        self.spans: list[SourceSpan] = []
+        self.length = 0
+        self._pending_separator = False
+
+    def add(self, text: str, location: tuple[int, ...]) -> None:
+        if not text:
+            return
+        if self._pending_separator:
+            self.parts.append(self.separator)
+            self.length += len(self.separator)
+            self._pending_separator = False
+        self.parts.append(text)
+        self.spans.append(SourceSpan(self.length, self.length + len(text), location))
+        self.length += len(text)
+
+    def end_block(self) -> None:
+        """Start the next piece on a new block, if anything has been added."""
+        self._pending_separator = self.length > 0
+
+    def build(self) -> Extraction:
+        return Extraction("".join(self.parts), self.spans)
+
+
+class PdfBackend(NamedTuple):
+    module: str  # import required for the backend to be available
+    page_count: Callable[[BinaryIO], int]
+    pages: Callable[[BinaryIO, int, int | None], Iterator[str]]  # (stream, first, stop)
+
+
+def _pypdfium2_page_count(stream: BinaryIO) -> int:
+    import pypdfium2
+
+    return len(pypdfium2.PdfDocument(stream))
+
+
+def _pypdfium2_pages(stream: BinaryIO, first: int, stop: int | None) -> Iterator[str]:
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(stream)
+    try:
+        for index in range(first, len(pdf) if stop is None else min(stop, len(pdf))):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            yield textpage.get_text_range().replace("\r\n", "\n")
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+
+def _pdfminer_page_count(stream: BinaryIO) -> int:
+    from pdfminer.pdfpage import PDFPage
+
+    return sum(1 for _ in PDFPage.get_pages(stream))
+
+
+def _pdfminer_pages(stream: BinaryIO, first: int, stop: int | None) -> Iterator[str]:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    numbers = None if stop is None and first == 0 else range(first, stop or 10**9)
+    for layout in extract_pages(stream, page_numbers=numbers):
+        yield "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer)).rstrip("\n")
+
+
+def _pypdf2_page_count(stream: BinaryIO) -> int:
+    return len(PdfReader(stream).pages)
+
+
+def _pypdf2_pages(stream: BinaryIO, first: int, stop: int | None) -> Iterator[str]:
+    pages = PdfReader(stream).pages
+    for index in range(first, len(pages) if stop is None else min(stop, len(pages))):
+        yield pages[index].extract_text() or ""
+
+
+# In order of preference for PDF_BACKEND=auto
+PDF_BACKENDS = {
+    "pypdfium2": PdfBackend("pypdfium2", _pypdfium2_page_count, _pypdfium2_pages),
+    "pdfminer": PdfBackend("pdfminer", _pdfminer_page_count, _pdfminer_pages),
+    "pypdf2": PdfBackend("PyPDF2", _pypdf2_page_count, _pypdf2_pages),
+}
+
+
+def pdf_backend(name: str | None = None) -> PdfBackend:
+    """Return the named PDF backend, or the first installed one for "auto".
+
+    Raises ValueError for unknown or uninstalled backends.
+    """
+    name = (name or settings.PDF_BACKEND).lower()
+    if name == "auto":
+        for backend in PDF_BACKENDS.values():
+            if importlib.util.find_spec(backend.module) is not None:
+                return backend
+    backend = PDF_BACKENDS.get(name)
+    if backend is None or importlib.util.find_spec(backend.module) is None:
+        raise ValueError(f"PDF backend not available: {name}")
+    return backend
+
+
+def pdf_page_count(path: str) -> int:
+    with open(path, "rb") as stream:
+        return pdf_backend().page_count(stream)
+
+
+def pdf_page_texts(path: str, first: int, stop: int) -> list[str]:
+    """Extract pages [first, stop) of a PDF; used for parallel extraction."""
+    with open(path, "rb") as stream:
+        return list(pdf_backend().pages(stream, first, stop))
+
+
+def pdf_extraction(pages: list[str], first: int = 0) -> Extraction:
+    builder = _TextBuilder()
+    for index, text in enumerate(pages, first):
+        builder.add(text, (index,))
+        builder.end_block()
+    return builder.build()
+
+
+def paragraph_runs(paragraph: Paragraph) -> list[Run]:
+    """Runs of a paragraph in document order, including hyperlink runs."""
+    runs = []
+    for item in paragraph.iter_inner_content():
+        if isinstance(item, Hyperlink):
+            runs.extend(item.runs)
+        else:
+            runs.append(item)
+    return runs
+
+
+def _block_paragraphs(container, seen_cells: set) -> Iterator[Paragraph]:
+    for block in container.iter_inner_content():
+        if isinstance(block, Table):
+            for row in block.rows:
+                for cell in row.cells:
+                    # Merged cells repeat the same underlying cell
+                    if id(cell._tc) not in seen_cells:
+                        seen_cells.add(id(cell._tc))
+                        yield from _block_paragraphs(cell, seen_cells)
+        else:
+            yield block
+
+
+def docx_paragraphs(document: DocxDocument) -> Iterator[Paragraph]:
+    """Every paragraph of the body (tables included) and the section headers
+    and footers, in a fixed order that also indexes SourceSpan locations."""
+    seen_cells: set = set()
+    yield from _block_paragraphs(document, seen_cells)
+    for section in document.sections:
+        for part in (section.header, section.footer):
+            if not part.is_linked_to_previous:
+                yield from _block_paragraphs(part, seen_cells)
+
+
+def docx_extraction(document: DocxDocument) -> Extraction:
+    builder = _TextBuilder()
+    for p_index, paragraph in enumerate(docx_paragraphs(document)):
+        for r_index, run in enumerate(paragraph_runs(paragraph)):
+            builder.add(run.text, (p_index, r_index))
+        builder.end_block()
+    return builder.build()
+
 
 def parse_txt(content: bytes) -> str:
     return content.decode("utf-8", errors="replace")
 
 
 def parse_pdf(content: bytes) -> str:
-    reader = PdfReader(io.BytesIO(content))
-    text_parts = []
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text_parts.append(page_text)
-    return "\n".join(text_parts)
+    return extract_pdf(io.BytesIO(content)).text
 
 
 def parse_docx(content: bytes) -> str:
-    """解析DOCX文件内容并去除重复段落"""
-    # 直接使用docx2python处理bytes内容
-    from docx2python import docx2python
-    import io
-    
-    # 创建BytesIO对象供docx2python使用
-    file_stream = io.BytesIO(content)
-    
-    with docx2python(file_stream) as docx_content:
-        full_text = docx_content.text
-
-        # 按段落去重
-        paragraphs = full_text.split('\n')
-
-        # 使用字典保持顺序的去重
-        seen = {}
-        unique_paragraphs = []
-
-        for para in paragraphs:
-            para = para.strip()
-            if para and para not in seen:
-                seen[para] = True
-                unique_paragraphs.append(para)
-
-        cleaned_text = '\n'.join(unique_paragraphs)
-        return cleaned_text
+    return extract_docx(io.BytesIO(content)).text
 
 
 def parse_csv(content: bytes) -> str:
@@ -60,12 +241,8 @@ def parse_xlsx(content: bytes) -> str:
     return df.to_string(index=False)
 
 
-def parse_document(filename: str, content: bytes) -> str:
-    """Parse document content based on file extension.
-
-    Returns extracted plain text.
-    Raises ValueError for unsupported file types.
-    """
+def file_extension(filename: str) -> str:
+    """Return the lower-cased extension, raising ValueError if unsupported."""
     ext = "." + filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
 
     if ext not in SUPPORTED_EXTENSIONS:
@@ -73,6 +250,103 @@ def parse_document(filename: str, content: bytes) -> str:
             f"Unsupported file type: {ext}. "
             f"Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
         )
+    return ext
+
+
+def iter_txt(stream: BinaryIO) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while block := stream.read(TEXT_BLOCK_SIZE):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_pdf(stream: BinaryIO) -> Iterator[str]:
+    first = True
+    for page_text in pdf_backend().pages(stream, 0, None):
+        if page_text:
+            yield page_text if first else "\n" + page_text
+            first = False
+
+
+def iter_docx(stream: BinaryIO) -> Iterator[str]:
+    # python-docx has no incremental API; the text is built once
+    yield extract_docx(stream).text
+
+
+def _iter_frames(frames: Iterator[pd.DataFrame]) -> Iterator[str]:
+    first = True
+    for df in frames:
+        if df.empty and not first:
+            continue
+        yield (
+            df.to_string(index=False)
+            if first
+            else "\n" + df.to_string(index=False, header=False)
+        )
+        first = False
+
+
+def iter_csv(stream: BinaryIO) -> Iterator[str]:
+    yield from _iter_frames(pd.read_csv(stream, chunksize=ROW_BATCH_SIZE))
+
+
+def iter_xlsx(stream: BinaryIO) -> Iterator[str]:
+    """Stream the first sheet, the one parse_xlsx (pd.read_excel) reads."""
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        def frames() -> Iterator[pd.DataFrame]:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= ROW_BATCH_SIZE:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+
+        yield from _iter_frames(frames())
+    finally:
+        workbook.close()
+
+
+def iter_document(filename: str, stream: BinaryIO) -> Iterator[str]:
+    """Parse a document from a binary file object, yielding text pieces.
+
+    Pieces are produced page by page (PDF), in row batches (CSV/XLSX) or
+    in fixed-size blocks (TXT), and in one piece for DOCX, so a large
+    upload spooled to disk is never held in memory as a whole. Joining the
+    pieces with "" gives the document text. CSV/XLSX column widths are
+    computed per batch, so wide tables may be padded differently from
+    parse_document.
+
+    Raises ValueError for unsupported file types.
+    """
+    iterators = {
+        ".txt": iter_txt,
+        ".pdf": iter_pdf,
+        ".docx": iter_docx,
+        ".csv": iter_csv,
+        ".xlsx": iter_xlsx,
+    }
+    return iterators[file_extension(filename)](stream)
+
+
+def parse_document(filename: str, content: bytes) -> str:
+    """Parse document content based on file extension.
+
+    Returns extracted plain text.
+    Raises ValueError for unsupported file types.
+    """
+    ext = file_extension(filename)
 
     parsers = {
         ".txt": parse_txt,
@@ -83,3 +357,61 @@ def parse_document(filename: str, content: bytes) -> str:
     }
 
     return parsers[ext](content)
+
+
+# Extractors per extension; register_extractor adds or replaces one
+EXTRACTORS: dict[str, Callable[[BinaryIO], Extraction]] = {}
+
+
+def register_extractor(ext: str) -> Callable:
+    def register(func: Callable[[BinaryIO], Extraction]) -> Callable[[BinaryIO], Extraction]:
+        EXTRACTORS[ext] = func
+        return func
+    return register
+
+
+def _whole_text(pieces: Iterator[str]) -> Extraction:
+    text = "".join(pieces)
+    return Extraction(text, [SourceSpan(0, len(text), ())] if text else [])
+
+
+@register_extractor(".pdf")
+def extract_pdf(stream: BinaryIO) -> Extraction:
+    return pdf_extraction(list(pdf_backend().pages(stream, 0, None)))
+
+
+@register_extractor(".docx")
+def extract_docx(stream: BinaryIO) -> Extraction:
+    return docx_extraction(Document(stream))
+
+
+@register_extractor(".txt")
+def extract_txt(stream: BinaryIO) -> Extraction:
+    return _whole_text(iter_txt(stream))
+
+
+@register_extractor(".csv")
+def extract_csv(stream: BinaryIO) -> Extraction:
+    return _whole_text(iter_csv(stream))
+
+
+@register_extractor(".xlsx")
+def extract_xlsx(stream: BinaryIO) -> Extraction:
+    return _whole_text(iter_xlsx(stream))
+
+
+def extract_document(filename: str, stream: BinaryIO) -> Extraction:
+    """Extract text and its source map; raises ValueError for unsupported types."""
+    return EXTRACTORS[file_extension(filename)](stream)
+
+
+def extract_file(filename: str, path: str) -> Extraction:
+    """Extract a document stored at path; used by the parse worker pool."""
+    with open(path, "rb") as stream:
+        return extract_document(filename, stream)
+
+
+def parse_file(filename: str, path: str) -> str:
+    """Parse a document stored at path; used by the parse worker pool."""
+    with open(path, "rb") as stream:
+        return "".join(iter_document(filename, stream))
@@ -0,0 +1,204 @@
+"""Per-tenant dictionary of known PII entities.
+
+Entities confirmed in earlier runs (model detections when ENTITY_DICT_LEARN
+is on, and entities added through /api/entities) are stored per tenant in
+sqlite. Each tenant's entities are compiled into an Aho-Corasick automaton
+on first use; newly learned entities go into a small second automaton
+that is merged into the first once it grows, so a lookup is one linear
+pass per automaton over the text whatever the dictionary size, and
+learning does not rebuild the whole dictionary.
+
+detect_pii matches the dictionary before calling the model: known
+entities are masked without it, and replaced by a type placeholder in the
+text the model sees.
+"""
+
+import bisect
+import math
+import sqlite3
+import time
+from typing import Iterator, NamedTuple
+
+from .aho_corasick import AhoCorasick, on_word_boundaries
+from .masking import merge_spans
+
+# Learned entities kept out of the main automaton before it is rebuilt
+RECENT_MIN = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    tenant TEXT NOT NULL,
+    value TEXT NOT NULL,
+    type TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (tenant, value)
+)
+"""
+
+
+class _TenantEntities:
+    """A tenant's entities, in a main automaton and a small one for recent additions.
+
+    Learning only rebuilds the recent automaton; it is folded into the
+    main one once it outgrows the square root of the dictionary, so
+    rebuilds cost O(sqrt(n)) per added entity amortized instead of O(n).
+    """
+
+    def __init__(self, rows: list[tuple[str, str]] = ()):
+        self.main = AhoCorasick()
+        self.main_types: list[str] = []  # by pattern id
+        self.recent = AhoCorasick()
+        self.recent_types: list[str] = []
+        self.values: set[str] = set()
+        for value, det_type in rows:
+            self.main.add(value)
+            self.main_types.append(det_type)
+            self.values.add(value)
+
+    def add(self, value: str, det_type: str) -> None:
+        self.recent.add(value)
+        self.recent_types.append(det_type)
+        self.values.add(value)
+        if len(self.recent_types) > max(RECENT_MIN, math.isqrt(len(self.main_types))):
+            for recent_value, recent_type in zip(self.recent.patterns, self.recent_types):
+                self.main.add(recent_value)
+                self.main_types.append(recent_type)
+            self.recent = AhoCorasick()
+            self.recent_types = []
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, str]]:
+        """Yield (start, end, type) for every match in either automaton."""
+        for automaton, types in ((self.main, self.main_types), (self.recent, self.recent_types)):
+            if types:
+                for start, end, pid in automaton.iter_matches(text):
+                    yield start, end, types[pid]
+
+
+class EntityDictionary:
+    def __init__(self, path: str, min_length: int = 2):
+        self.min_length = min_length
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._tenants: dict[str, _TenantEntities] = {}
+
+    def _load(self, tenant: str) -> _TenantEntities:
+        entities = self._tenants.get(tenant)
+        if entities is None:
+            rows = self._db.execute(
+                "SELECT value, type FROM entities WHERE tenant = ? ORDER BY created", (tenant,)
+            )
+            entities = self._tenants[tenant] = _TenantEntities(rows.fetchall())
+        return entities
+
+    def match(self, tenant: str, text: str, categories: list[str]) -> list[dict]:
+        """Return detections for every known entity of a requested category in text."""
+        entities = self._load(tenant)
+        if not entities.values:
+            return []
+        wanted = {c.lower(): c for c in categories}
+        detections = []
+        for start, end, stored_type in entities.iter_matches(text):
+            det_type = wanted.get(stored_type.lower())
+            if det_type is not None and on_word_boundaries(text, start, end):
+                detections.append({
+                    "type": det_type,
+                    "original": text[start:end],
+                    "start": start,
+                    "end": end,
+                })
+        return detections
+
+    def learn(self, tenant: str, detections: list[dict]) -> int:
+        """Add detections not known yet; return how many were added."""
+        entities = self._load(tenant)
+        new: dict[str, str] = {}
+        for det in detections:
+            value = det["original"].strip()
+            if len(value) >= self.min_length and value not in entities.values:
+                new.setdefault(value, det["type"].lower())
+        if new:
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR IGNORE INTO entities (tenant, value, type, created) VALUES (?, ?, ?, ?)",
+                [(tenant, value, det_type, now) for value, det_type in new.items()],
+            )
+            self._db.commit()
+            for value, det_type in new.items():
+                entities.add(value, det_type)
+        return len(new)
+
+    def add(self, tenant: str, entities: list[tuple[str, str]]) -> int:
+        """Add or retype (type, value) entities; return how many were given."""
+        rows = [(tenant, value, det_type.lower(), time.time()) for det_type, value in entities if value.strip()]
+        self._db.executemany(
+            "INSERT OR REPLACE INTO entities (tenant, value, type, created) VALUES (?, ?, ?, ?)", rows
+        )
+        self._db.commit()
+        self._tenants.pop(tenant, None)  # the automaton cannot retype or drop patterns in place
+        return len(rows)
+
+    def remove(self, tenant: str, values: list[str] | None = None) -> int:
+        """Remove the given values, or every entity of the tenant if None."""
+        if values is None:
+            cursor = self._db.execute("DELETE FROM entities WHERE tenant = ?", (tenant,))
+        else:
+            cursor = self._db.executemany(
+                "DELETE FROM entities WHERE tenant = ? AND value = ?", [(tenant, v) for v in values]
+            )
+        self._db.commit()
+        self._tenants.pop(tenant, None)
+        return cursor.rowcount
+
+    def entries(self, tenant: str) -> list[dict]:
+        rows = self._db.execute(
+            "SELECT type, value FROM entities WHERE tenant = ? ORDER BY created", (tenant,)
+        )
+        return [{"type": det_type, "value": value} for det_type, value in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class PlaceholderText(NamedTuple):
+    """Text with known entities replaced by placeholders, and the pieces
+    (text_start, text_end, original_start) it shares with the original."""
+    text: str
+    pieces: list[tuple[int, int, int]]
+
+    def map_detections(self, original: str, detections: list[dict]) -> list[dict]:
+        """Move detections to offsets in original; drop any touching a placeholder."""
+        starts = [piece[0] for piece in self.pieces]
+        mapped = []
+        for det in detections:
+            index = bisect.bisect_right(starts, det["start"]) - 1
+            if index < 0:
+                continue
+            piece_start, piece_end, original_start = self.pieces[index]
+            if det["end"] > piece_end:
+                continue
+            start = original_start + det["start"] - piece_start
+            end = start + det["end"] - det["start"]
+            mapped.append({**det, "original": original[start:end], "start": start, "end": end})
+        return mapped
+
+
+def replace_known(text: str, known: list[dict]) -> PlaceholderText:
+    """Replace known entity spans by "[TYPE]" placeholders."""
+    parts = []
+    pieces = []
+    pos = 0
+    length = 0
+    for start, end, det_type in merge_spans(known, len(text)):
+        if start > pos:
+            pieces.append((length, length + start - pos, pos))
+            parts.append(text[pos:start])
+            length += start - pos
+        placeholder = f"[{det_type.upper()}]"
+        parts.append(placeholder)
+        length += len(placeholder)
+        pos = end
+    if pos < len(text):
+        pieces.append((length, length + len(text) - pos, pos))
+        parts.append(text[pos:])
+    return PlaceholderText("".join(parts), pieces)
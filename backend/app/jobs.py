@@ -0,0 +1,308 @@
+"""Background jobs for documents too large for a synchronous request.
+
+A job runs parse -> chunk -> detect -> mask in a worker task of this
+process. The job, its parsed text, every finished chunk and the final
+result are stored in sqlite under JOBS_DIR, so a job interrupted by a
+restart is picked up again at startup and only its missing chunks are
+sent to the model.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+from fastapi import UploadFile
+
+from . import metrics
+from .chunker import merge_detections
+from .config import settings
+from .masking import MaskRenderer
+from .parse_pool import parse_pool, spool_upload
+from .scheduler import BULK, request_context
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+PARSING = "parsing"
+DETECTING = "detecting"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    filename TEXT,
+    upload_path TEXT,
+    text TEXT,
+    categories TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    chunk_size INTEGER,
+    chunk_overlap INTEGER,
+    chunks_total INTEGER NOT NULL DEFAULT 0,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT
+);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    detections TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class JobStore:
+    """sqlite persistence for jobs and their per-chunk detections."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def create(self, job_id: str, categories: list[str], strategy: str,
+               text: str | None = None, filename: str | None = None,
+               upload_path: str | None = None) -> None:
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO jobs (id, status, created, updated, filename, upload_path, text, categories, strategy) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, now, now, filename, upload_path, text, json.dumps(categories), strategy),
+        )
+        self._db.commit()
+
+    def get(self, job_id: str) -> sqlite3.Row | None:
+        return self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        self._db.commit()
+
+    def save_chunk(self, job_id: str, index: int, detections: list[dict]) -> int:
+        """Store a finished chunk and return the number of finished chunks."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO job_chunks (job_id, idx, detections) VALUES (?, ?, ?)",
+            (job_id, index, json.dumps(detections, ensure_ascii=False)),
+        )
+        done = self._db.execute(
+            "SELECT COUNT(*) FROM job_chunks WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        self._db.execute(
+            "UPDATE jobs SET chunks_done = ?, updated = ? WHERE id = ?", (done, time.time(), job_id)
+        )
+        self._db.commit()
+        return done
+
+    def chunk_results(self, job_id: str) -> dict[int, list[dict]]:
+        rows = self._db.execute(
+            "SELECT idx, detections FROM job_chunks WHERE job_id = ?", (job_id,)
+        )
+        return {row["idx"]: json.loads(row["detections"]) for row in rows}
+
+    def clear_chunks(self, job_id: str) -> None:
+        self._db.execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+        self._db.commit()
+
+    def unfinished(self) -> list[str]:
+        rows = self._db.execute(
+            "SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY created", (DONE, FAILED)
+        )
+        return [row["id"] for row in rows]
+
+    def purge(self, older_than: float) -> list[str | None]:
+        """Delete finished jobs last updated before older_than; return their upload paths."""
+        rows = self._db.execute(
+            "SELECT id, upload_path FROM jobs WHERE status IN (?, ?) AND updated < ?",
+            (DONE, FAILED, older_than),
+        ).fetchall()
+        for row in rows:
+            self._db.execute("DELETE FROM job_chunks WHERE job_id = ?", (row["id"],))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        self._db.commit()
+        return [row["upload_path"] for row in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class JobManager:
+    def __init__(self, directory: str, workers: int, max_attempts: int, retention: float):
+        self.directory = directory
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._store: JobStore | None = None
+        self._queue: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            os.makedirs(self.upload_dir, exist_ok=True)
+            self._store = JobStore(os.path.join(self.directory, "jobs.db"))
+        return self._store
+
+    @property
+    def upload_dir(self) -> str:
+        return os.path.join(self.directory, "uploads")
+
+    def start(self) -> None:
+        """Start the workers and requeue jobs interrupted by a restart."""
+        if self._tasks:
+            return
+        if self.retention > 0:
+            for path in self.store.purge(time.time() - self.retention):
+                if path and os.path.exists(path):
+                    os.unlink(path)
+        self._queue = asyncio.Queue()
+        for job_id in self.store.unfinished():
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _enqueue(self, job_id: str) -> None:
+        if self._tasks:
+            self._queue.put_nowait(job_id)
+        else:
+            self.start()  # queues every unfinished job, this one included
+
+    def submit_text(self, text: str, categories: list[str], strategy: str) -> str:
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, categories, strategy, text=text)
+        self._enqueue(job_id)
+        return job_id
+
+    async def submit_file(self, file: UploadFile, categories: list[str], strategy: str) -> str:
+        """Spool an upload into the job directory and queue it for parsing.
+
+        Raises ValueError for unsupported types and UploadTooLarge.
+        """
+        job_id = uuid.uuid4().hex
+        spooled = await spool_upload(file, settings.MAX_UPLOAD_BYTES)
+        path = os.path.join(self.upload_dir, job_id + os.path.splitext(spooled)[1])
+        shutil.move(spooled, path)
+        self.store.create(job_id, categories, strategy, filename=file.filename, upload_path=path)
+        self._enqueue(job_id)
+        return job_id
+
+    def status(self, job_id: str) -> dict | None:
+        row = self.store.get(job_id)
+        if row is None:
+            return None
+        status = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "filename": row["filename"],
+            "progress": {"chunks_done": row["chunks_done"], "chunks_total": row["chunks_total"]},
+            "error": row["error"],
+        }
+        if row["status"] == DONE:
+            status["result"] = json.loads(row["result"])
+        return status
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                self.store.update(job_id, status=FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def run(self, job_id: str) -> None:
+        store = self.store
+        row = store.get(job_id)
+        if row is None or row["status"] in (DONE, FAILED):
+            return
+
+        text = row["text"]
+        if text is None:
+            store.update(job_id, status=PARSING)
+            try:
+                text = await parse_pool.parse(row["filename"], row["upload_path"])
+            except asyncio.TimeoutError:
+                store.update(job_id, status=FAILED, error="Document parsing timed out")
+                return
+            except ValueError as e:
+                store.update(job_id, status=FAILED, error=str(e))
+                return
+            store.update(job_id, text=text)
+            os.unlink(row["upload_path"])
+
+        from .llm_service import chunk_text, llm_service
+
+        categories = json.loads(row["categories"])
+        chunks = chunk_text(text)
+        if (row["chunk_size"], row["chunk_overlap"]) != (settings.LLM_CHUNK_SIZE, settings.LLM_CHUNK_OVERLAP):
+            # Stored chunks only line up with the chunking they were made with
+            store.clear_chunks(job_id)
+            store.update(job_id, chunks_done=0)
+        store.update(
+            job_id,
+            status=DETECTING,
+            chunk_size=settings.LLM_CHUNK_SIZE,
+            chunk_overlap=settings.LLM_CHUNK_OVERLAP,
+            chunks_total=len(chunks),
+        )
+
+        error = "no attempts left"
+        for attempt in range(row["attempts"], self.max_attempts):
+            store.update(job_id, attempts=attempt + 1)
+            done = store.chunk_results(job_id)
+            error = None
+            with request_context(BULK, None):
+                async for index, _, result in llm_service.detect_pii_stream(text, categories, skip=done):
+                    if "error" in result:
+                        error = result["error"]
+                        continue
+                    store.save_chunk(job_id, index, result["detections"])
+            if error is None:
+                break
+            logger.warning("Job %s attempt %d: %s", job_id, attempt + 1, error)
+        else:
+            store.update(job_id, status=FAILED, error=f"LLM service error: {error}")
+            return
+
+        detections = merge_detections(
+            [det for dets in store.chunk_results(job_id).values() for det in dets]
+        )
+        metrics.count_detections(detections)
+        result = {
+            "masked_text": MaskRenderer(row["strategy"]).render(text, detections),
+            "detections": sorted(detections, key=lambda d: d["start"]),
+        }
+        store.update(job_id, status=DONE, result=json.dumps(result, ensure_ascii=False))
+        store.clear_chunks(job_id)
+
+
+job_manager = JobManager(
+    directory=settings.JOBS_DIR,
+    workers=settings.JOBS_WORKERS,
+    max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    retention=settings.JOBS_RETENTION,
+)
@@ -0,0 +1,328 @@
+"""Route model calls across several OpenAI-compatible backends.
+
+Backends come from LLM_BACKENDS (a JSON list) or, if unset, the single
+LLM_API_BASE / LLM_MODEL pair. Each call goes to the healthy primary
+backend with the lowest load score; "overflow" backends (e.g. DashScope
+next to local vLLM replicas) are used only while every primary is at its
+max_inflight. Failing backends are taken out of rotation by a circuit
+breaker and a periodic health check, failed calls are retried on another
+backend, and optional hedging sends a second copy of a call that runs
+longer than its backend's p95 latency.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any
+
+import httpx
+from openai import AsyncOpenAI
+
+from . import metrics
+from .config import settings
+from .prompts import mark_prefix_cacheable
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+def create_async_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """Build an AsyncOpenAI client backed by a pooled keep-alive httpx client."""
+    timeout = httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_POOL_SIZE,
+            max_keepalive_connections=settings.LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=timeout,
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+class LLMBackend:
+    """One model endpoint with its load, latency and circuit-breaker state."""
+
+    def __init__(
+        self,
+        name: str,
+        client: Any,
+        model: str,
+        mode: str = "local",
+        max_inflight: int = 8,
+        role: str = "primary",
+        structured_output: str = "off",
+    ):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.mode = mode
+        self.max_inflight = max(1, max_inflight)
+        self.role = role
+        if structured_output == "auto":
+            # DashScope only offers JSON mode; vLLM enforces the full schema
+            structured_output = "json_object" if mode == "cloud" else "json_schema"
+        self.structured_output = structured_output
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.ewma_latency = 0.0
+        self._latencies: deque[float] = deque(maxlen=200)
+
+    def available(self, now: float) -> bool:
+        """Healthy and not tripped.
+
+        Once the cooldown of a tripped circuit ends it is half-open: one
+        trial call is let through and other calls are kept away until it
+        succeeds (closing the circuit) or fails (tripping it again).
+        """
+        if not self.healthy or now < self.open_until:
+            return False
+        return not (self.open_until and self.probing)
+
+    @property
+    def saturated(self) -> bool:
+        return self.outstanding >= self.max_inflight
+
+    def record_success(self, latency: float) -> None:
+        self.failures = 0
+        self.open_until = 0.0
+        self._latencies.append(latency)
+        self.ewma_latency = latency if not self.ewma_latency else 0.8 * self.ewma_latency + 0.2 * latency
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= settings.LLM_CIRCUIT_FAILURES:
+            self.open_until = time.monotonic() + settings.LLM_CIRCUIT_COOLDOWN
+            logger.warning("LLM backend %s: circuit open after %d failures", self.name, self.failures)
+
+    def p95_latency(self) -> float | None:
+        if len(self._latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def request_params(self, schema: dict | None) -> dict:
+        """Backend-specific completion parameters, including structured output."""
+        params: dict = {}
+        extra_body: dict = {}
+        if self.mode == "cloud":
+            extra_body["enable_thinking"] = False
+        if schema is not None:
+            if self.structured_output == "json_object":
+                params["response_format"] = {"type": "json_object"}
+            elif self.structured_output == "json_schema":
+                params["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": "detections", "schema": schema},
+                }
+            elif self.structured_output == "guided_json":
+                # Older vLLM releases without response_format json_schema
+                extra_body["guided_json"] = schema
+        if extra_body:
+            params["extra_body"] = extra_body
+        return params
+
+    def prepare_messages(self, messages: list[dict]) -> list[dict]:
+        if self.mode == "cloud" and settings.LLM_CONTEXT_CACHING:
+            return mark_prefix_cacheable(messages)
+        return messages
+
+
+def load_backends() -> list[LLMBackend]:
+    """Create backends from LLM_BACKENDS, falling back to the single-backend settings."""
+    if not settings.LLM_BACKENDS.strip():
+        # For local vLLM, use dummy API key to avoid Bearer header issues
+        api_key = settings.LLM_API_KEY if settings.LLM_API_KEY else "sk-dummy-key-for-local"
+        return [LLMBackend(
+            name="default",
+            client=create_async_client(settings.LLM_API_BASE, api_key),
+            model=settings.LLM_MODEL,
+            mode=settings.LLM_MODE,
+            max_inflight=settings.LLM_MAX_CONCURRENCY,
+            structured_output=settings.LLM_STRUCTURED_OUTPUT,
+        )]
+
+    return parse_backends(settings.LLM_BACKENDS)
+
+
+def parse_backends(spec_json: str) -> list[LLMBackend]:
+    """Create backends from a JSON list in the LLM_BACKENDS format."""
+    backends = []
+    for i, spec in enumerate(json.loads(spec_json)):
+        backends.append(LLMBackend(
+            name=spec.get("name", f"backend-{i}"),
+            client=create_async_client(spec["base_url"], spec.get("api_key") or "sk-dummy-key-for-local"),
+            model=spec.get("model", settings.LLM_MODEL),
+            mode=spec.get("mode", "local"),
+            max_inflight=int(spec.get("max_inflight", 8)),
+            role=spec.get("role", "primary"),
+            structured_output=spec.get("structured_output", settings.LLM_STRUCTURED_OUTPUT),
+        ))
+    if not backends:
+        raise ValueError("A backend list must contain at least one backend")
+    return backends
+
+
+class LLMRouter:
+    def __init__(self, backends: list[LLMBackend], strategy: str = "least_outstanding"):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.strategy = strategy
+        self._health_task: asyncio.Task | None = None
+
+    @property
+    def primary(self) -> LLMBackend:
+        return self.backends[0]
+
+    def _score(self, backend: LLMBackend) -> tuple[float, float]:
+        if self.strategy == "latency":
+            return ((backend.outstanding + 1) * (backend.ewma_latency or 1.0), backend.outstanding)
+        return (backend.outstanding / backend.max_inflight, backend.ewma_latency)
+
+    @staticmethod
+    def _claim(backend: LLMBackend) -> LLMBackend:
+        # The first call after a circuit's cooldown is its half-open trial
+        if backend.open_until:
+            backend.probing = True
+        return backend
+
+    def pick(self, exclude: set[str] | None = None) -> LLMBackend | None:
+        """Choose a backend for the next call, or None if none is usable."""
+        exclude = exclude or set()
+        now = time.monotonic()
+        usable = [b for b in self.backends if b.name not in exclude and b.available(now)]
+        primaries = [b for b in usable if b.role != "overflow"]
+
+        free = [b for b in primaries if not b.saturated]
+        if free:
+            return self._claim(min(free, key=self._score))
+        # Spill over to cloud only while every local backend is saturated
+        overflow = [b for b in usable if b.role == "overflow" and not b.saturated]
+        if overflow:
+            return self._claim(min(overflow, key=self._score))
+        candidates = primaries or usable
+        return self._claim(min(candidates, key=self._score)) if candidates else None
+
+    async def _call(self, backend: LLMBackend, messages: list[dict], schema: dict | None, params: dict):
+        backend.outstanding += 1
+        started = time.monotonic()
+        try:
+            response = await backend.client.chat.completions.create(
+                model=backend.model,
+                messages=backend.prepare_messages(messages),
+                **params,
+                **backend.request_params(schema),
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.record_failure()
+            metrics.LLM_ERRORS.inc(backend.name)
+            raise
+        finally:
+            backend.outstanding -= 1
+            backend.probing = False
+        elapsed = time.monotonic() - started
+        backend.record_success(elapsed)
+        metrics.LLM_LATENCY.observe(elapsed, backend.name)
+        metrics.record_stage("llm", elapsed)
+        return response
+
+    async def _hedged(
+        self, backend: LLMBackend, tried: set[str], messages: list[dict], schema: dict | None, params: dict
+    ):
+        first = asyncio.ensure_future(self._call(backend, messages, schema, params))
+        delay = backend.p95_latency() if settings.LLM_HEDGE_ENABLED else None
+        if delay is None:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        backup = self.pick(exclude=tried)
+        if backup is None:
+            return await first
+
+        tried.add(backup.name)
+        logger.info("Hedging call on %s after %.2fs on %s", backup.name, delay, backend.name)
+        tasks = {first, asyncio.ensure_future(self._call(backup, messages, schema, params))}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            raise first.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def complete(self, messages: list[dict], schema: dict | None = None, **params):
+        """Run one chat completion, failing over to other backends on errors.
+
+        schema is the JSON schema of the expected reply; each backend turns
+        it into its own structured-output parameters, if enabled.
+        """
+        tried: set[str] = set()
+        last_error: Exception | None = None
+        for _ in range(settings.LLM_FAILOVER_ATTEMPTS + 1):
+            backend = self.pick(exclude=tried)
+            if backend is None:
+                break
+            tried.add(backend.name)
+            try:
+                return await self._hedged(backend, tried, messages, schema, params)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("LLM backend %s failed: %s", backend.name, e)
+                last_error = e
+        if last_error is not None:
+            raise last_error
+        raise NoBackendAvailable("No healthy LLM backend available")
+
+    async def check_health(self) -> None:
+        for backend in self.backends:
+            try:
+                await asyncio.wait_for(backend.client.models.list(), settings.LLM_CONNECT_TIMEOUT)
+                if not backend.healthy:
+                    logger.info("LLM backend %s is healthy again", backend.name)
+                backend.healthy = True
+            except Exception as e:
+                if backend.healthy:
+                    logger.warning("LLM backend %s failed health check: %s", backend.name, e)
+                backend.healthy = False
+
+    async def _health_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health()
+
+    def start_health_checks(self) -> None:
+        """Start periodic health checks; a no-op for a single backend."""
+        interval = settings.LLM_HEALTH_CHECK_INTERVAL
+        if interval > 0 and len(self.backends) > 1 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(interval))
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for backend in self.backends:
+            await backend.client.close()
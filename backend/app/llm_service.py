@@ -1,14 +1,44 @@
+import asyncio
+import bisect
 import json
 import re
 import logging
-from openai import OpenAI
+import time
+from typing import AsyncIterator, Collection
+
+from .aho_corasick import AhoCorasick, on_word_boundaries
+from .chunker import TextChunk, merge_detections, split_lines, split_text
+from . import metrics, prefilter
 from .config import settings
+from .detection_cache import DetectionCache, make_cache_key
+from .entity_dictionary import EntityDictionary, replace_known
+from .llm_router import LLMRouter, load_backends, parse_backends
+from .pii_rules import detect_rules, rule_categories
+from .prompts import (
+    DETECTIONS_SCHEMA,
+    build_batch_instructions,
+    build_messages,
+    build_repair_messages,
+    get_output_format,
+)
+from .scheduler import BULK, INTERACTIVE, PRIORITY_NAMES, LLMScheduler, SchedulerError, current_request
+from .span_resolver import resolve_spans
 
 logger = logging.getLogger(__name__)
 
+# Separates records packed into one batch prompt
+BATCH_ITEM_MARKER = "### ITEM {}"
+
+CASCADE_TRIGGERS = frozenset({"anchors", "rules", "parse_failure"})
+
 
 def extract_json_from_text(text: str) -> dict | None:
     """Try multiple strategies to extract JSON from LLM response text."""
+    return _extract_json(text)[0]
+
+
+def _extract_json(text: str) -> tuple[dict | None, str]:
+    """extract_json_from_text, also returning the name of the strategy that worked."""
     text = text.strip()
 
     # Strategy 1: Remove <think>...</think> blocks
@@ -16,7 +46,7 @@ def extract_json_from_text(text: str) -> dict | None:
 
     # Strategy 2: Direct JSON parse
     try:
-        return json.loads(text)
+        return json.loads(text), "direct"
     except json.JSONDecodeError:
         pass
 
@@ -24,7 +54,7 @@ def extract_json_from_text(text: str) -> dict | None:
     code_block_match = re.search(r"```(?:json)?\s*\n?(.*?)\n?```", text, re.DOTALL)
     if code_block_match:
         try:
-            return json.loads(code_block_match.group(1).strip())
+            return json.loads(code_block_match.group(1).strip()), "code_block"
         except json.JSONDecodeError:
             pass
 
@@ -32,7 +62,7 @@ def extract_json_from_text(text: str) -> dict | None:
     json_match = re.search(r'\{[^{}]*"detections"\s*:\s*\[.*?\]\s*\}', text, re.DOTALL)
     if json_match:
         try:
-            return json.loads(json_match.group(0))
+            return json.loads(json_match.group(0)), "detections_object"
         except json.JSONDecodeError:
             pass
 
@@ -41,230 +71,650 @@ def extract_json_from_text(text: str) -> dict | None:
         try:
             parsed = json.loads(match.group(0))
             if "detections" in parsed:
-                return parsed
+                return parsed, "any_object"
         except json.JSONDecodeError:
             continue
 
-    return None
+    return None, "failed"
+
+
+def parse_detections_json(content: str) -> dict | None:
+    """Parse a model reply, trying a single json.loads first.
+
+    Structured-output replies are bare JSON documents and take the fast
+    path; anything else falls back to extract_json_from_text.
+    """
+    try:
+        result, strategy = json.loads(content), "fast"
+    except json.JSONDecodeError:
+        result, strategy = _extract_json(content)
+    if not isinstance(result, dict):
+        result, strategy = None, "failed"
+    metrics.REPLY_PARSE.inc(strategy)
+    return result
+
+
+def parse_compact_detections(content: str, categories: list[str]) -> list[dict] | None:
+    """Parse CODE|TEXT lines (n|CODE|TEXT in packed batches) into detections.
+
+    CODE is the 1-based position in categories; a category name is accepted
+    too. Lines that do not follow the format are skipped, but a non-empty
+    reply without a single valid line returns None: the model answered in
+    some other format, not "no PII".
+    """
+    if "</think>" in content:
+        content = content.rsplit("</think>", 1)[1]
+    by_name = {category.lower(): category for category in categories}
+    detections = []
+    for line in content.splitlines():
+        parts = line.strip().split("|", 2)
+        item = None
+        if len(parts) == 3 and parts[0].isdigit() and parts[1].strip().isdigit():
+            item = int(parts[0])
+            parts = parts[1:]
+        else:
+            parts = line.strip().split("|", 1)
+        if len(parts) != 2 or not parts[1]:
+            continue
+        code, original = parts[0].strip(), parts[1]
+        if code.isdigit() and 1 <= int(code) <= len(categories):
+            det_type = categories[int(code) - 1]
+        elif code.lower() in by_name:
+            det_type = by_name[code.lower()]
+        else:
+            continue
+        detection = {"type": det_type, "original": original}
+        if item is not None:
+            detection["item"] = item
+        detections.append(detection)
+    if not detections and content.strip():
+        metrics.REPLY_PARSE.inc("failed")
+        return None
+    metrics.REPLY_PARSE.inc("compact")
+    return detections
+
+
+def chunk_text(text: str) -> list[TextChunk]:
+    """Split text into the chunks detect_pii_stream sends to the model."""
+    return split_text(text, settings.LLM_CHUNK_SIZE, settings.LLM_CHUNK_OVERLAP)
 
 
 class LLMService:
     """Unified LLM service supporting both local vLLM and cloud DashScope API."""
 
     def __init__(self):
-        # For local vLLM, use dummy API key to avoid Bearer header issues
-        api_key = settings.LLM_API_KEY if settings.LLM_API_KEY else "sk-dummy-key-for-local"
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=settings.LLM_API_BASE,
+        # Every model call goes through the router, even with one backend
+        self.router = LLMRouter(load_backends(), settings.LLM_ROUTING_STRATEGY)
+        # Larger model for chunks the primary model is uncertain about
+        self.cascade_router = None
+        self.cascade_policy = frozenset(
+            p.strip() for p in settings.LLM_CASCADE_POLICY.split(",") if p.strip()
         )
-        self.model = settings.LLM_MODEL
-        self.mode = settings.LLM_MODE
+        if self.cascade_policy - CASCADE_TRIGGERS:
+            raise ValueError(f"Unknown LLM_CASCADE_POLICY triggers: {sorted(self.cascade_policy - CASCADE_TRIGGERS)}")
+        self.cascade_anchors = AhoCorasick(
+            [a.strip().lower() for a in settings.LLM_CASCADE_ANCHORS.split(",") if a.strip()]
+        )
+        if settings.LLM_CASCADE_BACKENDS.strip():
+            self.cascade_router = LLMRouter(
+                parse_backends(settings.LLM_CASCADE_BACKENDS), settings.LLM_ROUTING_STRATEGY
+            )
+        # Fails fast on unknown versions
+        self.output_format = get_output_format(settings.LLM_PROMPT_VERSION)
+        self.prompt_version = settings.LLM_PROMPT_VERSION
+        # Caps and orders in-flight completions per worker
+        self.scheduler = LLMScheduler(
+            settings.LLM_MAX_CONCURRENCY,
+            {INTERACTIVE: settings.LLM_QUEUE_MAX_INTERACTIVE, BULK: settings.LLM_QUEUE_MAX_BULK},
+        )
+        self.cache = None
+        if settings.DETECTION_CACHE_SIZE > 0:
+            self.cache = DetectionCache(
+                max_entries=settings.DETECTION_CACHE_SIZE,
+                ttl=settings.DETECTION_CACHE_TTL,
+                path=settings.DETECTION_CACHE_PATH,
+                max_rows=settings.DETECTION_CACHE_MAX_ROWS,
+            )
+        self.entities = None
+        if settings.ENTITY_DICT_PATH:
+            self.entities = EntityDictionary(settings.ENTITY_DICT_PATH, settings.ENTITY_DICT_MIN_LENGTH)
+
+    @property
+    def client(self):
+        return self.router.primary.client
+
+    @property
+    def model(self) -> str:
+        return self.router.primary.model
+
+    @property
+    def mode(self) -> str:
+        return self.router.primary.mode
+
+    def start_health_checks(self) -> None:
+        self.router.start_health_checks()
+        if self.cascade_router is not None:
+            self.cascade_router.start_health_checks()
+
+    async def aclose(self) -> None:
+        """Stop health checks and release pooled connections of every backend."""
+        await self.router.aclose()
+        if self.cascade_router is not None:
+            await self.cascade_router.aclose()
+
+    async def detect_pii(self, text: str, categories: list[str], tenant: str | None = None) -> dict:
+        """Detect PII in text using rules and/or the LLM, per DETECTION_MODE.
 
-    async def detect_pii(self, text: str, categories: list[str]) -> dict:
-        """Detect PII in text using Qwen3-0.6B.
+        With a tenant and the entity dictionary enabled, the tenant's known
+        entities are matched first and replaced by placeholders in the text
+        sent to the model, and new detections are learned.
 
         Returns a dict with 'detections' list of {type, original, start, end}.
         """
-        categories_str = ", ".join(categories)
-
-        system_prompt = """### ROLE
-You are an expert PII (Personally Identifiable Information) Recognition Engine optimized for legal document redaction. Your goal is to achieve 100% recall on sensitive data by combining deep semantic understanding with flexible pattern-matching logic.
-
-### TARGET CATEGORIES
-Detect ONLY the following categories based on user-defined needs:
-{USER_DEFINED_CATEGORIES}
-
-### Common categories
-- Name: Chinese/English names, including titles (e.g., 王经理, 张律师).
-- Phone: Mobile/landline/fax numbers, including variants with spaces, dashes, or Chinese digits.
-- Fax: Fax numbers (传真), often following "传真:", "Fax:", "F:", or appearing alongside phone numbers.
-- Email: Email addresses, including obfuscated formats like "user [at] mail.com" or "user#domain.com".
-- Address: Physical locations, from provinces to specific room numbers or landmarks.
-- ID_Number: 15/18-digit national IDs, including masked versions.
-- Bank_Card: 16-19 digit card numbers or "Bank Name + Last 4 Digits".
-- Social_Media: Account IDs prefixed by platforms (e.g., 微信, 钉钉, 小红书).
-
-### ADVANCED DETECTION LOGIC
-
-1. **Multi-Entity Sequence Detection (CRITICAL for Legal Docs)**:
-   - Legal documents often contain CONSECUTIVE PII entities in contact blocks. EACH entity must be detected SEPARATELY.
-   - Pattern Examples:
-     * "电话: 021-12345678 传真: 021-87654321" → TWO separate detections
-     * "email1@firm.com; email2@firm.com, email3@firm.com" → THREE separate detections
-     * "Tel: 1381234567 / 1391234567 Fax: 021-5555666" → THREE separate detections
-   - Common separators between consecutive entities: ";", ",", "/", "|", "、", spaces, line breaks, Chinese punctuation "；，"
-   - NEVER merge multiple phone numbers or emails into a single detection.
-
-2. **Legal Document Contact Block Recognition**:
-   - Trigger patterns specific to legal docs:
-     * Headers: "联系方式", "通讯地址", "送达地址", "联系人", "代理人信息", "当事人信息"
-     * Law firm blocks: "律师事务所", "律所", "Law Firm", containing clustered contact info
-     * Court/Party blocks: "原告", "被告", "申请人", "被申请人", "第三人" followed by contact details
-   - When a contact block is detected, perform EXHAUSTIVE entity-by-entity extraction.
-
-3. **Multi-Format Normalization**: 
-   - Identify data across all variants: Chinese numerals (e.g., "一三八"), character spacing ("1 3 8"), obfuscated symbols ("138*1234*5678"), and non-standard separators ("(021) 5080-XXXX").
-   - Fax-specific formats: "传真同上", "传真号同电话", "Fax同号" → still flag the reference for human review.
-
-4. **Semantic Anchor Discovery**: 
-   - Use proximity-based detection with EXTENDED anchors for legal context:
-     * Phone anchors: "电话", "Tel", "手机", "Mobile", "联系电话", "办公电话", "T:", "☎"
-     * Fax anchors: "传真", "Fax", "F:", "传真电话"
-     * Email anchors: "邮箱", "Email", "E-mail", "电子邮件", "E:", "✉"
-     * Combined patterns: "电话/传真:", "Tel/Fax:" → expect MULTIPLE entities after anchor
-
-5. **Intelligent Filtering (Anti-Hallucination)**: 
-   - EXCLUDE: pure timestamps (2026-02-10), case numbers (2024民初123号), prices ($100), version numbers (v1.5.0), article/clause references (第123条)
-   - INCLUDE even if ambiguous: any 7-15 digit sequence near contact anchors, any @-containing string near email anchors
-
-6. **Entity Context Integrity**: 
-   - Capture the "Original" string as the COMPLETE but INDIVIDUAL entity.
-   - For labeled sequences: include the immediate label only → "传真: 021-5555666" (not the entire contact block)
-   - For unlabeled sequences in a list: capture just the entity → "email2@firm.com"
-
-### EXTRACTION RULES BY TYPE
-
-- **Phones/Fax (ENHANCED)**:
-  - Capture each 7-15 digit sequence as INDIVIDUAL detection
-  - Include area codes and extensions: "(021) 1234-5678 ext. 800" → one detection
-  - Slash-separated numbers are SEPARATE: "138xxx / 139xxx" → TWO detections
-  - Fax following phone is SEPARATE: "T: 1234567 F: 7654321" → TWO detections
-
-- **Emails (ENHANCED)**:
-  - Capture each email as INDIVIDUAL detection regardless of separator
-  - Valid separators creating new entities: ";", ",", "/", "|", " ", "、", newline
-  - "abc@x.com;def@y.com,ghi@z.com" → THREE separate detections
-  - Include obfuscated: "abc[at]x[dot]com", "abc#x.com", "abc (at) x.com"
-
-- **Names**: Capture full names, nicknames, or "Surname + Title" (e.g., "王律师", "张法官").
-
-- **Bank/ID**: Capture 15-19 digit sequences, especially those with bank names or "尾号" context.
-
-- **Addresses**: Capture complete address strings; if multiple addresses exist, detect EACH separately.
-
-- **Custom Logic**: If a user provides a custom category, treat its description as a high-priority semantic rule.
-
-### DETECTION CHECKLIST (Mental Model)
-Before finalizing output, verify:
-☐ Have I scanned for CONSECUTIVE entities and split them individually?
-☐ Are fax numbers detected SEPARATELY from phone numbers?
-☐ Are semicolon/comma-separated emails detected as MULTIPLE entities?
-☐ Did I check contact blocks for ALL entity types (phone + fax + email + address)?
-
-### OUTPUT CONSTRAINT
-- Response MUST be a single, valid JSON object.
-- NO markdown markers (no ```json). NO introductory text. NO trailing explanations.
-- Each PII entity = ONE object in the array. Consecutive entities = MULTIPLE objects.
-- JSON structure: 
-{"detections": [{"type": "category_name", "original": "EXACT_SUBSTRING"}]}
-
-### EXAMPLE (Consecutive Entities)
-Input: "联系电话: 021-12345678 / 021-87654321 传真: 021-11112222 邮箱: lawyer1@firm.com; lawyer2@firm.com"
-Output: {"detections": [{"type": "Phone", "original": "021-12345678"}, {"type": "Phone", "original": "021-87654321"}, {"type": "Fax", "original": "021-11112222"}, {"type": "Email", "original": "lawyer1@firm.com"}, {"type": "Email", "original": "lawyer2@firm.com"}]}"""
-        user_prompt = (
-            f"Categories to detect: {categories_str}\n\n"
-            f"Text to analyze:\n{text}"
+        known: list[dict] = []
+        placeholders = None
+        if tenant and self.entities is not None:
+            known = self.entities.match(tenant, text, categories)
+            metrics.ENTITY_DICT_MATCHES.inc(amount=len(known))
+            if known and settings.ENTITY_DICT_STRIP:
+                placeholders = replace_known(text, known)
+
+        detections = []
+        errors = []
+        usage = _empty_usage()
+        model_text = placeholders.text if placeholders is not None else text
+        async for _, _, result in self.detect_pii_stream(model_text, categories):
+            detections.extend(result["detections"])
+            _add_usage(usage, result.get("usage"))
+            if "error" in result:
+                errors.append(result["error"])
+        if placeholders is not None:
+            detections = placeholders.map_detections(text, detections)
+        if tenant and self.entities is not None and settings.ENTITY_DICT_LEARN:
+            self.entities.learn(tenant, detections)
+
+        if usage["calls"]:
+            logger.info(
+                "detect_pii: %d calls, %d prompt tokens (%d cached), %d completion tokens, %d escalations",
+                usage["calls"], usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"],
+                usage.get("escalations", 0),
+            )
+        response: dict = {"detections": merge_detections(detections + known), "usage": usage}
+        if errors:
+            response["error"] = errors[0]
+        return response
+
+    async def detect_pii_stream(
+        self, text: str, categories: list[str], skip: Collection[int] = ()
+    ) -> AsyncIterator[tuple[int, TextChunk, dict]]:
+        """Yield (index, chunk, result) for each chunk as soon as it completes.
+
+        Long texts are split into overlapping chunks that are sent to the
+        model concurrently. Detections in each result use offsets in the
+        full text; duplicates across overlapping chunks are left to the
+        caller. Pending chunk requests are cancelled if the consumer stops.
+        Chunks whose index is in skip (already done by a resumed job) are
+        neither run nor yielded.
+
+        DETECTION_MODE decides how the rule engine is used:
+        - "llm": every category goes to the model.
+        - "rules": rule-covered categories (phone, email, id_number,
+          bank_card) are detected by rules only; the model is called for
+          the remaining categories, and not at all if none remain.
+        - "hybrid": the model sees every category and its detections are
+          merged with the rule hits.
+
+        With PREFILTER_THRESHOLD set, chunks the pre-filter scores as
+        PII-free skip the model and carry only their rule hits.
+        """
+        chunks = chunk_text(text)
+
+        use_rules, llm_categories = self._plan_categories(categories)
+        rule_hits: list[list[dict]] = [[] for _ in chunks]
+        if use_rules:
+            # Attribute each rule hit to the last chunk starting at or before it
+            chunk_starts = [chunk.start for chunk in chunks]
+            for det in detect_rules(text, categories):
+                rule_hits[bisect.bisect_right(chunk_starts, det["start"]) - 1].append(det)
+
+        todo = [index for index in range(len(chunks)) if index not in skip]
+        if not llm_categories:
+            for index in todo:
+                yield index, chunks[index], {"detections": rule_hits[index]}
+            return
+
+        limiter = asyncio.Semaphore(settings.LLM_CHUNK_CONCURRENCY)
+
+        async def run(index: int) -> tuple[int, dict]:
+            if prefilter.should_skip(chunks[index].text, llm_categories):
+                return index, {"detections": []}
+            async with limiter:
+                return index, await self._detect_chunk_cached(chunks[index].text, llm_categories)
+
+        tasks = [asyncio.ensure_future(run(index)) for index in todo]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                chunk = chunks[index]
+                response: dict = {
+                    "detections": merge_detections(
+                        _shift(result["detections"], chunk.start) + rule_hits[index]
+                    )
+                }
+                if "error" in result:
+                    response["error"] = result["error"]
+                if "usage" in result:
+                    response["usage"] = result["usage"]
+                yield index, chunk, response
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def detect_pii_batch(
+        self, texts: list[str], categories: list[list[str]]
+    ) -> list[dict]:
+        """Detect PII in many short texts with as few model calls as possible.
+
+        Items sharing the same categories are packed into one prompt, each
+        behind an "### ITEM n" marker, up to LLM_BATCH_PACK_CHARS characters
+        and LLM_BATCH_PACK_ITEMS items per pack. The model tags every
+        detection with its item number, which is used to resolve it back to
+        that item; packs run concurrently. Items longer than a pack go
+        through detect_pii on their own.
+
+        Returns one detect_pii-style result dict per input text.
+        """
+        results: list[dict] = [{"detections": []} for _ in texts]
+        rule_hits: list[list[dict]] = [[] for _ in texts]
+        groups: dict[tuple[str, ...], list[int]] = {}
+        singles = []
+
+        for index, (text, item_categories) in enumerate(zip(texts, categories)):
+            if not text.strip():
+                continue
+            if len(text) > settings.LLM_BATCH_PACK_CHARS:
+                singles.append(index)
+                continue
+            use_rules, llm_categories = self._plan_categories(item_categories)
+            if use_rules:
+                rule_hits[index] = detect_rules(text, item_categories)
+            if not llm_categories or prefilter.should_skip(text, llm_categories):
+                results[index] = {"detections": merge_detections(rule_hits[index])}
+                continue
+            if self.cache is not None:
+                cached = self.cache.get(self._cache_key(text, llm_categories))
+                if cached is not None:
+                    results[index] = {"detections": merge_detections(cached + rule_hits[index])}
+                    continue
+            groups.setdefault(tuple(llm_categories), []).append(index)
+
+        packs = []
+        for group_categories, indices in groups.items():
+            pack: list[int] = []
+            size = 0
+            for index in indices:
+                if pack and (
+                    size + len(texts[index]) > settings.LLM_BATCH_PACK_CHARS
+                    or len(pack) >= settings.LLM_BATCH_PACK_ITEMS
+                ):
+                    packs.append((pack, list(group_categories)))
+                    pack, size = [], 0
+                pack.append(index)
+                size += len(texts[index])
+            if pack:
+                packs.append((pack, list(group_categories)))
+
+        limiter = asyncio.Semaphore(settings.LLM_CHUNK_CONCURRENCY)
+
+        async def run_pack(pack: list[int], pack_categories: list[str]) -> None:
+            if len(pack) == 1:
+                body, instructions = texts[pack[0]], ""
+            else:
+                body = "\n".join(
+                    f"{BATCH_ITEM_MARKER.format(n)}\n{texts[index]}"
+                    for n, index in enumerate(pack, 1)
+                )
+                instructions = build_batch_instructions(
+                    self.prompt_version, BATCH_ITEM_MARKER, len(pack)
+                )
+            async with limiter:
+                result = await self._request_detections(body, pack_categories, instructions)
+            if "error" in result:
+                for index in pack:
+                    results[index] = {
+                        "detections": merge_detections(rule_hits[index]),
+                        "error": result["error"],
+                    }
+                return
+
+            per_item: dict[int, list] = {index: [] for index in pack}
+            for det in result["detections"]:
+                item = det.get("item") if isinstance(det, dict) else None
+                try:
+                    number = int(item)
+                except (TypeError, ValueError):
+                    number = 0
+                if 1 <= number <= len(pack):
+                    per_item[pack[number - 1]].append(det)
+                else:
+                    # Untagged detection: resolve against every item in the pack
+                    for index in pack:
+                        per_item[index].append(det)
+
+            for index in pack:
+                detections = resolve_detections(texts[index], per_item[index])
+                if self.cache is not None:
+                    self.cache.set(self._cache_key(texts[index], pack_categories), detections)
+                results[index] = {"detections": merge_detections(detections + rule_hits[index])}
+
+        async def run_single(index: int) -> None:
+            results[index] = await self.detect_pii(texts[index], categories[index])
+
+        await asyncio.gather(
+            *(run_pack(pack, pack_categories) for pack, pack_categories in packs),
+            *(run_single(index) for index in singles),
         )
-
+        return results
+
+    def _plan_categories(self, categories: list[str]) -> tuple[bool, list[str]]:
+        """Return (run_rules, categories_for_llm) according to DETECTION_MODE."""
+        mode = settings.DETECTION_MODE
+        if mode == "rules":
+            covered = rule_categories(categories)
+            return True, [c for c in categories if c.lower() not in covered]
+        return mode == "hybrid", categories
+
+    def _record_usage(self, usage: dict) -> None:
+        metrics.LLM_PROMPT_TOKENS.observe(usage["prompt_tokens"])
+        metrics.record_prompt_tokens(usage["prompt_tokens"])
+        metrics.LLM_COMPLETION_TOKENS.observe(usage["completion_tokens"])
+        if usage["cached_tokens"]:
+            metrics.LLM_CACHED_TOKENS.inc(amount=usage["cached_tokens"])
+
+    def _cache_key(self, text: str, categories: list[str]) -> str:
+        return make_cache_key(text, categories, self.model, self.prompt_version)
+
+    async def _detect_chunk_cached(self, text: str, categories: list[str]) -> dict:
+        """Detect PII in a chunk, reusing cached detections where possible.
+
+        The whole chunk is looked up first. Otherwise every paragraph of at
+        least DETECTION_CACHE_MIN_PARAGRAPH characters is looked up on its
+        own, so boilerplate repeated across documents hits even when chunk
+        boundaries differ; only the remaining text is sent to the model.
+        Positions in cache entries are relative to the cached text.
+        """
+        if self.cache is None:
+            return await self._detect_chunk(text, categories)
+
+        chunk_key = self._cache_key(text, categories)
+        cached = self.cache.get(chunk_key)
+        if cached is not None:
+            return {"detections": cached}
+
+        min_len = settings.DETECTION_CACHE_MIN_PARAGRAPH
+        paragraphs = [p for p in split_lines(text) if len(p.text.strip()) >= min_len]
+
+        detections = []
+        pending = []  # (start, end) ranges of the chunk still to be detected
+        misses = []
+        pos = 0
+        for para in paragraphs:
+            key = self._cache_key(para.text, categories)
+            hit = self.cache.get(key)
+            if hit is None:
+                misses.append((para, key))
+                continue
+            detections.extend(_shift(hit, para.start))
+            if text[pos:para.start].strip():
+                pending.append((pos, para.start))
+            pos = para.end
+        if text[pos:].strip():
+            pending.append((pos, len(text)))
+
+        error = None
+        usage = None
+        if pending:
+            # Concatenate the uncached ranges and map results back to the chunk
+            residual_parts = []
+            offsets = []  # (residual_start, chunk_start, length)
+            residual_len = 0
+            for start, end in pending:
+                offsets.append((residual_len, start, end - start))
+                residual_parts.append(text[start:end])
+                residual_len += end - start + 1
+            result = await self._detect_chunk("\n".join(residual_parts), categories)
+            error = result.get("error")
+            usage = result.get("usage")
+
+            residual_starts = [o[0] for o in offsets]
+            for det in result["detections"]:
+                res_start, chunk_start, length = offsets[
+                    bisect.bisect_right(residual_starts, det["start"]) - 1
+                ]
+                if det["end"] > res_start + length:
+                    continue
+                shift = chunk_start - res_start
+                detections.append({**det, "start": det["start"] + shift, "end": det["end"] + shift})
+
+        response: dict = {"detections": detections}
+        if usage:
+            response["usage"] = usage
+        if error:
+            response["error"] = error
+            return response
+
+        for para, key in misses:
+            self.cache.set(key, [
+                {**d, "start": d["start"] - para.start, "end": d["end"] - para.start}
+                for d in detections
+                if para.start <= d["start"] and d["end"] <= para.end
+            ])
+        self.cache.set(chunk_key, detections)
+        return response
+
+    async def _detect_chunk(self, text: str, categories: list[str]) -> dict:
+        """Run a single model call over text and resolve detection positions.
+
+        With a cascade configured, a chunk the primary model is uncertain
+        about is sent to the cascade model as well, and the detections of
+        both are merged; usage then counts one escalation.
+        """
+        result = await self._request_detections(text, categories)
+        detections = [] if "error" in result else resolve_detections(text, result["detections"])
+
+        reason = None
+        if self.cascade_router is not None:
+            reason = self._escalation_reason(text, categories, result, detections)
+        if reason is not None:
+            metrics.LLM_ESCALATIONS.inc(reason)
+            escalated = await self._request_detections(text, categories, router=self.cascade_router)
+            usage = _empty_usage()
+            _add_usage(usage, result.get("usage"))
+            _add_usage(usage, escalated.get("usage"))
+            usage["escalations"] = 1
+            if "error" not in escalated:
+                detections = merge_detections(detections + resolve_detections(text, escalated["detections"]))
+                return {"detections": detections, "usage": usage}
+            result = {**result, "usage": usage}
+
+        if "error" in result:
+            return result
+        return {"detections": detections, "usage": result["usage"]}
+
+    def _escalation_reason(
+        self, text: str, categories: list[str], result: dict, detections: list[dict]
+    ) -> str | None:
+        """Return the cascade trigger a primary model result hits, if any.
+
+        Latin anchors only count as whole words ("tel" is not in "hotel").
+        The rules trigger compares the model with rule hits for the
+        categories it was asked about, so it never fires for rule-covered
+        categories in DETECTION_MODE=rules, where the model skips them.
+        """
+        policy = self.cascade_policy
+        if "error" in result:
+            return "parse_failure" if "parse_failure" in policy else None
+
+        if "rules" in policy:
+            rule_hits = detect_rules(text, categories)
+            if rule_hits:
+                found = sum(
+                    any(d["start"] < hit["end"] and hit["start"] < d["end"] for d in detections)
+                    for hit in rule_hits
+                )
+                if found < settings.LLM_CASCADE_MIN_RULE_AGREEMENT * len(rule_hits):
+                    return "rules"
+
+        if "anchors" in policy:
+            window = settings.LLM_CASCADE_ANCHOR_WINDOW
+            starts = sorted(d["start"] for d in detections)
+            lowered = text.lower()
+            for start, end, _ in self.cascade_anchors.iter_matches(lowered):
+                if not on_word_boundaries(lowered, start, end):
+                    continue
+                index = bisect.bisect_left(starts, end)
+                if index == len(starts) or starts[index] > end + window:
+                    return "anchors"
+        return None
+
+    async def _request_detections(
+        self,
+        text: str,
+        categories: list[str],
+        instructions: str = "",
+        router: LLMRouter | None = None,
+    ) -> dict:
+        """Call the model on text and return its parsed, unresolved detections.
+
+        `instructions` is appended to the category line of the user prompt;
+        `router` defaults to the primary router.
+        A reply that is not valid JSON (or, for compact prompts, has no
+        valid CODE|TEXT line) is retried with a repair prompt up to
+        LLM_JSON_REPAIR_ATTEMPTS times.
+        """
         try:
-            extra_params: dict = {}
-            if self.mode == "cloud":
-                extra_params["extra_body"] = {
-                    "enable_thinking": False,
+            messages = build_messages(self.prompt_version, text, categories, instructions)
+            usage = _empty_usage()
+            request_messages = messages
+            priority = PRIORITY_NAMES.get(current_request().priority, "other")
+            for _ in range(settings.LLM_JSON_REPAIR_ATTEMPTS + 1):
+                queued = time.perf_counter()
+                async with self.scheduler.slot():
+                    waited = time.perf_counter() - queued
+                    metrics.LLM_QUEUE_WAIT.observe(waited, priority)
+                    metrics.record_stage("llm_queue", waited)
+                    response = await (router or self.router).complete(
+                        request_messages,
+                        schema=DETECTIONS_SCHEMA if self.output_format == "json" else None,
+                        temperature=0,
+                        top_p=0.1,
+                        max_tokens=4000,  # 适配qwen3-4b的32K上下文长度
+                    )
+
+                content = response.choices[0].message.content or ""
+                logger.info("LLM raw response: %s", content[:500])
+                call_usage = _usage_of(response)
+                self._record_usage(call_usage)
+                _add_usage(usage, call_usage)
+
+                if self.output_format == "compact":
+                    detections = parse_compact_detections(content, categories)
+                    result = None if detections is None else {"detections": detections}
+                else:
+                    result = parse_detections_json(content)
+                if result is not None:
+                    break
+                logger.warning("Failed to parse reply: %s", content[:500])
+                request_messages = build_repair_messages(messages, content, self.output_format)
+            else:
+                return {
+                    "detections": [],
+                    "error": "Failed to parse LLM response as JSON",
+                    "usage": usage,
                 }
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0,
-                top_p=0.1,
-                max_tokens=4000,  # 适配qwen3-4b的32K上下文长度
-                **extra_params,
-            )
+            detections = result.get("detections", [])
+            if not isinstance(detections, list):
+                detections = []
+            return {"detections": detections, "usage": usage}
 
-            content = response.choices[0].message.content or ""
-            logger.info("LLM raw response: %s", content[:500])
+        except SchedulerError:
+            raise
+        except Exception as e:
+            logger.exception("LLM service error")
+            return {"detections": [], "error": str(e)}
 
-            result = extract_json_from_text(content)
 
-            if result is None:
-                logger.warning("Failed to parse JSON from: %s", content[:500])
-                return {"detections": [], "error": "Failed to parse LLM response as JSON"}
+def resolve_detections(text: str, raw_detections: list) -> list[dict]:
+    """Turn model {type, original} pairs into positioned detections in text.
 
-            # Validate and fix positions by finding all occurrences of each entity in text
-            detections = []
-            processed_entities = set()  # Track processed (original_text, type) pairs to avoid duplicates
-            
-            for det in result.get("detections", []):
-                original = det.get("original", "")
-                det_type = det.get("type", "unknown")
+    Every occurrence of each distinct (original, type) pair is reported.
+    """
+    entities = []
+    processed_entities = set()  # Track processed (original_text, type) pairs to avoid duplicates
 
-                if not original:
-                    continue
+    for det in raw_detections:
+        if not isinstance(det, dict):
+            continue
+        original = det.get("original", "")
+        det_type = det.get("type", "unknown")
 
-                # Create a unique key for this entity to track processing
-                entity_key = (original, det_type)
-                
-                # Skip if we've already processed this exact entity
-                if entity_key in processed_entities:
-                    continue
-                
-                processed_entities.add(entity_key)
-                
-                # Find ALL occurrences of this entity in the text
-                positions = self._find_all_occurrences(text, original)
-                
-                # Add detection for each occurrence
-                for start, end, actual_text in positions:
-                    detections.append({
-                        "type": det_type,
-                        "original": actual_text,
-                        "start": start,
-                        "end": end,
-                    })
-
-            return {"detections": detections}
+        if not original or not isinstance(original, str):
+            continue
 
-        except Exception as e:
-            logger.exception("LLM service error")
-            return {"detections": [], "error": str(e)}
+        entity_key = (original, det_type)
+        if entity_key in processed_entities:
+            continue
+        processed_entities.add(entity_key)
+        entities.append(entity_key)
 
+    # Resolve ALL occurrences of every entity in a single pass
+    with metrics.timed(metrics.SPAN_RESOLUTION_SECONDS, stage="resolve"):
+        spans = resolve_spans(text, [original for original, _ in entities])
 
-    def _find_all_occurrences(self, text: str, original: str) -> list[tuple[int, int, str]]:
-        """Find all occurrences of original text in the input text.
-        
-        Returns list of tuples: (start_pos, end_pos, actual_matched_text)
-        """
-        positions = []
-        start_pos = 0
-        
-        # First try exact match
-        while start_pos < len(text):
-            pos = text.find(original, start_pos)
-            if pos == -1:
-                break
-            positions.append((pos, pos + len(original), original))
-            start_pos = pos + 1
-        
-        # If no exact matches found, try case-insensitive search
-        if not positions:
-            text_lower = text.lower()
-            original_lower = original.lower()
-            start_pos = 0
-            
-            while start_pos < len(text):
-                pos = text_lower.find(original_lower, start_pos)
-                if pos == -1:
-                    break
-                actual_text = text[pos:pos + len(original)]
-                positions.append((pos, pos + len(original), actual_text))
-                start_pos = pos + 1
-        
-        return positions
+    detections = []
+    for original, det_type in entities:
+        for start, end, actual_text in spans[original]:
+            detections.append({
+                "type": det_type,
+                "original": actual_text,
+                "start": start,
+                "end": end,
+            })
+    return detections
+
+
+def _empty_usage() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def _add_usage(total: dict, usage: dict | None) -> None:
+    if usage:
+        for key, value in usage.items():
+            total[key] = total.get(key, 0) + value
+
+
+def _token_count(value) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def _usage_of(response) -> dict:
+    """Extract token usage from a completion, including prefix-cache hits."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "calls": 1,
+        "prompt_tokens": _token_count(getattr(usage, "prompt_tokens", 0)),
+        "cached_tokens": _token_count(getattr(details, "cached_tokens", 0)),
+        "completion_tokens": _token_count(getattr(usage, "completion_tokens", 0)),
+    }
+
+
+def _shift(detections: list[dict], offset: int) -> list[dict]:
+    return [
+        {**d, "start": d["start"] + offset, "end": d["end"] + offset}
+        for d in detections
+    ]
 
 
 llm_service = LLMService()
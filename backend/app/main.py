@@ -1,13 +1,56 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import hmac
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Literal, TypeVar
+from urllib.parse import quote
+
+from fastapi import Depends, FastAPI, UploadFile, File, Form, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+from . import metrics
+from .config import settings
+from .document_parser import file_extension
+from .jobs import job_manager
+from .masking import MaskRenderer, MaskStrategy, check_strategy, render_masked_text
+from .parse_pool import UploadTooLarge, parse_pool, spool_upload
+from .redaction import REDACTABLE_EXTENSIONS, extract_redactable, is_redactable, plan_edits, write_docx
+from .scheduler import BULK, INTERACTIVE, QueueFull, SchedulerError, request_context
+from .tabular import TABLE_EXTENSIONS, TableMaskError, is_table, mask_table
+
+T = TypeVar("T")
+
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Content types of masked files returned by /api/mask/file
+MEDIA_TYPES = {
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from .llm_service import llm_service
+
+    llm_service.start_health_checks()
+    job_manager.start()
+    yield
+    await job_manager.stop()
+    parse_pool.shutdown()
+    await llm_service.aclose()
 
-from .document_parser import parse_document
 
 app = FastAPI(
     title="Alta-Lex PII Shield",
     description="PII Masking API powered by Qwen3-0.6B",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -18,14 +61,26 @@ app.add_middleware(
     allow_headers=["*"],
     allow_origin_regex=r'https://.*',  # 允许HTTPS正则匹配
 )
+app.add_middleware(metrics.ServerTimingMiddleware)
+app.add_middleware(metrics.RequestTokensMiddleware)
+
+
+DEFAULT_CATEGORIES = [
+    "name", "phone", "email", "address",
+    "id_number", "bank_card", "social_media",
+]
 
 
 class MaskRequest(BaseModel):
     text: str
-    categories: list[str] = [
-        "name", "phone", "email", "address",
-        "id_number", "bank_card", "social_media",
-    ]
+    categories: list[str] = DEFAULT_CATEGORIES
+    strategy: MaskStrategy = "block"
+    tenant: str | None = None  # entity dictionary to match and learn into
+
+
+class BatchMaskItem(BaseModel):
+    text: str
+    categories: list[str] | None = None  # falls back to the batch categories
 
 
 class Detection(BaseModel):
@@ -40,50 +95,192 @@ class MaskResponse(BaseModel):
     detections: list[Detection]
 
 
+class BatchMaskRequest(BaseModel):
+    items: list[BatchMaskItem]
+    categories: list[str] = DEFAULT_CATEGORIES
+    strategy: MaskStrategy = "block"
+
+
+class BatchMaskResult(BaseModel):
+    # None for a failed item, whose text may still hold PII
+    masked_text: str | None
+    detections: list[Detection]
+    error: str | None = None
+
+
+class BatchMaskResponse(BaseModel):
+    results: list[BatchMaskResult]
+
+
+class KnownEntity(BaseModel):
+    type: str
+    value: str
+
+
+class EntitiesRequest(BaseModel):
+    entities: list[KnownEntity]
+
+
+class EntitiesResponse(BaseModel):
+    tenant: str
+    entities: list[KnownEntity]
+
+
+class JobProgress(BaseModel):
+    chunks_done: int
+    chunks_total: int
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    filename: str | None = None
+    progress: JobProgress | None = None
+    error: str | None = None
+    result: MaskResponse | None = None
+
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "service": "Alta-Lex PII Shield"}
 
 
-@app.post("/api/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def spool_checked_upload(file: UploadFile) -> tuple[str, str]:
+    """Validate an upload and spool it to disk; return (extension, path).
+
+    Raises HTTPException for missing names, unsupported types (400) and
+    oversized files (413).
+    """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
 
-    content = await file.read()
+    try:
+        ext = file_extension(file.filename)
+    except ValueError as e:
+        metrics.PARSE_FAILURES.inc("other", "unsupported")
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        path = await spool_upload(file, settings.MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        metrics.PARSE_FAILURES.inc(ext, "too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    metrics.PARSE_BYTES.observe(os.path.getsize(path), ext)
+    return ext, path
 
+
+async def _parse_spooled(filename: str, ext: str, path: str, parse: Callable[[str, str], Awaitable[T]]) -> T:
+    """Run a parse_pool parse/extract on a spooled upload.
+
+    Raises HTTPException for invalid documents (400) and parse timeouts (504).
+    """
     try:
-        text = parse_document(file.filename, content)
+        with metrics.timed(metrics.PARSE_SECONDS, ext, stage="parse"):
+            return await parse(filename, path)
     except ValueError as e:
+        metrics.PARSE_FAILURES.inc(ext, "invalid")
         raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        metrics.PARSE_FAILURES.inc(ext, "timeout")
+        raise HTTPException(status_code=504, detail="Document parsing timed out")
+
+
+async def parse_upload(file: UploadFile) -> str:
+    """Spool an upload to disk and parse it in the parse pool.
+
+    Raises HTTPException as spool_checked_upload and _parse_spooled.
+    """
+    ext, path = await spool_checked_upload(file)
+    try:
+        return await _parse_spooled(file.filename, ext, path, parse_pool.parse)
+    finally:
+        os.unlink(path)
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+
+@app.post("/api/upload")
+async def upload_document(file: UploadFile = File(...)):
+    text = await parse_upload(file)
     return {"text": text}
 
 
-@app.post("/api/mask", response_model=MaskResponse)
-async def mask_pii(request: MaskRequest):
-    if not request.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty")
+def _scheduler_http_error(e: SchedulerError) -> HTTPException:
+    return HTTPException(
+        status_code=429 if isinstance(e, QueueFull) else 503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
+
+def _check_strategy(strategy: MaskStrategy) -> None:
+    try:
+        check_strategy(strategy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _text_priority(text: str) -> int:
+    return INTERACTIVE if len(text) <= settings.LLM_INTERACTIVE_MAX_CHARS else BULK
+
+
+async def run_scheduled(http_request: Request, priority: int, work: Awaitable[T]) -> T:
+    """Run model work for one HTTP request through the LLM scheduler.
+
+    Refuses the request with 429 if the queue for its priority is full,
+    applies LLM_REQUEST_DEADLINE to queued calls (503 when exceeded) and
+    cancels the work, dropping its queued calls, if the client disconnects.
+    """
+    from .llm_service import llm_service
+
+    try:
+        llm_service.scheduler.admit(priority)
+    except SchedulerError as e:
+        work.close()
+        raise _scheduler_http_error(e)
+
+    with request_context(priority, settings.LLM_REQUEST_DEADLINE):
+        task = asyncio.ensure_future(work)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+        return task.result()
+    except SchedulerError as e:
+        raise _scheduler_http_error(e)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _mask_text(
+    text: str,
+    categories: list[str],
+    strategy: MaskStrategy,
+    http_request: Request,
+    tenant: str | None = None,
+) -> MaskResponse:
     from .llm_service import llm_service
 
-    result = await llm_service.detect_pii(request.text, request.categories)
+    result = await run_scheduled(
+        http_request,
+        _text_priority(text),
+        llm_service.detect_pii(text, categories, tenant=tenant),
+    )
 
-    if "error" in result and not result["detections"]:
+    # A failed chunk leaves its part of the text unmasked: fail the request
+    if "error" in result:
         raise HTTPException(
             status_code=502,
             detail=f"LLM service error: {result['error']}",
         )
 
-    # Build masked text by replacing detections (process from end to start)
-    detections = sorted(result["detections"], key=lambda d: d["start"], reverse=True)
-    masked_text = request.text
-
-    for det in detections:
-        start = det["start"]
-        end = det["end"]
-        if 0 <= start < end <= len(masked_text):
-            masked_text = masked_text[:start] + "████" + masked_text[end:]
+    masked_text = render_masked_text(text, result["detections"], strategy)
+    metrics.count_detections(result["detections"])
 
     # Re-sort detections by position for output
     detections_sorted = sorted(result["detections"], key=lambda d: d["start"])
@@ -92,3 +289,351 @@ async def mask_pii(request: MaskRequest):
         masked_text=masked_text,
         detections=[Detection(**d) for d in detections_sorted],
     )
+
+
+@app.post("/api/mask", response_model=MaskResponse)
+async def mask_pii(request: MaskRequest, http_request: Request):
+    _check_strategy(request.strategy)
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+
+    return await _mask_text(
+        request.text, request.categories, request.strategy, http_request, request.tenant
+    )
+
+
+def _masked_filename(filename: str) -> str:
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower() not in (".txt", *TABLE_EXTENSIONS, *REDACTABLE_EXTENSIONS):
+        ext = ".txt"
+    return f"{stem}.masked{ext}"
+
+
+async def _mask_table_file(
+    file: UploadFile, categories: list[str], strategy: MaskStrategy, http_request: Request
+) -> FileResponse:
+    ext, path = await spool_checked_upload(file)
+    try:
+        result = await run_scheduled(
+            http_request, BULK, mask_table(file.filename, path, categories, strategy)
+        )
+    except ValueError as e:
+        metrics.PARSE_FAILURES.inc(ext, "invalid")
+        raise HTTPException(status_code=400, detail=str(e))
+    except TableMaskError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    finally:
+        os.unlink(path)
+
+    columns = [{"name": c.name, "kind": c.kind, "type": c.type} for c in result.columns]
+    return FileResponse(
+        result.path,
+        media_type=MEDIA_TYPES[ext],
+        filename=_masked_filename(file.filename),
+        headers={
+            "X-Masked-Cells": str(result.masked_cells),
+            "X-Column-Profiles": json.dumps(columns),
+        },
+        background=BackgroundTask(os.unlink, result.path),
+    )
+
+
+async def _mask_document_file(
+    file: UploadFile,
+    categories: list[str],
+    strategy: MaskStrategy,
+    http_request: Request,
+    tenant: str | None = None,
+) -> FileResponse:
+    ext, path = await spool_checked_upload(file)
+    try:
+        extraction = await _parse_spooled(
+            file.filename, ext, path, lambda filename, path: parse_pool.run(extract_redactable, filename, path)
+        )
+        if not extraction.text.strip():
+            raise HTTPException(status_code=400, detail="Document contains no text")
+        response = await _mask_text(extraction.text, categories, strategy, http_request, tenant)
+        edits = plan_edits(extraction, [d.model_dump() for d in response.detections], strategy)
+        out_path = await parse_pool.run(write_docx, path, edits)
+    finally:
+        os.unlink(path)
+
+    return FileResponse(
+        out_path,
+        media_type=MEDIA_TYPES[ext],
+        filename=_masked_filename(file.filename),
+        headers={"X-Detections": str(len(response.detections))},
+        background=BackgroundTask(os.unlink, out_path),
+    )
+
+
+@app.post("/api/mask/file", response_model=MaskResponse)
+async def mask_file(
+    http_request: Request,
+    file: UploadFile = File(...),
+    categories: list[str] | None = Form(None),
+    strategy: MaskStrategy = Form("block"),
+    output: Literal["json", "file"] = Form("json"),
+    tenant: str | None = Form(None),
+):
+    """Parse an upload and mask it in one request.
+
+    Saves the /api/upload -> /api/mask round trip, which sends the
+    extracted text to the client and back. With output=file the result is
+    a download: a masked CSV/XLSX for tables (see tabular.py), a redacted
+    DOCX (see redaction.py), and masked text for other formats.
+    """
+    _check_strategy(strategy)
+    categories = categories or DEFAULT_CATEGORIES
+    if output == "file" and is_table(file.filename or ""):
+        if tenant:
+            raise HTTPException(
+                status_code=400, detail="Table downloads do not use the entity dictionary; omit tenant"
+            )
+        return await _mask_table_file(file, categories, strategy, http_request)
+    if output == "file" and is_redactable(file.filename or ""):
+        return await _mask_document_file(file, categories, strategy, http_request, tenant)
+
+    text = await parse_upload(file)
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Document contains no text")
+
+    response = await _mask_text(text, categories, strategy, http_request, tenant)
+    if output == "file":
+        return PlainTextResponse(
+            response.masked_text,
+            headers={
+                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(_masked_filename(file.filename))}",
+                "X-Detections": str(len(response.detections)),
+            },
+        )
+    return response
+
+
+@app.post("/api/mask/batch", response_model=BatchMaskResponse)
+async def mask_pii_batch(request: BatchMaskRequest, http_request: Request):
+    _check_strategy(request.strategy)
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Items cannot be empty")
+    if len(request.items) > settings.MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items: {len(request.items)} > {settings.MAX_BATCH_ITEMS}",
+        )
+
+    from .llm_service import llm_service
+
+    texts = [item.text for item in request.items]
+    categories = [item.categories or request.categories for item in request.items]
+    results = await run_scheduled(
+        http_request, BULK, llm_service.detect_pii_batch(texts, categories)
+    )
+    for result in results:
+        metrics.count_detections(result["detections"])
+
+    return BatchMaskResponse(results=[
+        BatchMaskResult(
+            masked_text=(
+                None if "error" in result else render_masked_text(text, result["detections"], request.strategy)
+            ),
+            detections=[Detection(**d) for d in sorted(result["detections"], key=lambda d: d["start"])],
+            error=result.get("error"),
+        )
+        for text, result in zip(texts, results)
+    ])
+
+
+def _entity_dictionary(authorization: str | None = Header(None)):
+    """The entity dictionary, for callers presenting ENTITY_DICT_ADMIN_TOKEN.
+
+    Entries are stored PII in plaintext, so the endpoints are off without
+    a token.
+    """
+    from .llm_service import llm_service
+
+    if llm_service.entities is None:
+        raise HTTPException(status_code=404, detail="Entity dictionary is disabled")
+    token = settings.ENTITY_DICT_ADMIN_TOKEN
+    if not token:
+        raise HTTPException(status_code=403, detail="Set ENTITY_DICT_ADMIN_TOKEN to manage entities")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing bearer token")
+    return llm_service.entities
+
+
+@app.get("/api/entities/{tenant}", response_model=EntitiesResponse)
+async def list_entities(tenant: str, entities=Depends(_entity_dictionary)):
+    return {"tenant": tenant, "entities": entities.entries(tenant)}
+
+
+@app.post("/api/entities/{tenant}")
+async def add_entities(tenant: str, request: EntitiesRequest, entities=Depends(_entity_dictionary)):
+    """Add confirmed entities, or change the type of known ones."""
+    added = entities.add(tenant, [(e.type, e.value) for e in request.entities])
+    return {"added": added}
+
+
+@app.delete("/api/entities/{tenant}")
+async def remove_entities(
+    tenant: str, value: list[str] | None = Query(None), entities=Depends(_entity_dictionary)
+):
+    """Remove the given values (e.g. learned false positives), or all if none are given."""
+    return {"removed": entities.remove(tenant, value)}
+
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+    file: UploadFile | None = File(None),
+    text: str | None = Form(None),
+    categories: list[str] | None = Form(None),
+    strategy: MaskStrategy = Form("block"),
+):
+    """Queue a file or text for masking in the background."""
+    _check_strategy(strategy)
+    categories = categories or DEFAULT_CATEGORIES
+    if file is not None and file.filename:
+        try:
+            file_extension(file.filename)
+            job_id = await job_manager.submit_file(file, categories, strategy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+    elif text and text.strip():
+        job_id = job_manager.submit_text(text, categories, strategy)
+    else:
+        raise HTTPException(status_code=400, detail="Provide a file or non-empty text")
+    return job_manager.status(job_id)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    status = job_manager.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+def _format_event(event: dict, fmt: str) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def _mask_events(request: MaskRequest, fmt: str) -> AsyncIterator[str]:
+    with request_context(_text_priority(request.text), settings.LLM_REQUEST_DEADLINE):
+        try:
+            async for event in _mask_stream_events(request, fmt):
+                yield event
+        except SchedulerError as e:
+            yield _format_event({"event": "error", "detail": str(e), "retry_after": e.retry_after}, fmt)
+
+
+async def _mask_stream_events(request: MaskRequest, fmt: str) -> AsyncIterator[str]:
+    """Stream detections per chunk and masked text segments in document order.
+
+    A segment is emitted once every chunk overlapping it has completed, and
+    its end is pulled back before any detection that crosses it, so the
+    concatenated segments equal the non-streaming masked_text.
+
+    A failed chunk gets an error event and no segment reaches into it, so
+    its text is never streamed unmasked; the stream then ends with an
+    error event instead of done.
+    """
+    from .llm_service import chunk_text, llm_service
+
+    text = request.text
+    chunks = chunk_text(text)
+    renderer = MaskRenderer(request.strategy)
+    completed: set[int] = set()
+    pending: list[dict] = []  # detections not yet rendered
+    seen: set[tuple[int, int, str]] = set()
+    next_chunk = 0
+    emitted = 0
+    total = 0
+    errors = []
+
+    async for index, _, result in llm_service.detect_pii_stream(text, request.categories):
+        if "error" in result:
+            errors.append(result["error"])
+            yield _format_event(
+                {"event": "error", "chunk": index, "detail": f"LLM service error: {result['error']}"}, fmt
+            )
+            continue
+        completed.add(index)
+
+        new = []
+        for det in result["detections"]:
+            key = (det["start"], det["end"], det["type"].lower())
+            if key not in seen:
+                seen.add(key)
+                new.append(det)
+        total += len(new)
+        metrics.count_detections(new)
+        pending.extend(new)
+        yield _format_event(
+            {"event": "detections", "chunk": index, "detections": [Detection(**d).model_dump() for d in new]},
+            fmt,
+        )
+
+        while next_chunk in completed:
+            next_chunk += 1
+            boundary = chunks[next_chunk].start if next_chunk < len(chunks) else len(text)
+            crossing = True
+            while crossing:
+                crossing = False
+                for det in pending:
+                    if det["start"] < boundary < det["end"]:
+                        boundary = det["start"]
+                        crossing = True
+            boundary = max(boundary, emitted)
+            if boundary > emitted:
+                ready = [d for d in pending if d["end"] <= boundary]
+                pending = [d for d in pending if d["end"] > boundary]
+                yield _format_event(
+                    {
+                        "event": "segment",
+                        "start": emitted,
+                        "end": boundary,
+                        "masked_text": renderer.render(text, ready, emitted, boundary),
+                    },
+                    fmt,
+                )
+                emitted = boundary
+
+    if errors:
+        yield _format_event(
+            {"event": "error", "detail": f"LLM service error: {len(errors)} of {len(chunks)} chunks failed"}, fmt
+        )
+        return
+    if emitted < len(text):
+        yield _format_event(
+            {
+                "event": "segment",
+                "start": emitted,
+                "end": len(text),
+                "masked_text": renderer.render(text, pending, emitted, len(text)),
+            },
+            fmt,
+        )
+    yield _format_event({"event": "done", "chunks": len(chunks), "detections": total}, fmt)
+
+
+@app.post("/api/mask/stream")
+async def mask_pii_stream(request: MaskRequest, format: Literal["ndjson", "sse"] = "ndjson"):
+    _check_strategy(request.strategy)
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    if request.tenant:
+        raise HTTPException(status_code=400, detail="The stream endpoint does not use the entity dictionary; omit tenant")
+
+    from .llm_service import llm_service
+
+    try:
+        llm_service.scheduler.admit(_text_priority(request.text))
+    except SchedulerError as e:
+        raise _scheduler_http_error(e)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_mask_events(request, format), media_type=media_type)
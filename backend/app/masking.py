@@ -0,0 +1,134 @@
+"""Render masked text from detections in a single pass.
+
+Detections are sorted once and overlapping spans are merged, then the
+output is assembled with one join, so cost is linear in the text size.
+"""
+
+import hashlib
+import hmac
+from typing import Literal
+
+from . import metrics
+from .config import settings
+
+MASK_TOKEN = "████"
+
+MaskStrategy = Literal["block", "tag", "length", "partial", "pseudonym"]
+
+# Types whose last digits identify no one on their own; others are never partially shown
+PARTIAL_TYPES = frozenset({"phone", "id_number", "bank_card"})
+
+
+def merge_spans(detections: list[dict], text_len: int) -> list[tuple[int, int, str]]:
+    """Return sorted, non-overlapping (start, end, type) spans.
+
+    Overlapping or touching-inside spans (e.g. the same email detected as
+    Email and Social_Media) collapse into one; the merged span keeps the
+    type of the detection that starts first (longest on ties).
+    """
+    valid = sorted(
+        (d for d in detections if 0 <= d["start"] < d["end"] <= text_len),
+        key=lambda d: (d["start"], -d["end"]),
+    )
+    merged: list[tuple[int, int, str]] = []
+    for det in valid:
+        if merged and det["start"] < merged[-1][1]:
+            start, end, det_type = merged[-1]
+            merged[-1] = (start, max(end, det["end"]), det_type)
+        else:
+            merged.append((det["start"], det["end"], det["type"]))
+    return merged
+
+
+def _partial(det_type: str, value: str, keep: int = 4) -> str:
+    """Mask letters/digits except the last `keep` ones, keeping separators.
+
+    Other types than PARTIAL_TYPES, and values that would not have more
+    than `keep` characters hidden, get MASK_TOKEN instead.
+    """
+    remaining = sum(ch.isalnum() for ch in value)
+    if det_type.lower() not in PARTIAL_TYPES or remaining - keep <= keep:
+        return MASK_TOKEN
+    out = []
+    for ch in value:
+        if ch.isalnum():
+            out.append(ch if remaining <= keep else "*")
+            remaining -= 1
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _pseudonym(det_type: str, value: str) -> str:
+    digest = hmac.new(
+        settings.MASK_PSEUDONYM_SECRET.encode("utf-8"),
+        f"{det_type.lower()}\x00{value}".encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+    return f"{det_type.upper()}_{digest[:8]}"
+
+
+def check_strategy(strategy: MaskStrategy) -> None:
+    """Raise ValueError for a strategy that cannot be used as configured."""
+    if strategy == "pseudonym" and not settings.MASK_PSEUDONYM_SECRET:
+        # An unkeyed hash of a phone number is reversed by enumerating numbers
+        raise ValueError("The pseudonym strategy needs MASK_PSEUDONYM_SECRET to be set")
+
+
+class MaskRenderer:
+    """Render masked text, possibly segment by segment.
+
+    Keeps tag numbering across calls so a document streamed in several
+    segments gets the same tags as when rendered at once.
+
+    - block: fixed "████" token
+    - tag: numbered per-type tags like [PHONE_1]; equal values share a number
+    - length: one "█" per masked character
+    - partial: keep the last 4 digits of phone, ID and card numbers, e.g.
+      ***-****-5678; other values get the block token
+    - pseudonym: deterministic keyed hash per value, e.g. NAME_1a2b3c4d
+    """
+
+    def __init__(self, strategy: MaskStrategy = "block"):
+        check_strategy(strategy)
+        self.strategy = strategy
+        self._tag_numbers: dict[tuple[str, str], int] = {}
+        self._type_counts: dict[str, int] = {}
+
+    def _replacement(self, det_type: str, value: str) -> str:
+        if self.strategy == "tag":
+            key = (det_type.upper(), value)
+            if key not in self._tag_numbers:
+                self._type_counts[key[0]] = self._type_counts.get(key[0], 0) + 1
+                self._tag_numbers[key] = self._type_counts[key[0]]
+            return f"[{key[0]}_{self._tag_numbers[key]}]"
+        if self.strategy == "length":
+            return "█" * len(value)
+        if self.strategy == "partial":
+            return _partial(det_type, value)
+        if self.strategy == "pseudonym":
+            return _pseudonym(det_type, value)
+        return MASK_TOKEN
+
+    def render(self, text: str, detections: list[dict], start: int = 0, end: int | None = None) -> str:
+        """Return text[start:end] masked; detections use offsets in text.
+
+        Spans must lie entirely inside [start, end) to be rendered.
+        """
+        end = len(text) if end is None else end
+        with metrics.timed(metrics.MASK_RENDER_SECONDS, self.strategy, stage="mask"):
+            parts = []
+            pos = start
+            for span_start, span_end, det_type in merge_spans(detections, len(text)):
+                if span_start < start or span_end > end:
+                    continue
+                parts.append(text[pos:span_start])
+                parts.append(self._replacement(det_type, text[span_start:span_end]))
+                pos = span_end
+            parts.append(text[pos:end])
+            return "".join(parts)
+
+
+def render_masked_text(text: str, detections: list[dict], strategy: MaskStrategy = "block") -> str:
+    """Replace every detected span in text according to strategy."""
+    return MaskRenderer(strategy).render(text, detections)
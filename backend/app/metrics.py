@@ -0,0 +1,293 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label values, updated
+from the event loop and rendered on demand by /api/metrics; with several
+uvicorn workers every process reports its own series. Stage timings can
+also be collected per request and returned in a Server-Timing header.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+REQUEST_TOKEN_BUCKETS = TOKEN_BUCKETS + (131072, 524288, 2097152)
+BYTE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+# Detection types reported as their own label value; anything else (custom
+# categories are free text) is counted as "other" to bound label cardinality
+KNOWN_TYPES = frozenset({
+    "name", "phone", "fax", "email", "address", "id_number", "bank_card", "social_media",
+})
+
+_registry: list["_Metric"] = []
+_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def _labels(self, values: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(labels)} {value:g}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        with _lock:
+            self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(labels)} {value:g}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound if isinstance(bound, str) else f"{bound:g}"}"'
+                yield f"{self.name}_bucket{self._labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {total[0]:g}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# Per-request stage timings for the Server-Timing header: stage -> [seconds, count]
+_timings: contextvars.ContextVar[dict[str, list] | None] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def collect_timings() -> Iterator[dict[str, list]]:
+    """Collect stage timings recorded by code running inside the block."""
+    timings: dict[str, list] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def format_server_timing(timings: dict[str, list]) -> str:
+    """Format stage timings; concurrent calls of one stage are summed."""
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f};desc="{count}x"'
+        for stage, (seconds, count) in timings.items()
+    )
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str, stage: str | None = None) -> Iterator[None]:
+    """Observe the duration of the block, and add it to the request's stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, *labels)
+        if stage:
+            record_stage(stage, elapsed)
+
+
+class ServerTimingMiddleware:
+    """Add a Server-Timing header with the stages recorded for the request.
+
+    Only stages finished before the response starts are included, so a
+    streamed response reports little beyond its setup.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.METRICS_SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        with collect_timings() as timings:
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start" and timings:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", format_server_timing(timings))
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+
+# Prompt tokens of the model calls made for the current API request
+_prompt_tokens: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "request_prompt_tokens", default=None
+)
+
+
+def record_prompt_tokens(count: int) -> None:
+    tokens = _prompt_tokens.get()
+    if tokens is not None:
+        tokens[0] += count
+
+
+class RequestTokensMiddleware:
+    """Observe the prompt tokens each API request used, over all its model calls.
+
+    Streamed responses are observed once the stream has finished.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tokens = [0]
+        token = _prompt_tokens.set(tokens)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _prompt_tokens.reset(token)
+            if tokens[0]:
+                REQUEST_PROMPT_TOKENS.observe(tokens[0])
+
+
+def detection_type_label(det_type: str) -> str:
+    det_type = det_type.lower()
+    return det_type if det_type in KNOWN_TYPES else "other"
+
+
+def count_detections(detections: list[dict]) -> None:
+    for det in detections:
+        DETECTIONS.inc(detection_type_label(det.get("type", "")))
+
+
+PARSE_SECONDS = Histogram("pii_parse_seconds", "Upload parse time.", ("format",))
+PARSE_BYTES = Histogram("pii_parse_bytes", "Size of parsed uploads.", ("format",), BYTE_BUCKETS)
+PARSE_FAILURES = Counter("pii_parse_failures_total", "Uploads that could not be parsed.", ("format", "reason"))
+LLM_QUEUE_WAIT = Histogram("pii_llm_queue_wait_seconds", "Time model calls waited for a scheduler slot.", ("priority",))
+LLM_LATENCY = Histogram("pii_llm_request_seconds", "Model call latency per backend.", ("backend",))
+LLM_ERRORS = Counter("pii_llm_errors_total", "Failed model calls per backend.", ("backend",))
+LLM_ESCALATIONS = Counter("pii_llm_escalations_total", "Chunks re-checked by the cascade model.", ("reason",))
+LLM_PROMPT_TOKENS = Histogram("pii_llm_prompt_tokens", "Prompt tokens per model call.", (), TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = Histogram("pii_llm_completion_tokens", "Completion tokens per model call.", (), TOKEN_BUCKETS)
+REQUEST_PROMPT_TOKENS = Histogram(
+    "pii_request_prompt_tokens", "Prompt tokens per API request, over all its model calls.", (), REQUEST_TOKEN_BUCKETS
+)
+LLM_CACHED_TOKENS = Counter("pii_llm_cached_prompt_tokens_total", "Prompt tokens served from the prefix cache.")
+PREFILTER_THRESHOLD = Gauge("pii_prefilter_threshold", "Score below which chunks skip the model (0: disabled).")
+PREFILTER_CHUNKS = Counter("pii_prefilter_chunks_total", "Chunks screened by the pre-filter.", ("result",))
+PREFILTER_CHARS = Counter("pii_prefilter_chars_total", "Characters of screened chunks.", ("result",))
+PREFILTER_SKIPPED_RATIO = Gauge("pii_prefilter_skipped_ratio", "Share of screened chunks that skipped the model.")
+REPLY_PARSE = Counter("pii_llm_reply_parse_total", "Model replies by the parse strategy that succeeded.", ("strategy",))
+SPAN_RESOLUTION_SECONDS = Histogram("pii_span_resolution_seconds", "Time to map model entities to text offsets.")
+MASK_RENDER_SECONDS = Histogram("pii_mask_render_seconds", "Masked text render time.", ("strategy",))
+ENTITY_DICT_MATCHES = Counter("pii_entity_dictionary_matches_total", "Known entities matched from the tenant dictionary.")
+CACHE_REQUESTS = Counter("pii_detection_cache_requests_total", "Detection cache lookups.", ("result",))
+TABULAR_COLUMNS = Counter("pii_tabular_columns_total", "Table columns by profile kind.", ("kind",))
+DETECTIONS = Counter("pii_detections_total", "Detections returned to clients per type.", ("type",))
@@ -0,0 +1,185 @@
+"""Run document parsing off the event loop.
+
+Uploads are spooled to a temporary file and parsed by a process (or
+thread) pool, so a large PDF or spreadsheet no longer stalls every other
+request on the worker. Process workers are recycled after
+PARSE_MAX_TASKS_PER_CHILD tasks to contain parser memory growth. Long
+PDFs are extracted in page ranges on several workers at once.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable, TypeVar
+
+from fastapi import UploadFile
+
+from .config import settings
+from .document_parser import (
+    Extraction,
+    extract_file,
+    file_extension,
+    parse_file,
+    pdf_extraction,
+    pdf_page_count,
+    pdf_page_texts,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int) -> str:
+    """Copy an upload to a named temporary file and return its path.
+
+    Raises UploadTooLarge as soon as more than max_bytes have been read.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+
+    suffix = file_extension(file.filename or "")
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="pii-upload-")
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while block := await file.read(SPOOL_BLOCK_SIZE):
+                written += len(block)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+                out.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+class ParsePool:
+    """Executor wrapper applying a per-file timeout to parse jobs."""
+
+    def __init__(self, kind: str, workers: int, max_tasks_per_child: int, timeout: float):
+        self.kind = kind
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout = timeout
+        self._executor: Executor | None = None
+
+    def _create_executor(self) -> Executor:
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            max_tasks_per_child=self.max_tasks_per_child or None,
+        )
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    async def parse(self, filename: str, path: str) -> str:
+        """Parse the file at path in the pool.
+
+        Raises asyncio.TimeoutError if parsing takes longer than the
+        configured timeout; the pool is then replaced and its process
+        workers terminated, so a stuck parser does not keep occupying
+        capacity for later uploads.
+        """
+        if self.kind == "inline":
+            return parse_file(filename, path)
+        return await self._with_timeout(filename, self._parse(filename, path))
+
+    async def extract(self, filename: str, path: str) -> Extraction:
+        """Like parse, but return the text with its source map."""
+        if self.kind == "inline":
+            return extract_file(filename, path)
+        return await self._with_timeout(filename, self._extract(filename, path))
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Run other document work (e.g. writing a redacted copy) in the pool."""
+        if self.kind == "inline":
+            return func(*args)
+        return await self._with_timeout(func.__name__, self._submit(func, *args))
+
+    async def _parse(self, filename: str, path: str) -> str:
+        extraction = await self._extract_pdf_pages(filename, path)
+        if extraction is not None:
+            return extraction.text
+        return await self._submit(parse_file, filename, path)
+
+    async def _extract(self, filename: str, path: str) -> Extraction:
+        extraction = await self._extract_pdf_pages(filename, path)
+        if extraction is not None:
+            return extraction
+        return await self._submit(extract_file, filename, path)
+
+    async def _extract_pdf_pages(self, filename: str, path: str) -> Extraction | None:
+        """Split a long PDF into one page range per worker; None for other files."""
+        if (
+            self.workers < 2
+            or settings.PDF_PARALLEL_MIN_PAGES <= 0
+            or file_extension(filename) != ".pdf"
+        ):
+            return None
+        count = await self._submit(pdf_page_count, path)
+        if count < settings.PDF_PARALLEL_MIN_PAGES:
+            return None
+        step = -(-count // self.workers)
+        parts = await asyncio.gather(*(
+            self._submit(pdf_page_texts, path, first, min(first + step, count))
+            for first in range(0, count, step)
+        ))
+        return pdf_extraction([page for part in parts for page in part])
+
+    async def _submit(self, func: Callable[..., T], *args) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _with_timeout(self, filename: str, work: Awaitable[T]) -> T:
+        try:
+            return await asyncio.wait_for(work, timeout=self.timeout or None)
+        except asyncio.TimeoutError:
+            logger.warning("Parsing %s timed out after %ss; recycling pool", filename, self.timeout)
+            self._recycle()
+            raise
+
+    def _recycle(self) -> None:
+        """Drop the executor and kill its workers.
+
+        shutdown() alone leaves a worker stuck in a parser running; process
+        workers are terminated so they stop using CPU and memory. Threads
+        cannot be killed and are left to finish on their own.
+        """
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        workers = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+parse_pool = ParsePool(
+    kind=settings.PARSE_EXECUTOR,
+    workers=settings.PARSE_WORKERS,
+    max_tasks_per_child=settings.PARSE_MAX_TASKS_PER_CHILD,
+    timeout=settings.PARSE_TIMEOUT,
+)
@@ -0,0 +1,104 @@
+"""Deterministic rule detectors for PII categories with a fixed syntax.
+
+All candidates are found by one precompiled alternation in a single pass
+over the text; each candidate is then classified by cheap validators
+(ID-card checksum, Luhn) so the same digit run can be told apart as an ID
+number or a bank card without rescanning.
+"""
+
+import re
+from datetime import date
+
+# Categories the rule engine can detect on its own
+RULE_CATEGORIES = frozenset({"phone", "email", "id_number", "bank_card"})
+
+_CANDIDATE_RE = re.compile(
+    r"(?P<email>(?<![0-9A-Za-z_.%+\-])[A-Za-z0-9._%+\-]+@[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)*\.[A-Za-z]{2,}(?![0-9A-Za-z_\-]))"
+    r"|(?P<card>(?<![\d\-])\d{4}(?:[ \-]\d{4}){3}(?:[ \-]?\d{1,3})?(?![\d\-]))"
+    r"|(?P<digits>(?<![0-9A-Za-z_\-])\d{14,18}[\dXx](?![0-9A-Za-z_\-]))"
+    r"|(?P<mobile>(?<![\d\-])(?:(?:\+|00)86[ \-]?)?1[3-9]\d(?:[ \-]?\d{4}){2}(?![\d\-]))"
+    r"|(?P<landline>(?<![\d\-])(?:\(0\d{2,3}\)|0\d{2,3})[ \-]?\d{3,4}[ \-]?\d{4}"
+    r"(?:[ ]?(?:ext\.?|转|-)[ ]?\d{1,5})?(?![\d\-]))",
+    re.ASCII,
+)
+
+_ID_WEIGHTS = (7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2)
+_ID_CHECK_CODES = "10X98765432"
+# Luhn: value contributed by a digit in a doubled position
+_LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+
+def _valid_birth_date(year: int, month: int, day: int) -> bool:
+    try:
+        born = date(year, month, day)
+    except ValueError:
+        return False
+    return date(1900, 1, 1) <= born <= date.today()
+
+
+def is_valid_id_number(value: str) -> bool:
+    """Validate a mainland China resident ID (18-digit checksum or legacy 15-digit)."""
+    if len(value) == 18:
+        body, check = value[:17], value[17].upper()
+        if not body.isdigit():
+            return False
+        total = sum(int(d) * w for d, w in zip(body, _ID_WEIGHTS))
+        if _ID_CHECK_CODES[total % 11] != check:
+            return False
+        return _valid_birth_date(int(value[6:10]), int(value[10:12]), int(value[12:14]))
+    if len(value) == 15 and value.isdigit():
+        return _valid_birth_date(1900 + int(value[6:8]), int(value[8:10]), int(value[10:12]))
+    return False
+
+
+def is_luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = ord(ch) - 48
+        total += _LUHN_DOUBLED[d] if i % 2 else d
+    return total % 10 == 0
+
+
+def _classify(kind: str, value: str) -> str | None:
+    if kind == "email":
+        return "email"
+    if kind in ("mobile", "landline"):
+        return "phone"
+    if kind == "card":
+        digits = value.replace(" ", "").replace("-", "")
+        return "bank_card" if is_luhn_valid(digits) else None
+    # Bare 15-19 character run: ID number takes precedence over bank card
+    if len(value) in (15, 18) and is_valid_id_number(value):
+        return "id_number"
+    if value.isdigit() and 16 <= len(value) <= 19 and is_luhn_valid(value):
+        return "bank_card"
+    return None
+
+
+def rule_categories(categories: list[str]) -> set[str]:
+    """Return the requested categories (lower-cased) that the rules cover."""
+    return {c.lower() for c in categories} & RULE_CATEGORIES
+
+
+def detect_rules(text: str, categories: list[str]) -> list[dict]:
+    """Detect rule-covered categories in text.
+
+    Returns detections in the same {type, original, start, end} shape as
+    LLMService.detect_pii, with `type` spelled as in `categories`.
+    """
+    wanted = {c.lower(): c for c in categories if c.lower() in RULE_CATEGORIES}
+    if not wanted:
+        return []
+
+    detections = []
+    for match in _CANDIDATE_RE.finditer(text):
+        value = match.group()
+        category = _classify(match.lastgroup, value)
+        if category in wanted:
+            detections.append({
+                "type": wanted[category],
+                "original": value,
+                "start": match.start(),
+                "end": match.end(),
+            })
+    return detections
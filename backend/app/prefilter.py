@@ -0,0 +1,144 @@
+"""Negative pre-filter that keeps PII-free chunks away from the model.
+
+Statutory text, clause bodies and numeric tables make up most of a legal
+document and hold no PII, yet every character of them would be sent to
+the model. Each chunk is scored first from cheap features, found with one
+Aho-Corasick pass and one precompiled alternation:
+
+- anchors: the contact and party keywords the prompts use as semantic
+  anchors (电话, 传真, 邮箱, 原告, Tel, Fax, ...)
+- at_signs: "@" characters (emails, social-media handles)
+- digit_runs: runs of 7 or more digits, the shape of phone, ID and card
+  numbers, and long runs of Chinese numerals
+- digit_density: the share of non-space characters that are digits
+- names: a common Chinese surname before a title or 某 (王经理, 张律师,
+  李某); a surname opening a word of two or three characters that ends at
+  punctuation or a connective (李明与赵强于...); an English title before
+  a capitalised word (Mr. Lee), or two capitalised words (John Smith)
+- addresses: street and building numbers (中山路100号, 3号楼, 10 Main
+  Street), two levels of administrative division (北京市朝阳区) and named
+  streets (Baker Street)
+
+Every count weighs 1 and digit_density DIGIT_DENSITY_WEIGHT, so with the
+suggested PREFILTER_THRESHOLD of 1 a chunk is sent as soon as one strong
+signal is present. Only chunks asked about SCREENED_CATEGORIES alone are
+screened: the features say nothing about custom categories.
+"""
+
+import re
+from typing import NamedTuple
+
+from . import metrics
+from .aho_corasick import AhoCorasick, on_word_boundaries
+from .config import settings
+
+# Categories whose PII the features below are expected to flag
+SCREENED_CATEGORIES = frozenset({
+    "name", "phone", "fax", "email", "address", "id_number", "bank_card", "social_media",
+})
+
+# Lower-cased; ASCII anchors only count on word boundaries ("tel" is not in "hotel")
+ANCHORS = (
+    "电话", "手机", "传真", "邮箱", "邮件", "地址", "住址", "住所", "联系", "律师事务所", "律所",
+    "原告", "被告", "申请人", "第三人", "代理人", "代表人", "收件人", "姓名",
+    "身份证", "证件", "护照", "账号", "账户", "卡号", "开户", "微信", "钉钉", "微博", "小红书",
+    "tel", "phone", "mobile", "fax", "email", "e-mail", "mail", "address", "contact", "attn",
+    "passport", "account", "wechat", "qq", "[at]", "(at)", "☎", "✉",
+)
+
+SURNAMES = (
+    "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁"
+    "任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武"
+    "戴莫孔向汤"
+)
+TITLES = (
+    "先生", "女士", "小姐", "律师", "法官", "审判长", "审判员", "书记员", "检察官", "警官", "经理",
+    "总", "董事长", "主任", "老师", "医生", "会计", "某",
+)
+
+# Characters that commonly follow or join names in running text
+CONNECTIVES = "与和及同跟于在是的向对为称说等诉"
+# Capitalised words that open phrases rather than names ("The Company")
+NON_NAME_WORDS = (
+    "The", "This", "That", "These", "Those", "Such", "Any", "Each", "Every", "No", "All", "In",
+    "On", "If", "For", "Article", "Section", "Chapter", "Clause", "Part", "Schedule",
+)
+
+DIGIT_DENSITY_WEIGHT = 0.5
+
+_FEATURE_RE = re.compile(
+    r"(?P<digits>(?<!\d)\d(?:[ \-]?\d){6,}(?!\d)|[〇零一二三四五六七八九]{7,})"
+    rf"|(?P<name>[{SURNAMES}][一-鿿]{{0,2}}?(?:{'|'.join(TITLES)})"
+    rf"|(?:(?<![一-鿿])|(?<=[{CONNECTIVES}]))[{SURNAMES}][一-鿿]{{1,2}}?(?=[{CONNECTIVES}]|[^一-鿿]|$)"
+    r"|\b(?:Mr|Mrs|Ms|Miss|Dr|Prof)\.?\s+[A-Z]"
+    rf"|\b(?!(?:{'|'.join(NON_NAME_WORDS)})\b)[A-Z][a-z]+\s+[A-Z][a-z]+\b)"
+    r"|(?P<address>\d+\s*(?:号|室|栋|幢|楼|单元)|(?:路|街|道|巷|弄)\s*\d+"
+    r"|[一-鿿]{1,6}?(?:省|市)[一-鿿]{1,6}?(?:市|区|县)"
+    r"|\b(?:\d+\s+)?[A-Z][a-z]+\s+(?:Street|St|Road|Rd|Avenue|Ave|Lane|Ln|Boulevard|Blvd|Drive)\b)"
+)
+
+_anchors = AhoCorasick(list(ANCHORS))
+
+
+class ChunkFeatures(NamedTuple):
+    anchors: int
+    at_signs: int
+    digit_runs: int
+    digit_density: float
+    names: int
+    addresses: int
+
+    @property
+    def score(self) -> float:
+        return (
+            self.anchors + self.at_signs + self.digit_runs + self.names + self.addresses
+            + DIGIT_DENSITY_WEIGHT * self.digit_density
+        )
+
+
+def _count_anchors(text: str) -> int:
+    lowered = text.lower()
+    return sum(
+        on_word_boundaries(lowered, start, end) for start, end, _ in _anchors.iter_matches(lowered)
+    )
+
+
+def chunk_features(text: str) -> ChunkFeatures:
+    counts = {"digits": 0, "name": 0, "address": 0}
+    for match in _FEATURE_RE.finditer(text):
+        counts[match.lastgroup] += 1
+    visible = len(text) - sum(ch.isspace() for ch in text)
+    digits = sum(ch.isdigit() for ch in text)
+    return ChunkFeatures(
+        anchors=_count_anchors(text),
+        at_signs=text.count("@") + text.count("＠"),
+        digit_runs=counts["digits"],
+        digit_density=digits / visible if visible else 0.0,
+        names=counts["name"],
+        addresses=counts["address"],
+    )
+
+
+def screens(categories: list[str]) -> bool:
+    """True when every category is one the features cover."""
+    return bool(categories) and all(c.lower() in SCREENED_CATEGORIES for c in categories)
+
+
+def should_skip(text: str, categories: list[str]) -> bool:
+    """True when text scores below PREFILTER_THRESHOLD and needs no model call.
+
+    Always False while the threshold is 0 (the default) or when a
+    category is not screened.
+    """
+    threshold = settings.PREFILTER_THRESHOLD
+    metrics.PREFILTER_THRESHOLD.set(threshold)
+    if threshold <= 0 or not screens(categories):
+        return False
+    skip = chunk_features(text).score < threshold
+    result = "skipped" if skip else "sent"
+    metrics.PREFILTER_CHUNKS.inc(result)
+    metrics.PREFILTER_CHARS.inc(result, amount=len(text))
+    screened = metrics.PREFILTER_CHUNKS.value("skipped") + metrics.PREFILTER_CHUNKS.value("sent")
+    if screened:
+        metrics.PREFILTER_SKIPPED_RATIO.set(metrics.PREFILTER_CHUNKS.value("skipped") / screened)
+    return skip
@@ -0,0 +1,178 @@
+"""Write masks back into the original document.
+
+Detections are located in the source map of the extraction they were made
+on, turned into per-run edits, and applied to a copy of the upload, so the
+redacted file keeps its formatting. DOCX runs are edited with python-docx;
+CSV/XLSX are rewritten cell by cell in tabular.py. Other formats are
+returned as masked text.
+
+Text the extraction does not see (text boxes, footnotes, comments) would
+survive redaction, so such documents are refused up front. Links behind
+masked text and the document properties are scrubbed on write.
+"""
+
+import os
+import tempfile
+from typing import NamedTuple
+
+from docx import Document
+from docx.document import Document as DocxDocument
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsmap, qn
+from docx.text.hyperlink import Hyperlink
+
+from .document_parser import Extraction, docx_paragraphs, extract_file, file_extension, paragraph_runs
+from .masking import MaskRenderer, MaskStrategy, merge_spans
+
+REDACTABLE_EXTENSIONS = frozenset({".docx"})
+
+# Document parts with text the extraction does not cover
+UNEXTRACTED_PARTS = {RT.FOOTNOTES: "footnotes", RT.ENDNOTES: "endnotes", RT.COMMENTS: "comments"}
+# Package parts that may repeat document content or name its authors
+METADATA_PARTS = (RT.EXTENDED_PROPERTIES, RT.CUSTOM_PROPERTIES, RT.THUMBNAIL)
+CORE_TEXT_PROPERTIES = (
+    "author", "category", "comments", "content_status", "identifier", "keywords",
+    "last_modified_by", "subject", "title", "version",
+)
+
+_TEXT = ".//w:t[normalize-space()]"
+_TEXT_BOX_TEXT = ".//w:txbxContent//w:t[normalize-space()]"
+
+
+class Edit(NamedTuple):
+    """Replace [start, end) of the text at a source location with text."""
+    location: tuple[int, ...]
+    start: int
+    end: int
+    text: str
+
+
+def is_redactable(filename: str) -> bool:
+    try:
+        return file_extension(filename) in REDACTABLE_EXTENSIONS
+    except ValueError:
+        return False
+
+
+def _header_parts(document: DocxDocument, extracted: bool) -> list:
+    """Section headers and footers the extraction covers, or the others."""
+    parts = []
+    for section in document.sections:
+        if extracted:
+            candidates = (section.header, section.footer)
+        else:
+            candidates = (
+                section.first_page_header, section.first_page_footer,
+                section.even_page_header, section.even_page_footer,
+            )
+        parts.extend(part for part in candidates if not part.is_linked_to_previous)
+    return parts
+
+
+def unextracted_content(document: DocxDocument) -> list[str]:
+    """Name the kinds of text in document that redaction would not reach."""
+    found = []
+    containers = [document.element, *(part._element for part in _header_parts(document, True))]
+    if any(element.xpath(_TEXT_BOX_TEXT) for element in containers):
+        found.append("text boxes")
+    if any(part._element.xpath(_TEXT) for part in _header_parts(document, False)):
+        found.append("first-page or even-page headers and footers")
+    for rel in document.part.rels.values():
+        name = UNEXTRACTED_PARTS.get(rel.reltype)
+        if name and not rel.is_external and parse_xml(rel.target_part.blob).xpath(_TEXT, namespaces=nsmap):
+            found.append(name)
+    return found
+
+
+def extract_redactable(filename: str, path: str) -> Extraction:
+    """Extract a DOCX for redaction; used by the parse worker pool.
+
+    Raises ValueError if the document holds text outside the extraction.
+    """
+    with open(path, "rb") as stream:
+        found = unextracted_content(Document(stream))
+    if found:
+        raise ValueError(f"Cannot redact a document with {', '.join(found)}; use output=json instead")
+    return extract_file(filename, path)
+
+
+def plan_edits(extraction: Extraction, detections: list[dict], strategy: MaskStrategy = "block") -> list[Edit]:
+    """Return the edits that mask detections in the source document.
+
+    A span crossing several runs gets its whole replacement in the first
+    run and is cut from the others, so the masked text reads as in
+    masked_text.
+    """
+    renderer = MaskRenderer(strategy)
+    text = extraction.text
+    edits = []
+    for start, end, det_type in merge_spans(detections, len(text)):
+        replacement = renderer.render(text, [{"type": det_type, "start": start, "end": end}], start, end)
+        for span, local_start, local_end in extraction.locate(start, end):
+            edits.append(Edit(span.location, local_start, local_end, replacement))
+            replacement = ""
+    return edits
+
+
+def write_docx(path: str, edits: list[Edit]) -> str:
+    """Apply edits to the DOCX at path and return the path of the new file.
+
+    Runs are found with the same traversal as the extraction. Runs that
+    are edited keep their formatting but are rewritten as plain text, so
+    an image sharing a run with a detection is dropped. A hyperlink with
+    edited runs loses its target, and the document properties are
+    cleared. The caller deletes the output.
+    """
+    by_location: dict[tuple[int, ...], list[Edit]] = {}
+    for edit in edits:
+        by_location.setdefault(edit.location, []).append(edit)
+    paragraphs = {location[0] for location in by_location}
+
+    document = Document(path)
+    for p_index, paragraph in enumerate(docx_paragraphs(document)):
+        if p_index not in paragraphs:
+            continue
+        edited = set()
+        for r_index, run in enumerate(paragraph_runs(paragraph)):
+            run_edits = by_location.get((p_index, r_index))
+            if not run_edits:
+                continue
+            value = run.text
+            for edit in sorted(run_edits, key=lambda e: e.start, reverse=True):
+                value = value[:edit.start] + edit.text + value[edit.end:]
+            run.text = value
+            edited.add(run._r)
+        for hyperlink in paragraph.hyperlinks:
+            if any(run._r in edited for run in hyperlink.runs):
+                _unlink(paragraph.part, hyperlink)
+    _scrub_properties(document)
+
+    fd, out_path = tempfile.mkstemp(suffix=".docx", prefix="pii-masked-")
+    os.close(fd)
+    try:
+        document.save(out_path)
+    except BaseException:
+        os.unlink(out_path)
+        raise
+    return out_path
+
+
+def _unlink(part, hyperlink: Hyperlink) -> None:
+    """Drop the target (e.g. a mailto: address) of a hyperlink."""
+    element = hyperlink._hyperlink
+    r_id = element.rId
+    if r_id:
+        part.drop_rel(r_id)
+        del element.attrib[qn("r:id")]
+    element.attrib.pop(qn("w:tooltip"), None)
+
+
+def _scrub_properties(document: DocxDocument) -> None:
+    properties = document.core_properties
+    for name in CORE_TEXT_PROPERTIES:
+        setattr(properties, name, "")
+    package_rels = document.part.package.rels
+    for r_id, rel in list(package_rels.items()):
+        if rel.reltype in METADATA_PARTS:
+            del package_rels[r_id]
@@ -0,0 +1,145 @@
+"""Priority scheduler for model calls.
+
+Every model call takes one of LLM_MAX_CONCURRENCY slots. When all slots
+are busy, callers wait in a priority queue where interactive requests
+are served before bulk work, FIFO within a priority. Requests are
+admitted only while the queue for their priority is below its depth
+limit; each carries a deadline after which queued calls give up.
+
+Priority and deadline are set once per HTTP request with
+`request_context()` and read from a context variable, so they reach the
+model calls of every chunk task spawned for that request.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, NamedTuple
+
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+class SchedulerError(Exception):
+    """Base class for errors that should surface to the client as-is."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(SchedulerError):
+    pass
+
+
+class DeadlineExceeded(SchedulerError):
+    pass
+
+
+class RequestContext(NamedTuple):
+    priority: int
+    deadline: float | None  # time.monotonic() value
+
+
+_current: contextvars.ContextVar[RequestContext] = contextvars.ContextVar(
+    "llm_request_context", default=RequestContext(INTERACTIVE, None)
+)
+
+
+@contextmanager
+def request_context(priority: int, timeout: float | None) -> Iterator[RequestContext]:
+    """Set the priority and deadline for model calls made inside the block."""
+    deadline = time.monotonic() + timeout if timeout else None
+    token = _current.set(RequestContext(priority, deadline))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def current_request() -> RequestContext:
+    return _current.get()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, max_queue: dict[int, int] | None = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue or {}
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._avg_hold = 1.0
+
+    def queue_depth(self, priority: int | None = None) -> int:
+        return sum(
+            1 for p, _, fut in self._waiters
+            if not fut.done() and (priority is None or p == priority)
+        )
+
+    def retry_after(self) -> int:
+        """Estimate seconds until the current queue has drained."""
+        waves = (self.queue_depth() + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(waves * self._avg_hold))
+
+    def admit(self, priority: int) -> None:
+        """Raise QueueFull if a new request of this priority should be refused."""
+        limit = self.max_queue.get(priority, 0)
+        if limit and self.queue_depth(priority) >= limit:
+            raise QueueFull(
+                f"LLM queue is full ({PRIORITY_NAMES.get(priority, priority)})",
+                self.retry_after(),
+            )
+
+    async def acquire(self) -> None:
+        ctx = _current.get()
+        if self.active < self.max_concurrency and not self.queue_depth():
+            self.active += 1
+            return
+
+        timeout = None
+        if ctx.deadline is not None:
+            timeout = ctx.deadline - time.monotonic()
+            if timeout <= 0:
+                raise DeadlineExceeded("Request deadline exceeded", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (ctx.priority, next(self._seq), future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self.release()
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(
+                    "Request deadline exceeded while queued", self.retry_after()
+                ) from None
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - started)
+            self.release()
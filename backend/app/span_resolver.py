@@ -0,0 +1,81 @@
+"""Map entity strings returned by the LLM back to positions in the source text.
+
+All entity strings of a request are matched together with one Aho-Corasick
+pass. Strings without an exact occurrence get a second, tolerant pass over
+a normalized view of the text (NFKC, case-folded, whitespace removed) that
+is computed once, so full-width digits, letter case and spacing that the
+model normalized away still resolve to the original characters.
+"""
+
+import unicodedata
+from functools import lru_cache
+
+from .aho_corasick import AhoCorasick
+
+
+@lru_cache(maxsize=8192)
+def _fold_char(ch: str) -> str:
+    if ch.isspace():
+        return ""
+    return unicodedata.normalize("NFKC", ch).casefold().replace(" ", "")
+
+
+def normalize_with_map(text: str) -> tuple[str, list[int]]:
+    """Return the normalized text and, per normalized char, its index in text."""
+    parts = []
+    index_map = []
+    for i, ch in enumerate(text):
+        folded = _fold_char(ch)
+        if folded:
+            parts.append(folded)
+            index_map.extend([i] * len(folded))
+    return "".join(parts), index_map
+
+
+def normalize(text: str) -> str:
+    return "".join(_fold_char(ch) for ch in text)
+
+
+def resolve_spans(text: str, originals: list[str]) -> dict[str, list[tuple[int, int, str]]]:
+    """Find every occurrence of each original string in text.
+
+    Returns {original: [(start, end, actual_text), ...]} in text order;
+    originals that cannot be found map to an empty list.
+    """
+    unique = list(dict.fromkeys(o for o in originals if o))
+    spans: dict[str, list[tuple[int, int, str]]] = {o: [] for o in unique}
+    if not unique:
+        return spans
+
+    exact = AhoCorasick(unique)
+    for start, end, pid in exact.iter_matches(text):
+        spans[unique[pid]].append((start, end, text[start:end]))
+
+    missing = [o for o in unique if not spans[o]]
+    if not missing:
+        return spans
+
+    fuzzy = AhoCorasick()
+    owners: list[list[str]] = []
+    by_norm: dict[str, int] = {}
+    for original in missing:
+        norm = normalize(original)
+        if not norm:
+            continue
+        if norm not in by_norm:
+            by_norm[norm] = fuzzy.add(norm)
+            owners.append([])
+        owners[by_norm[norm]].append(original)
+    if not owners:
+        return spans
+
+    norm_text, index_map = normalize_with_map(text)
+    for start, end, pid in fuzzy.iter_matches(norm_text):
+        orig_start = index_map[start]
+        orig_end = index_map[end - 1] + 1
+        span = (orig_start, orig_end, text[orig_start:orig_end])
+        for original in owners[pid]:
+            # Several normalized chars can come from one source char
+            if not spans[original] or spans[original][-1][:2] != span[:2]:
+                spans[original].append(span)
+    return spans
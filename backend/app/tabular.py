@@ -0,0 +1,366 @@
+"""Column-aware masking for CSV and XLSX tables.
+
+Instead of flattening a sheet into padded text, each column is profiled
+once from its header and a sample of its values:
+
+- whole: the column holds one kind of PII (most sampled values are a
+  single detection, or half of them when the header names the type, such
+  as "phone" or "电话"); every non-empty cell is masked as a whole
+  without a model call
+- rules: rule-covered PII (phones, emails, ...) appears inside the cells;
+  the rule engine runs over the column's distinct values
+- text: free text with PII inside it; distinct values go through the
+  batched model path
+- skip: nothing was found in the sample
+
+Cells are masked per distinct value and mapped back over the column, so a
+value repeated across a million rows is detected once. Rows are read and
+written in batches of ROW_BATCH_SIZE; the pandas and rule work of each
+batch runs in a worker thread, off the event loop.
+"""
+
+import asyncio
+import os
+import re
+import tempfile
+import zipfile
+from typing import Iterator, NamedTuple
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from . import metrics
+from .config import settings
+from .document_parser import ROW_BATCH_SIZE, file_extension
+from .masking import MaskRenderer, MaskStrategy
+from .pii_rules import RULE_CATEGORIES, detect_rules
+
+TABLE_EXTENSIONS = frozenset({".csv", ".xlsx"})
+
+WHOLE = "whole"
+RULES = "rules"
+TEXT = "text"
+SKIP = "skip"
+
+# Lower-cased header fragments that mark a column as holding one PII type
+HEADER_HINTS = {
+    "name": ("name", "姓名", "名字", "联系人"),
+    "phone": ("phone", "mobile", "tel", "电话", "手机"),
+    "email": ("email", "e-mail", "邮箱", "电子邮件"),
+    "address": ("address", "地址", "住址"),
+    "id_number": ("id_number", "id number", "id card", "身份证", "证件号"),
+    "bank_card": ("bank_card", "card number", "card no", "银行卡", "卡号"),
+    "social_media": ("wechat", "weibo", "微信", "微博"),
+}
+
+
+class TableMaskError(Exception):
+    """Raised when the model fails on a column that needs it."""
+
+
+class ColumnProfile(NamedTuple):
+    name: str
+    kind: str
+    type: str | None = None
+
+
+class TableMaskResult(NamedTuple):
+    path: str
+    columns: list[ColumnProfile]
+    masked_cells: int
+
+
+def is_table(filename: str) -> bool:
+    try:
+        return file_extension(filename) in TABLE_EXTENSIONS
+    except ValueError:
+        return False
+
+
+def _header_tokens(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _names_hint(header: str, tokens: list[str], hint: str) -> bool:
+    """Latin hints match whole header words ("tel" is not in "Hotel"); CJK hints match anywhere."""
+    if not hint.isascii():
+        return hint in header
+    words = _header_tokens(hint)
+    return any(tokens[i:i + len(words)] == words for i in range(len(tokens) - len(words) + 1))
+
+
+def header_type(header: str, categories: list[str]) -> str | None:
+    """Return the requested category a column header names, if any.
+
+    This is only a hint: a column is masked whole when its sampled values
+    confirm it (see TableMasker.profile).
+    """
+    header = header.strip().lower()
+    tokens = _header_tokens(header)
+    for category in categories:
+        if any(_names_hint(header, tokens, hint) for hint in HEADER_HINTS.get(category.lower(), ())):
+            return category
+    return None
+
+
+def cell_text(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _sample(values: pd.Series) -> list[str]:
+    sample = []
+    for value in values.unique():
+        if value.strip():
+            sample.append(value)
+            if len(sample) >= settings.TABULAR_SAMPLE_ROWS:
+                break
+    return sample
+
+
+def _whole_type(sample: list[str], detections: list[list[dict]], hint: str | None = None) -> str | None:
+    """Return the type covering most sampled values entirely, if any.
+
+    The type a header hints at needs half the usual share of values.
+    """
+    counts: dict[str, int] = {}
+    for value, dets in zip(sample, detections):
+        stripped = value.strip()
+        offset = value.index(stripped)
+        for det in dets:
+            if det["start"] <= offset and det["end"] >= offset + len(stripped):
+                counts[det["type"]] = counts.get(det["type"], 0) + 1
+                break
+    required = settings.TABULAR_WHOLE_COLUMN_RATIO * len(sample)
+    if hint is not None:
+        hinted = sum(count for det_type, count in counts.items() if det_type.lower() == hint.lower())
+        if hinted and hinted >= required / 2:
+            return hint
+    if counts:
+        det_type, count = max(counts.items(), key=lambda item: item[1])
+        if count >= required:
+            return det_type
+    return None
+
+
+def _new_values(values: pd.Series, cache: dict[str, str]) -> list[str]:
+    """Distinct non-empty values not masked by an earlier batch."""
+    return [value for value in values.unique() if value.strip() and value not in cache]
+
+
+def _looks_textual(sample: list[str]) -> bool:
+    """True when most values contain letters, i.e. are not numbers or dates."""
+    return sum(any(ch.isalpha() for ch in value) for value in sample) * 2 >= len(sample)
+
+
+class TableMasker:
+    """Profile and mask a table batch by batch.
+
+    Profiles and the value -> masked value map of every column persist
+    across batches, as does the renderer, so tag numbers are consistent
+    over the whole table.
+    """
+
+    def __init__(self, categories: list[str], strategy: MaskStrategy = "block"):
+        self.categories = categories
+        self.llm_categories = [c for c in categories if c.lower() not in RULE_CATEGORIES]
+        self.renderer = MaskRenderer(strategy)
+        self.profiles: dict[int, ColumnProfile] = {}
+        self.masked_cells = 0
+        self._masked: dict[int, dict[str, str]] = {}
+
+    async def _detect(self, values: list[str]) -> list[list[dict]]:
+        from .llm_service import llm_service
+
+        results = await llm_service.detect_pii_batch(values, [self.categories] * len(values))
+        for result in results:
+            if "error" in result:
+                raise TableMaskError(f"LLM service error: {result['error']}")
+        return [result["detections"] for result in results]
+
+    async def profile(self, name: str, values: pd.Series) -> ColumnProfile | None:
+        """Profile a column from its header and sample; None if it has no values yet.
+
+        A header hint alone never masks a column: "Product name" holds no
+        person names, so the sampled values must confirm the hinted type.
+        """
+        sample = _sample(values)
+        if not sample:
+            return None
+        hint = header_type(name, self.categories)
+
+        rule_hits = [detect_rules(value, self.categories) for value in sample]
+        det_type = _whole_type(sample, rule_hits, hint)
+        if det_type is not None:
+            return ColumnProfile(name, WHOLE, det_type)
+
+        if self.llm_categories and _looks_textual(sample):
+            model_hits = await self._detect(sample)
+            det_type = _whole_type(sample, model_hits, hint)
+            if det_type is not None:
+                return ColumnProfile(name, WHOLE, det_type)
+            if any(model_hits):
+                return ColumnProfile(name, TEXT)
+
+        return ColumnProfile(name, RULES if any(rule_hits) else SKIP)
+
+    async def mask(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Return the batch with PII masked; frame holds cell text (str)."""
+        masked = await asyncio.to_thread(frame.copy)
+        for index, name in enumerate(frame.columns):
+            if index not in self.profiles:
+                profile = await self.profile(str(name), frame.iloc[:, index])
+                if profile is None:
+                    continue
+                self.profiles[index] = profile
+                metrics.TABULAR_COLUMNS.inc(profile.kind)
+            profile = self.profiles[index]
+            if profile.kind == SKIP:
+                continue
+
+            values = frame.iloc[:, index]
+            cache = self._masked.setdefault(index, {})
+            new = await asyncio.to_thread(_new_values, values, cache)
+            detections = await self._detect(new) if profile.kind == TEXT else None
+            await asyncio.to_thread(self._mask_column, masked, index, profile, values, new, detections)
+        return masked
+
+    def _mask_column(
+        self,
+        masked: pd.DataFrame,
+        index: int,
+        profile: ColumnProfile,
+        values: pd.Series,
+        new: list[str],
+        detections: list[list[dict]] | None,
+    ) -> None:
+        """Mask new distinct values and write the column into masked (worker thread)."""
+        cache = self._masked[index]
+        if profile.kind == WHOLE:
+            for value in new:
+                det = {"type": profile.type, "start": 0, "end": len(value)}
+                cache[value] = self.renderer.render(value, [det])
+        else:
+            if detections is None:
+                detections = [detect_rules(value, self.categories) for value in new]
+            for value, dets in zip(new, detections):
+                metrics.count_detections(dets)
+                cache[value] = self.renderer.render(value, dets) if dets else value
+
+        column = values.map(lambda value: cache.get(value, value))
+        masked.iloc[:, index] = column.to_numpy()
+        changed = int((column != values).sum())
+        self.masked_cells += changed
+        if profile.kind == WHOLE and changed:
+            metrics.DETECTIONS.inc(metrics.detection_type_label(profile.type), amount=changed)
+
+
+def _csv_batches(path: str) -> Iterator[tuple[tuple, pd.DataFrame, pd.DataFrame]]:
+    for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=ROW_BATCH_SIZE):
+        yield tuple(frame.columns), frame, frame
+
+
+def _xlsx_batches(path: str) -> Iterator[tuple[tuple, pd.DataFrame, pd.DataFrame]]:
+    """Yield (header row, original values, cell text) batches of the first sheet.
+
+    Empty header cells get column_N names in the frames; the header row is
+    passed on as read.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [cell_text(h) or f"column_{i + 1}" for i, h in enumerate(header)]
+
+        def batch_frames(batch: list) -> tuple[tuple, pd.DataFrame, pd.DataFrame]:
+            original = pd.DataFrame(batch, columns=columns, dtype=object)
+            return header, original, original.map(cell_text)
+
+        width = len(columns)
+        batch: list[tuple] = []
+        yielded = False
+        for row in rows:
+            batch.append((row + (None,) * width)[:width])
+            if len(batch) >= ROW_BATCH_SIZE:
+                yield batch_frames(batch)
+                batch, yielded = [], True
+        if batch or not yielded:
+            yield batch_frames(batch)
+    finally:
+        workbook.close()
+
+
+def _append_xlsx_rows(
+    sheet, header: tuple | None, original: pd.DataFrame, text: pd.DataFrame, masked: pd.DataFrame
+) -> None:
+    """Write a masked batch to a write-only sheet (worker thread).
+
+    Unchanged cells keep their original values; header is written first
+    when given.
+    """
+    if header is not None:
+        sheet.append(list(header))
+    output = original.where(masked == text, masked)
+    for row in output.itertuples(index=False):
+        sheet.append([None if cell_text(cell) == "" else cell for cell in row])
+
+
+async def mask_table(
+    filename: str, path: str, categories: list[str], strategy: MaskStrategy = "block"
+) -> TableMaskResult:
+    """Mask the table at path and write it to a new file of the same format.
+
+    XLSX output holds the first sheet only (the sheet the parser reads),
+    with unchanged cells keeping their original values and types.
+
+    Raises ValueError for unreadable tables and TableMaskError when the
+    model fails on a column that needs it. The caller deletes the output.
+    """
+    ext = file_extension(filename)
+    reader = _csv_batches(path) if ext == ".csv" else _xlsx_batches(path)
+    masker = TableMasker(categories, strategy)
+
+    fd, out_path = tempfile.mkstemp(suffix=ext, prefix="pii-masked-")
+    os.close(fd)
+    workbook = sheet = None
+    if ext == ".xlsx":
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+
+    try:
+        first = True
+        while True:
+            try:
+                batch = await asyncio.to_thread(next, reader, None)
+            except (pd.errors.ParserError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+                raise ValueError(f"Invalid table: {e}") from e
+            except pd.errors.EmptyDataError:
+                batch = None
+            if batch is None:
+                break
+            header, original, text = batch
+            masked = await masker.mask(text)
+            if ext == ".csv":
+                await asyncio.to_thread(
+                    masked.to_csv, out_path, mode="w" if first else "a", header=first, index=False
+                )
+            else:
+                await asyncio.to_thread(
+                    _append_xlsx_rows, sheet, header if first else None, original, text, masked
+                )
+            first = False
+        if workbook is not None:
+            await asyncio.to_thread(workbook.save, out_path)
+    except BaseException:
+        os.unlink(out_path)
+        raise
+    finally:
+        reader.close()
+
+    columns = [masker.profiles[i] for i in sorted(masker.profiles)]
+    return TableMaskResult(out_path, columns, masker.masked_cells)
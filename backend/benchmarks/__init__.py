@@ -0,0 +1,7 @@
+"""Benchmarks and load tests that run without a GPU or network access.
+
+- corpus: synthetic legal-style text and documents of a given size
+- mock_llm: OpenAI-compatible stub server with configurable latency
+- micro: micro-benchmarks for the parsing, resolution and masking hot paths
+- loadgen: concurrent load generator for /api/mask and /api/upload
+"""
@@ -0,0 +1,170 @@
+"""Synthetic documents for benchmarks.
+
+Text is built from contact-block style paragraphs with names, phones,
+faxes, emails, ID and card numbers, so every stage has realistic work.
+Generation is seeded and deterministic.
+"""
+
+import csv
+import io
+import random
+
+from docx import Document
+from openpyxl import Workbook
+
+SURNAMES = "王李张刘陈杨赵黄周吴"
+TITLES = ["律师", "经理", "法官", "先生", "女士"]
+STREETS = ["浦东新区世纪大道100号", "海淀区中关村大街27号", "天河区珠江新城华夏路8号"]
+FILLER = (
+    "根据双方于2024年签订的合同第12条约定，当事人应在收到通知后十五日内履行付款义务。"
+    "The parties agree that this clause survives termination of the agreement. "
+)
+
+
+def _id_number(rng: random.Random) -> str:
+    body = f"{rng.randint(110000, 650000)}{rng.randint(1960, 2005)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 999):03d}"
+    weights = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
+    check = "10X98765432"[sum(int(d) * w for d, w in zip(body, weights)) % 11]
+    return body + check
+
+
+def _card_number(rng: random.Random) -> str:
+    digits = [6, 2, 2] + [rng.randint(0, 9) for _ in range(12)]
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        if i % 2 == 0:
+            d *= 2
+            d -= 9 if d > 9 else 0
+        total += d
+    return "".join(map(str, digits)) + str((10 - total % 10) % 10)
+
+
+def paragraph(rng: random.Random) -> str:
+    name = rng.choice(SURNAMES) + rng.choice(TITLES)
+    user = f"user{rng.randint(1, 99999)}"
+    return (
+        f"联系人: {name} 电话: 138{rng.randint(10000000, 99999999)} "
+        f"传真: 021-{rng.randint(10000000, 99999999)} 邮箱: {user}@firm.com; "
+        f"地址: {rng.choice(STREETS)} 身份证号: {_id_number(rng)} "
+        f"银行卡: {_card_number(rng)}\n{FILLER}\n"
+    )
+
+
+def make_text(size: int, seed: int = 0) -> str:
+    """Return roughly size bytes (UTF-8) of text, cut at a paragraph boundary."""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size:
+        part = paragraph(rng)
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+    return "".join(parts)
+
+
+def make_rows(size: int, seed: int = 0) -> list[list[str]]:
+    rng = random.Random(seed)
+    rows = [["name", "phone", "email", "id_number", "note"]]
+    total = 0
+    while total < size:
+        row = [
+            rng.choice(SURNAMES) + rng.choice(TITLES),
+            f"138{rng.randint(10000000, 99999999)}",
+            f"user{rng.randint(1, 99999)}@firm.com",
+            _id_number(rng),
+            FILLER[:40],
+        ]
+        rows.append(row)
+        total += sum(len(cell.encode("utf-8")) for cell in row) + len(row)
+    return rows
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(text: str, lines_per_page: int = 50) -> bytes:
+    """Write a minimal PDF with one Helvetica text line per input line.
+
+    Only ASCII survives the standard font, so other characters become "?";
+    extraction cost still scales with the page and glyph count.
+    """
+    lines = [line.encode("ascii", "replace").decode("ascii") for line in text.splitlines()] or [""]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    objects: list[bytes] = []
+    page_ids = []
+    font_id = 3
+    for page_lines in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "36 806 Td"]
+        ops.extend(f"({_pdf_escape(line)}) Tj T*" for line in page_lines)
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = 4 + len(objects)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_id = 4 + len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font_id, content_id)
+        )
+        page_ids.append(page_id)
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode()
+    header_objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(header_objects + objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(text: str) -> bytes:
+    document = Document()
+    for line in text.splitlines():
+        document.add_paragraph(line)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_csv(rows: list[list[str]]) -> bytes:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def make_xlsx(rows: list[list[str]]) -> bytes:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+def make_document(ext: str, size: int, seed: int = 0) -> bytes:
+    """Return a document of the given type with about size bytes of content."""
+    if ext == ".txt":
+        return make_text(size, seed).encode("utf-8")
+    if ext == ".pdf":
+        return make_pdf(make_text(size, seed))
+    if ext == ".docx":
+        return make_docx(make_text(size, seed))
+    if ext == ".csv":
+        return make_csv(make_rows(size, seed))
+    if ext == ".xlsx":
+        return make_xlsx(make_rows(size, seed))
+    raise ValueError(f"Unsupported document type: {ext}")
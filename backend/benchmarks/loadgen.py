@@ -0,0 +1,141 @@
+"""Concurrent load generator for /api/mask and /api/upload.
+
+Start the backend against the mock model first (see mock_llm), then:
+
+    python -m backend.benchmarks.loadgen --endpoint mask --concurrency 32 --duration 30 --size 4K
+    python -m backend.benchmarks.loadgen --endpoint upload --file-type .pdf --size 1M --requests 200
+
+Reports throughput, status codes and p50/p95/p99 latency per endpoint.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from .corpus import make_document, make_text
+from .micro import parse_size
+
+DEFAULT_CATEGORIES = ["name", "phone", "email", "address", "id_number", "bank_card"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 <= pct <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(name: str, latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+    return {
+        "endpoint": name,
+        "requests": sum(statuses.values()),
+        "statuses": dict(statuses),
+        "throughput_rps": sum(statuses.values()) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    send,
+    concurrency: int,
+    total: int | None,
+    duration: float | None,
+) -> tuple[list[float], Counter, float]:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    async def worker() -> None:
+        nonlocal issued
+        while True:
+            if total is not None and issued >= total:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            issued += 1
+            t0 = time.perf_counter()
+            try:
+                response = await send(client)
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def make_sender(args):
+    """Return a coroutine function sending the next request.
+
+    Requests cycle through --variants distinct payloads so the detection
+    cache does not turn the run into a cache benchmark.
+    """
+    seeds = range(args.seed, args.seed + max(1, args.variants))
+    counter = iter(range(sys.maxsize))
+    if args.endpoint == "mask":
+        payloads = [{"text": make_text(args.size, s), "categories": DEFAULT_CATEGORIES} for s in seeds]
+        return lambda client: client.post("/api/mask", json=payloads[next(counter) % len(payloads)])
+
+    documents = [make_document(args.file_type, args.size, s) for s in seeds]
+    filename = f"bench{args.file_type}"
+    return lambda client: client.post(
+        "/api/upload", files={"file": (filename, documents[next(counter) % len(documents)])}
+    )
+
+
+async def main_async(args) -> dict:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+        latencies, statuses, elapsed = await run_load(
+            client, make_sender(args), args.concurrency, args.requests, args.duration
+        )
+    return summarize(f"/api/{args.endpoint}", latencies, statuses, elapsed)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["mask", "upload"], default="mask")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, help="total requests (default: run for --duration)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run when --requests is unset")
+    parser.add_argument("--size", type=parse_size, default=parse_size("4K"), help="text or document size")
+    parser.add_argument("--file-type", default=".txt", choices=[".txt", ".pdf", ".docx", ".csv", ".xlsx"])
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--variants", type=int, default=16, help="distinct payloads to cycle through")
+    parser.add_argument("--json", dest="json_path", help="write the summary to this file")
+    args = parser.parse_args(argv)
+    if args.requests:
+        args.duration = None
+
+    summary = asyncio.run(main_async(args))
+    print(
+        f"{summary['endpoint']}: {summary['requests']} requests, "
+        f"{summary['throughput_rps']:.1f} req/s, statuses {summary['statuses']}\n"
+        f"  p50 {summary['p50_ms']:.1f} ms  p95 {summary['p95_ms']:.1f} ms  p99 {summary['p99_ms']:.1f} ms"
+    )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
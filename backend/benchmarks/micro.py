@@ -0,0 +1,163 @@
+"""Micro-benchmarks for the CPU-bound stages of a request.
+
+    python -m backend.benchmarks.micro                      # default sizes
+    python -m backend.benchmarks.micro --sizes 1K,1M,100M --only parse
+    python -m backend.benchmarks.micro --json out.json --compare baseline.json
+
+Each case is run until --min-time seconds have passed (at least 3 runs)
+and the median time per call is reported. With --compare, cases more than
+--threshold percent slower than the baseline file are listed and the exit
+status is 1.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Callable
+
+from ..app.document_parser import parse_document, parse_file
+from ..app.llm_service import extract_json_from_text, parse_compact_detections, parse_detections_json
+from ..app.masking import MaskRenderer
+from ..app.pii_rules import RULE_CATEGORIES, detect_rules
+from ..app.span_resolver import resolve_spans
+from .corpus import make_document, make_text
+
+CATEGORIES = sorted(RULE_CATEGORIES)
+DOCUMENT_TYPES = [".txt", ".pdf", ".docx", ".csv", ".xlsx"]
+
+
+def parse_size(value: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    for unit, factor in (("M", 1024 ** 2), ("K", 1024)):
+        if size >= factor:
+            return f"{size / factor:g}{unit}"
+    return str(size)
+
+
+def measure(fn: Callable[[], object], min_time: float, max_runs: int = 1000) -> list[float]:
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 3 or (time.perf_counter() < deadline and len(timings) < max_runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def text_cases(size: int) -> dict[str, Callable[[], object]]:
+    text = make_text(size)
+    detections = detect_rules(text, CATEGORIES)
+    originals = [d["original"] for d in detections]
+    raw = [{"type": d["type"], "original": d["original"]} for d in detections]
+    reply = json.dumps({"detections": raw}, ensure_ascii=False)
+    noisy_reply = f"<think>\n{text[:2000]}\n</think>\nHere are the results:\n```json\n{reply}\n```"
+    codes = {c: i for i, c in enumerate(CATEGORIES, 1)}
+    compact_reply = "\n".join(f"{codes[d['type']]}|{d['original']}" for d in raw)
+
+    cases: dict[str, Callable[[], object]] = {
+        "extract_json_from_text": lambda: extract_json_from_text(reply),
+        "extract_json_from_text/noisy": lambda: extract_json_from_text(noisy_reply),
+        "parse_detections_json": lambda: parse_detections_json(reply),
+        "parse_compact_detections": lambda: parse_compact_detections(compact_reply, CATEGORIES),
+        "detect_rules": lambda: detect_rules(text, CATEGORIES),
+        "resolve_spans": lambda: resolve_spans(text, originals),
+    }
+    for strategy in ("block", "tag", "partial", "pseudonym"):
+        cases[f"mask/{strategy}"] = lambda s=strategy: MaskRenderer(s).render(text, detections)
+    return cases
+
+
+def parse_cases(size: int, tmpdir: str) -> dict[str, Callable[[], object]]:
+    import os
+
+    cases: dict[str, Callable[[], object]] = {}
+    for ext in DOCUMENT_TYPES:
+        content = make_document(ext, size)
+        path = os.path.join(tmpdir, f"bench-{size}{ext}")
+        with open(path, "wb") as f:
+            f.write(content)
+        cases[f"parse_document{ext}"] = lambda e=ext, c=content: parse_document(f"doc{e}", c)
+        cases[f"parse_file{ext}"] = lambda e=ext, p=path: parse_file(f"doc{e}", p)
+    return cases
+
+
+def run(sizes: list[int], only: set[str], min_time: float) -> list[dict]:
+    import tempfile
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pii-bench-") as tmpdir:
+        for size in sizes:
+            groups = []
+            if "text" in only:
+                groups.append(text_cases(size))
+            if "parse" in only:
+                groups.append(parse_cases(size, tmpdir))
+            for cases in groups:
+                for name, fn in cases.items():
+                    timings = measure(fn, min_time)
+                    result = {
+                        "case": name,
+                        "size": size,
+                        "runs": len(timings),
+                        "median_ms": statistics.median(timings) * 1000,
+                        "min_ms": min(timings) * 1000,
+                    }
+                    results.append(result)
+                    print(
+                        f"{name:<32} {format_size(size):>6} {result['median_ms']:>12.3f} ms"
+                        f" {result['min_ms']:>12.3f} ms {len(timings):>6}",
+                        flush=True,
+                    )
+    return results
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    previous = {(r["case"], r["size"]): r["median_ms"] for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get((r["case"], r["size"]))
+        if before and r["median_ms"] > before * (1 + threshold / 100):
+            regressions.append(
+                f"{r['case']} @ {format_size(r['size'])}: {before:.3f} ms -> {r['median_ms']:.3f} ms"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1K,100K,1M", help="comma-separated input sizes, e.g. 1K,1M,100M")
+    parser.add_argument("--only", default="text,parse", help="case groups to run: text, parse")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend per case")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file from an earlier --json run")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed slowdown in percent")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    only = {g.strip() for g in args.only.split(",")}
+    print(f"{'case':<32} {'size':>6} {'median':>15} {'min':>15} {'runs':>6}")
+    results = run(sizes, only, args.min_time)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""OpenAI-compatible stub of the detection model.
+
+Answers /v1/chat/completions with detections found by the regex rules
+(plus optional canned entities) in the requested output format, after a
+configurable latency and token-rate delay, so the whole backend can be
+load-tested without a GPU or network access.
+
+    python -m backend.benchmarks.mock_llm --port 8001 --latency 0.2 --tokens-per-second 80
+    LLM_MODE=local LLM_API_BASE=http://localhost:8001/v1 uvicorn backend.app.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+
+from fastapi import FastAPI, Request
+
+from ..app.llm_service import BATCH_ITEM_MARKER
+from ..app.pii_rules import RULE_CATEGORIES, detect_rules
+
+TEXT_HEADER = "Text to analyze:\n"
+_ITEM_RE = re.compile("^" + re.escape(BATCH_ITEM_MARKER).replace(r"\{\}", r"(\d+)") + "$", re.MULTILINE)
+
+
+def _content_text(content) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content or ""
+
+
+def _requested_categories(prompt: str) -> list[str]:
+    head = prompt.split(TEXT_HEADER, 1)[0]
+    line = head.split("Categories to detect:", 1)[-1]
+    if line.startswith("\n"):
+        # Compact prompts list one "code=category" per line
+        return [entry.split("=", 1)[1] for entry in line.strip().splitlines() if "=" in entry]
+    return [c.strip() for c in line.strip().splitlines()[0].split(",")] if line.strip() else []
+
+
+def _split_items(body: str) -> list[tuple[int | None, str]]:
+    matches = list(_ITEM_RE.finditer(body))
+    if not matches:
+        return [(None, body)]
+    return [
+        (int(m.group(1)), body[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(body)])
+        for i, m in enumerate(matches)
+    ]
+
+
+def find_entities(prompt: str, canned: list[dict]) -> tuple[list[str], list[tuple[int | None, str, str]]]:
+    """Return (categories, [(item, category, original)]) for a user prompt."""
+    categories = _requested_categories(prompt)
+    body = prompt.split(TEXT_HEADER, 1)[-1]
+    by_name = {c.lower(): c for c in categories}
+    entities = []
+    for item, text in _split_items(body):
+        for det in detect_rules(text, categories):
+            entities.append((item, det["type"], det["original"]))
+        for det in canned:
+            category = by_name.get(det["type"].lower())
+            if category and category.lower() not in RULE_CATEGORIES and det["original"] in text:
+                entities.append((item, category, det["original"]))
+    return categories, entities
+
+
+def render_reply(compact: bool, categories: list[str], entities: list[tuple[int | None, str, str]]) -> str:
+    if compact:
+        codes = {c: i for i, c in enumerate(categories, 1)}
+        return "\n".join(
+            (f"{item}|" if item is not None else "") + f"{codes[category]}|{original}"
+            for item, category, original in entities
+        )
+    detections = []
+    for item, category, original in entities:
+        det = {"type": category, "original": original}
+        if item is not None:
+            det["item"] = item
+        detections.append(det)
+    return json.dumps({"detections": detections}, ensure_ascii=False)
+
+
+def create_app(latency: float = 0.0, tokens_per_second: float = 0.0, canned: list[dict] | None = None) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    canned = canned or []
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        system = _content_text(messages[0]["content"]) if messages else ""
+        prompt = _content_text(messages[-1]["content"]) if messages else ""
+
+        categories, entities = find_entities(prompt, canned)
+        content = render_reply("CODE|EXACT_SUBSTRING" in system, categories, entities)
+        # Roughly 4 characters per token for both prompt and reply
+        prompt_tokens = sum(len(_content_text(m["content"])) for m in messages) // 4
+        completion_tokens = max(1, len(content) // 4)
+        delay = latency + (completion_tokens / tokens_per_second if tokens_per_second else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        return {
+            "id": f"mock-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.1, help="fixed seconds per call")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="decode rate, 0 = instant")
+    parser.add_argument("--detections", help="JSON file with canned [{type, original}] entities")
+    args = parser.parse_args()
+
+    canned = []
+    if args.detections:
+        with open(args.detections, encoding="utf-8") as f:
+            canned = json.load(f)
+    uvicorn.run(create_app(args.latency, args.tokens_per_second, canned), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
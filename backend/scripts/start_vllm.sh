@@ -12,4 +12,5 @@ vllm serve AdamLucek/Qwen3-4B-Instruct-2507-PII-RL \
   --enable-reasoning \
   --reasoning-parser deepseek_r1 \
   --max-model-len 8192 \
+  --enable-prefix-caching \
   --dtype auto
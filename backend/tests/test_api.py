@@ -47,6 +47,14 @@ class TestUploadEndpoint:
         assert response.status_code == 400
         assert "Unsupported" in response.json()["detail"]
 
+    @patch("backend.app.main.settings.MAX_UPLOAD_BYTES", 10)
+    def test_upload_too_large(self):
+        response = client.post(
+            "/api/upload",
+            files={"file": ("big.txt", io.BytesIO(b"x" * 100), "text/plain")},
+        )
+        assert response.status_code == 413
+
 
 class TestMaskEndpoint:
     @patch("backend.app.llm_service.llm_service")
@@ -65,6 +73,29 @@ class TestMaskEndpoint:
         assert "████" in data["masked_text"]
         assert len(data["detections"]) == 1
 
+    @patch("backend.app.llm_service.llm_service")
+    def test_mask_queue_full(self, mock_llm):
+        from backend.app.scheduler import QueueFull
+        mock_llm.scheduler.admit.side_effect = QueueFull("LLM queue is full", 7)
+        mock_llm.detect_pii = AsyncMock(return_value={"detections": []})
+        response = client.post("/api/mask", json={"text": "Hello"})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "7"
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_mask_deadline_exceeded(self, mock_llm):
+        from backend.app.scheduler import DeadlineExceeded
+        mock_llm.detect_pii = AsyncMock(side_effect=DeadlineExceeded("Request deadline exceeded", 3))
+        response = client.post("/api/mask", json={"text": "Hello"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "3"
+
+    @patch("backend.app.masking.settings.MASK_PSEUDONYM_SECRET", "")
+    def test_pseudonym_without_secret_is_rejected(self):
+        response = client.post("/api/mask", json={"text": "Alice", "strategy": "pseudonym"})
+        assert response.status_code == 400
+        assert "MASK_PSEUDONYM_SECRET" in response.json()["detail"]
+
     def test_mask_empty_text(self):
         response = client.post(
             "/api/mask",
@@ -84,6 +115,20 @@ class TestMaskEndpoint:
         )
         assert response.status_code == 502
 
+    @patch("backend.app.llm_service.llm_service")
+    def test_mask_partial_llm_error(self, mock_llm):
+        # One chunk failed: the other chunks' detections must not be returned as success
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [{"type": "phone", "original": "13812345678", "start": 0, "end": 11}],
+            "error": "API timeout",
+        })
+        response = client.post(
+            "/api/mask",
+            json={"text": "13812345678 and 13912345678", "categories": ["phone"]},
+        )
+        assert response.status_code == 502
+        assert "13912345678" not in response.text
+
     @patch("backend.app.llm_service.llm_service")
     def test_mask_no_pii_found(self, mock_llm):
         mock_llm.detect_pii = AsyncMock(return_value={
@@ -123,3 +168,298 @@ class TestMaskEndpoint:
             json={"text": "Hello world"},
         )
         assert response.status_code == 200
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_mask_tag_strategy(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [
+                {"type": "name", "original": "Alice", "start": 0, "end": 5},
+                {"type": "phone", "original": "123456", "start": 13, "end": 19},
+            ]
+        })
+        response = client.post(
+            "/api/mask",
+            json={"text": "Alice called 123456", "categories": ["name", "phone"], "strategy": "tag"},
+        )
+        assert response.status_code == 200
+        assert response.json()["masked_text"] == "[NAME_1] called [PHONE_1]"
+
+    def test_mask_unknown_strategy(self):
+        response = client.post(
+            "/api/mask",
+            json={"text": "Alice", "strategy": "rot13"},
+        )
+        assert response.status_code == 422
+
+
+class TestMaskFileEndpoint:
+    @patch("backend.app.llm_service.llm_service")
+    def test_parses_and_masks(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}]
+        })
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("note.txt", io.BytesIO(b"Alice called"), "text/plain")},
+            data={"categories": ["name", "phone"], "strategy": "tag"},
+        )
+        assert response.status_code == 200
+        assert response.json()["masked_text"] == "[NAME_1] called"
+        assert mock_llm.detect_pii.call_args.args == ("Alice called", ["name", "phone"])
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_file_output(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [{"type": "name", "original": "Alice", "start": 5, "end": 10}]
+        })
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("客户.txt", io.BytesIO(b"name\nAlice\n"), "text/plain")},
+            data={"output": "file"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-disposition"].endswith("%E5%AE%A2%E6%88%B7.masked.txt")
+        assert response.headers["x-detections"] == "1"
+        assert "Alice" not in response.text
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_partial_llm_error(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}],
+            "error": "API timeout",
+        })
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("note.txt", io.BytesIO(b"Alice called Bob"), "text/plain")},
+            data={"output": "file"},
+        )
+        assert response.status_code == 502
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_table_file_output(self, mock_llm):
+        mock_llm.detect_pii_batch = AsyncMock(side_effect=lambda texts, _: [
+            {"detections": [{"type": "name", "original": t, "start": 0, "end": len(t)}] if t == "Alice" else []}
+            for t in texts
+        ])
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("people.csv", io.BytesIO(b"name,phone,city\nAlice,13812345678,Paris\n"), "text/csv")},
+            data={"output": "file", "categories": ["name", "phone"]},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="people.masked.csv"' in response.headers["content-disposition"]
+        assert response.headers["x-masked-cells"] == "2"
+        assert response.text.splitlines() == ["name,phone,city", "████,████,Paris"]
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_docx_file_output(self, mock_llm):
+        from docx import Document
+        doc = Document()
+        doc.add_paragraph("Alice called")
+        buf = io.BytesIO()
+        doc.save(buf)
+        mock_llm.detect_pii = AsyncMock(return_value={
+            "detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}]
+        })
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("memo.docx", io.BytesIO(buf.getvalue()))},
+            data={"output": "file"},
+        )
+        assert response.status_code == 200
+        assert 'filename="memo.masked.docx"' in response.headers["content-disposition"]
+        assert Document(io.BytesIO(response.content)).paragraphs[0].text == "████ called"
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_docx_with_text_box_is_refused(self, mock_llm):
+        from docx import Document
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import nsdecls
+        doc = Document()
+        doc.add_paragraph()._p.append(parse_xml(
+            f'<w:r {nsdecls("w")}><w:pict><w:txbxContent><w:p><w:r><w:t>Alice</w:t></w:r></w:p>'
+            "</w:txbxContent></w:pict></w:r>"
+        ))
+        buf = io.BytesIO()
+        doc.save(buf)
+        mock_llm.detect_pii = AsyncMock()
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("memo.docx", io.BytesIO(buf.getvalue()))},
+            data={"output": "file"},
+        )
+        assert response.status_code == 400
+        assert "text boxes" in response.json()["detail"]
+        mock_llm.detect_pii.assert_not_called()
+
+    def test_empty_document(self):
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("empty.txt", io.BytesIO(b"  "), "text/plain")},
+        )
+        assert response.status_code == 400
+
+    def test_unsupported_type(self):
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("test.exe", io.BytesIO(b"x"), "application/octet-stream")},
+        )
+        assert response.status_code == 400
+
+
+class TestEntitiesEndpoint:
+    @patch("backend.app.llm_service.llm_service")
+    def test_disabled(self, mock_llm):
+        mock_llm.entities = None
+        assert client.get("/api/entities/m1").status_code == 404
+
+    @patch("backend.app.main.settings.ENTITY_DICT_ADMIN_TOKEN", "secret")
+    @patch("backend.app.llm_service.llm_service")
+    def test_add_list_remove(self, mock_llm, tmp_path):
+        from backend.app.entity_dictionary import EntityDictionary
+        mock_llm.entities = EntityDictionary(str(tmp_path / "e.db"))
+        auth = {"Authorization": "Bearer secret"}
+        response = client.post("/api/entities/m1", headers=auth, json={"entities": [
+            {"type": "name", "value": "Alice"}, {"type": "name", "value": "Bob"},
+        ]})
+        assert response.json() == {"added": 2}
+        assert len(client.get("/api/entities/m1", headers=auth).json()["entities"]) == 2
+        assert client.delete("/api/entities/m1", headers=auth, params={"value": "Bob"}).json() == {"removed": 1}
+        assert client.get("/api/entities/m1", headers=auth).json()["entities"] == [{"type": "name", "value": "Alice"}]
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_requires_admin_token(self, mock_llm, tmp_path):
+        from backend.app.entity_dictionary import EntityDictionary
+        mock_llm.entities = EntityDictionary(str(tmp_path / "e.db"))
+        with patch("backend.app.main.settings.ENTITY_DICT_ADMIN_TOKEN", ""):
+            assert client.get("/api/entities/m1", headers={"Authorization": "Bearer "}).status_code == 403
+        with patch("backend.app.main.settings.ENTITY_DICT_ADMIN_TOKEN", "secret"):
+            assert client.get("/api/entities/m1").status_code == 401
+            assert client.get("/api/entities/m1", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    def test_stream_rejects_tenant(self):
+        response = client.post("/api/mask/stream", json={"text": "Alice", "tenant": "m1"})
+        assert response.status_code == 400
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_table_download_rejects_tenant(self, mock_llm):
+        mock_llm.detect_pii_batch = AsyncMock()
+        response = client.post(
+            "/api/mask/file",
+            files={"file": ("people.csv", io.BytesIO(b"name\nAlice\n"), "text/csv")},
+            data={"output": "file", "tenant": "m1"},
+        )
+        assert response.status_code == 400
+        assert "tenant" in response.json()["detail"]
+        mock_llm.detect_pii_batch.assert_not_called()
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_mask_passes_tenant(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={"detections": []})
+        client.post("/api/mask", json={"text": "hi", "tenant": "m1"})
+        assert mock_llm.detect_pii.call_args.kwargs == {"tenant": "m1"}
+
+
+def fake_stream(*results):
+    """Build a detect_pii_stream replacement yielding (index, chunk, result)."""
+    async def stream(text, categories):
+        for index, result in results:
+            yield index, None, result
+    return stream
+
+
+def read_events(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestMaskStreamEndpoint:
+    @patch("backend.app.llm_service.llm_service")
+    def test_stream_single_chunk(self, mock_llm):
+        mock_llm.detect_pii_stream = fake_stream(
+            (0, {"detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}]}),
+        )
+        response = client.post("/api/mask/stream", json={"text": "Alice called", "categories": ["name"]})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        events = read_events(response)
+        assert [e["event"] for e in events] == ["detections", "segment", "done"]
+        assert events[1]["masked_text"] == "████ called"
+
+    @patch("backend.app.llm_service.settings.LLM_CHUNK_OVERLAP", 0)
+    @patch("backend.app.llm_service.settings.LLM_CHUNK_SIZE", 13)
+    @patch("backend.app.llm_service.llm_service")
+    def test_stream_out_of_order_chunks_emit_ordered_segments(self, mock_llm):
+        text = "Alice here.\nBob is here.\nCarol too."
+        dets = {
+            name: {"type": "name", "original": name, "start": text.index(name), "end": text.index(name) + len(name)}
+            for name in ("Alice", "Bob", "Carol")
+        }
+        mock_llm.detect_pii_stream = fake_stream(
+            (1, {"detections": [dets["Bob"]]}),
+            (0, {"detections": [dets["Alice"]]}),
+            (2, {"detections": [dets["Carol"]]}),
+        )
+        response = client.post("/api/mask/stream", json={"text": text, "categories": ["name"], "strategy": "tag"})
+        events = read_events(response)
+
+        segments = [e for e in events if e["event"] == "segment"]
+        assert [s["start"] for s in segments] == sorted(s["start"] for s in segments)
+        assert "".join(s["masked_text"] for s in segments) == "[NAME_1] here.\n[NAME_2] is here.\n[NAME_3] too."
+        assert events[-1] == {"event": "done", "chunks": 3, "detections": 3}
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_stream_sse_and_error(self, mock_llm):
+        mock_llm.detect_pii_stream = fake_stream((0, {"detections": [], "error": "API timeout"}))
+        response = client.post("/api/mask/stream?format=sse", json={"text": "Some text"})
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: error" in response.text
+        assert "API timeout" in response.text
+
+    @patch("backend.app.llm_service.settings.LLM_CHUNK_OVERLAP", 0)
+    @patch("backend.app.llm_service.settings.LLM_CHUNK_SIZE", 13)
+    @patch("backend.app.llm_service.llm_service")
+    def test_stream_failed_chunk_is_never_emitted(self, mock_llm):
+        text = "Alice here.\nBob is here.\nCarol too."
+        carol = text.index("Carol")
+        mock_llm.detect_pii_stream = fake_stream(
+            (0, {"detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}]}),
+            (1, {"detections": [], "error": "API timeout"}),
+            (2, {"detections": [{"type": "name", "original": "Carol", "start": carol, "end": carol + 5}]}),
+        )
+        response = client.post("/api/mask/stream", json={"text": text, "categories": ["name"]})
+        events = read_events(response)
+
+        assert {"event": "error", "chunk": 1, "detail": "LLM service error: API timeout"} in events
+        assert "Bob" not in "".join(e.get("masked_text", "") for e in events)
+        assert events[-1]["event"] == "error"
+        assert all(e["event"] != "done" for e in events)
+
+    def test_stream_empty_text(self):
+        response = client.post("/api/mask/stream", json={"text": " "})
+        assert response.status_code == 400
+
+
+class TestMaskBatchEndpoint:
+    @patch("backend.app.llm_service.llm_service")
+    def test_batch_masks_each_item(self, mock_llm):
+        mock_llm.detect_pii_batch = AsyncMock(return_value=[
+            {"detections": [{"type": "name", "original": "Alice", "start": 0, "end": 5}]},
+            {"detections": [], "error": "API timeout"},
+        ])
+        response = client.post(
+            "/api/mask/batch",
+            json={"items": [{"text": "Alice called"}, {"text": "Bob", "categories": ["name"]}]},
+        )
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["masked_text"] == "████ called"
+        assert results[1] == {"masked_text": None, "detections": [], "error": "API timeout"}
+        texts, categories = mock_llm.detect_pii_batch.call_args.args
+        assert texts == ["Alice called", "Bob"]
+        assert categories[1] == ["name"]
+        assert "email" in categories[0]
+
+    def test_batch_empty_items(self):
+        response = client.post("/api/mask/batch", json={"items": []})
+        assert response.status_code == 400
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.document_parser import parse_document
+from backend.app.llm_service import parse_compact_detections, parse_detections_json
+from backend.app.prompts import build_batch_instructions, build_messages
+from backend.benchmarks.corpus import make_document
+from backend.benchmarks.loadgen import percentile
+from backend.benchmarks.micro import compare, parse_size
+from backend.benchmarks.mock_llm import create_app
+
+TEXT = "联系人: 王律师 电话: 13812345678 邮箱: wang@firm.com"
+
+
+def complete(messages):
+    client = TestClient(create_app(canned=[{"type": "name", "original": "王律师"}]))
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": messages})
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestCorpus:
+    @pytest.mark.parametrize("ext", [".txt", ".pdf", ".docx", ".csv", ".xlsx"])
+    def test_documents_parse_with_pii(self, ext):
+        text = parse_document(f"doc{ext}", make_document(ext, 2048))
+        assert "@firm.com" in text
+        assert "138" in text
+
+
+class TestMockLLM:
+    def test_json_reply(self):
+        body = complete(build_messages("v2", TEXT, ["name", "phone", "email"]))
+        result = parse_detections_json(body["choices"][0]["message"]["content"])
+        assert {(d["type"], d["original"]) for d in result["detections"]} == {
+            ("name", "王律师"), ("phone", "13812345678"), ("email", "wang@firm.com"),
+        }
+        assert body["usage"]["completion_tokens"] > 0
+
+    def test_compact_batch_reply(self):
+        text = f"### ITEM 1\n{TEXT}\n### ITEM 2\nb@firm.com"
+        instructions = build_batch_instructions("v3", "### ITEM {}", 2)
+        body = complete(build_messages("v3", text, ["email"], instructions))
+        detections = parse_compact_detections(body["choices"][0]["message"]["content"], ["email"])
+        assert detections == [
+            {"type": "email", "original": "wang@firm.com", "item": 1},
+            {"type": "email", "original": "b@firm.com", "item": 2},
+        ]
+
+
+class TestReporting:
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        assert percentile(values, 50) == 0.5
+        assert percentile(values, 99) == 0.99
+        assert percentile([], 95) == 0.0
+
+    def test_parse_size(self):
+        assert parse_size("1K") == 1024
+        assert parse_size("100MB") == 100 * 1024 ** 2
+
+    def test_compare_flags_regressions(self):
+        baseline = [{"case": "a", "size": 1, "median_ms": 1.0}, {"case": "b", "size": 1, "median_ms": 1.0}]
+        results = [{"case": "a", "size": 1, "median_ms": 1.1}, {"case": "b", "size": 1, "median_ms": 2.0}]
+        assert len(compare(results, baseline, threshold=20)) == 1
@@ -0,0 +1,47 @@
+from backend.app.chunker import TextChunk, merge_detections, split_text
+
+
+class TestSplitText:
+    def test_short_text_single_chunk(self):
+        assert split_text("hello", 100, 10) == [TextChunk(0, "hello")]
+
+    def test_chunks_cover_text_within_limit(self):
+        text = "\n\n".join(f"Paragraph {i} mentions 王律师 and 021-1234567{i % 10}." for i in range(50))
+        chunks = split_text(text, 200, 40)
+        assert len(chunks) > 1
+        assert chunks[0].start == 0
+        assert chunks[-1].end == len(text)
+        for chunk in chunks:
+            assert len(chunk.text) <= 200
+            assert text[chunk.start:chunk.end] == chunk.text
+        for prev, nxt in zip(chunks, chunks[1:]):
+            assert nxt.start <= prev.end
+
+    def test_prefers_paragraph_boundaries(self):
+        text = "a" * 60 + "\n\n" + "b" * 60 + "\n\n" + "c" * 60
+        chunks = split_text(text, 100, 0)
+        assert chunks[0].text == "a" * 60 + "\n\n"
+        assert chunks[1].text.startswith("b")
+
+    def test_overlap_starts_on_boundary(self):
+        text = "第一句话。第二句话。第三句话。第四句话。" * 5
+        chunks = split_text(text, 30, 10)
+        for chunk in chunks[1:]:
+            assert text[chunk.start - 1] == "。"
+            assert chunk.start < chunks[chunks.index(chunk) - 1].end
+
+    def test_hard_cut_without_boundaries(self):
+        text = "x" * 250
+        chunks = split_text(text, 100, 0)
+        assert [len(c.text) for c in chunks] == [100, 100, 50]
+
+
+class TestMergeDetections:
+    def test_drops_overlap_duplicates_and_sorts(self):
+        dets = [
+            {"type": "Phone", "original": "123", "start": 10, "end": 13},
+            {"type": "Name", "original": "Bob", "start": 0, "end": 3},
+            {"type": "Phone", "original": "123", "start": 10, "end": 13},
+        ]
+        merged = merge_detections(dets)
+        assert [d["start"] for d in merged] == [0, 10]
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from backend.app import detection_cache, metrics
+from backend.app.detection_cache import DetectionCache, make_cache_key
+
+DETS = [{"type": "phone", "original": "123", "start": 0, "end": 3}]
+
+
+def rows(path: str) -> list[str]:
+    with sqlite3.connect(path) as db:
+        return [key for (key,) in db.execute("SELECT key FROM detections ORDER BY created")]
+
+
+class TestMakeCacheKey:
+    def test_category_order_does_not_matter(self):
+        a = make_cache_key("text", ["name", "phone"], "m", "v1")
+        b = make_cache_key("text", ["Phone", "name"], "m", "v1")
+        assert a == b
+
+    def test_model_and_prompt_version_change_key(self):
+        base = make_cache_key("text", ["name"], "m", "v1")
+        assert make_cache_key("text", ["name"], "other", "v1") != base
+        assert make_cache_key("text", ["name"], "m", "v2") != base
+
+
+class TestDetectionCache:
+    def test_hit_and_miss_counters(self):
+        hits, misses = metrics.CACHE_REQUESTS.value("hit"), metrics.CACHE_REQUESTS.value("miss")
+        cache = DetectionCache(max_entries=4)
+        assert cache.get("k") is None
+        cache.set("k", DETS)
+        assert cache.get("k") == DETS
+        assert metrics.CACHE_REQUESTS.value("hit") == hits + 1
+        assert metrics.CACHE_REQUESTS.value("miss") == misses + 1
+
+    def test_lru_eviction(self):
+        cache = DetectionCache(max_entries=2)
+        cache.set("a", DETS)
+        cache.set("b", DETS)
+        cache.get("a")
+        cache.set("c", DETS)
+        assert cache.get("b") is None
+        assert cache.get("a") == DETS
+
+    def test_ttl_expiry(self):
+        cache = DetectionCache(ttl=0.01)
+        cache.set("k", DETS)
+        time.sleep(0.02)
+        assert cache.get("k") is None
+
+    def test_sqlite_backend_survives_restart(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        DetectionCache(path=path).set("k", DETS)
+        reopened = DetectionCache(path=path)
+        disk_hits = metrics.CACHE_REQUESTS.value("hit_disk")
+        assert reopened.get("k") == DETS
+        assert metrics.CACHE_REQUESTS.value("hit_disk") == disk_hits + 1
+
+    def test_sqlite_rows_expire_and_are_capped(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(detection_cache, "PRUNE_INTERVAL", 0)
+        path = str(tmp_path / "cache.sqlite")
+        cache = DetectionCache(path=path, max_rows=2)
+        for key in ("a", "b", "c"):
+            cache.set(key, DETS)
+        assert rows(path) == ["b", "c"]
+
+        DetectionCache(path=path, ttl=0.01).set("d", DETS)
+        time.sleep(0.02)
+        DetectionCache(path=path, ttl=0.01)
+        assert rows(path) == []
+
+    @pytest.mark.asyncio
+    async def test_sqlite_writes_run_off_the_event_loop(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        cache = DetectionCache(path=path)
+        cache.set("k", DETS)
+        assert cache.get("k") == DETS
+        for _ in range(100):
+            if not cache._writing:
+                break
+            await asyncio.sleep(0.01)
+        assert rows(path) == ["k"]
@@ -1,5 +1,9 @@
+import io
 import pytest
-from backend.app.document_parser import parse_document, SUPPORTED_EXTENSIONS
+from backend.app.document_parser import (
+    EXTRACTORS, Extraction, SourceSpan, SUPPORTED_EXTENSIONS, extract_document, iter_document,
+    parse_document, pdf_backend, register_extractor,
+)
 
 
 class TestParseDocument:
@@ -68,3 +72,126 @@ class TestParseDocument:
         assert ".docx" in SUPPORTED_EXTENSIONS
         assert ".csv" in SUPPORTED_EXTENSIONS
         assert ".xlsx" in SUPPORTED_EXTENSIONS
+
+
+class TestIterDocument:
+    def test_txt_blocks_split_multibyte_chars(self, monkeypatch):
+        from backend.app import document_parser
+        monkeypatch.setattr(document_parser, "TEXT_BLOCK_SIZE", 4)
+        text = "你好世界，hello 测试"
+        pieces = list(iter_document("a.txt", io.BytesIO(text.encode("utf-8"))))
+        assert len(pieces) > 1
+        assert "".join(pieces) == text
+
+    def test_csv_row_batches(self, monkeypatch):
+        from backend.app import document_parser
+        monkeypatch.setattr(document_parser, "ROW_BATCH_SIZE", 2)
+        content = b"name,phone\nAlice,111\nBob,222\nCarol,333\n"
+        pieces = list(iter_document("data.csv", io.BytesIO(content)))
+        assert len(pieces) == 2
+        text = "".join(pieces)
+        assert text.splitlines()[0].split() == ["name", "phone"]
+        assert [line.split()[0] for line in text.splitlines()[1:]] == ["Alice", "Bob", "Carol"]
+
+    def test_xlsx_matches_parse_document(self, tmp_path):
+        import pandas as pd
+        df = pd.DataFrame({"name": ["Alice", "Bob"], "phone": ["9876543210", "123"]})
+        path = tmp_path / "test.xlsx"
+        df.to_excel(path, index=False)
+        content = path.read_bytes()
+        streamed = "".join(iter_document("test.xlsx", io.BytesIO(content)))
+        assert streamed == parse_document("test.xlsx", content)
+
+    def test_xlsx_reads_first_sheet_not_active(self, tmp_path):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(["name"])
+        workbook.active.append(["Alice"])
+        other = workbook.create_sheet("phones")
+        other.append(["phone"])
+        other.append(["13812345678"])
+        workbook.active = 1
+        path = tmp_path / "two.xlsx"
+        workbook.save(path)
+        content = path.read_bytes()
+        streamed = "".join(iter_document("two.xlsx", io.BytesIO(content)))
+        assert streamed == parse_document("two.xlsx", content)
+        assert "Alice" in streamed and "13812345678" not in streamed
+
+    def test_docx_matches_parse_document(self, tmp_path):
+        from docx import Document
+        doc = Document()
+        doc.add_paragraph("First paragraph John Smith")
+        doc.add_paragraph("Second paragraph")
+        path = tmp_path / "test.docx"
+        doc.save(path)
+        content = path.read_bytes()
+        streamed = "".join(iter_document("test.docx", io.BytesIO(content)))
+        assert streamed == parse_document("test.docx", content)
+
+    def test_unsupported_type(self):
+        with pytest.raises(ValueError, match="Unsupported file type"):
+            iter_document("test.exe", io.BytesIO(b""))
+
+
+def docx_bytes(build) -> bytes:
+    from docx import Document
+    doc = Document()
+    build(doc)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+class TestExtractors:
+    def test_docx_runs_are_mapped(self):
+        def build(doc):
+            p = doc.add_paragraph("Call ")
+            p.add_run("John Smith").bold = True
+            doc.add_paragraph("")
+            table = doc.add_table(rows=1, cols=2)
+            table.cell(0, 0).text = "Phone"
+            table.cell(0, 1).text = "13812345678"
+
+        extraction = extract_document("a.docx", io.BytesIO(docx_bytes(build)))
+        assert extraction.text == "Call John Smith\nPhone\n13812345678"
+        start = extraction.text.index("John")
+        assert list(extraction.locate(start, start + 10)) == [(SourceSpan(5, 15, (0, 1)), 0, 10)]
+        phone = extraction.text.index("138")
+        span, _, _ = next(extraction.locate(phone, phone + 11))
+        assert span.location == (3, 0)
+
+    def test_docx_keeps_repeated_paragraphs(self):
+        def build(doc):
+            for _ in range(2):
+                doc.add_paragraph("Confidential")
+        content = docx_bytes(build)
+        assert parse_document("a.docx", content) == "Confidential\nConfidential"
+
+    def test_locate_splits_across_spans(self):
+        extraction = Extraction("ab cd", [SourceSpan(0, 2, (0,)), SourceSpan(3, 5, (1,))])
+        assert [(s.location, a, b) for s, a, b in extraction.locate(1, 4)] == [((0,), 1, 2), ((1,), 0, 1)]
+
+    def test_pdf_pages_are_mapped(self):
+        from backend.benchmarks.corpus import make_pdf
+        content = make_pdf("page one\npage two", lines_per_page=1)
+        extraction = extract_document("a.pdf", io.BytesIO(content))
+        assert [span.location for span in extraction.spans] == [(0,), (1,)]
+        assert extraction.text == parse_document("a.pdf", content)
+        assert "page two" in extraction.text
+
+    def test_pdf_backend_selection(self, monkeypatch):
+        assert pdf_backend("pypdf2").module == "PyPDF2"
+        assert pdf_backend("auto") is not None
+        with pytest.raises(ValueError):
+            pdf_backend("nope")
+
+    def test_register_extractor(self, monkeypatch):
+        monkeypatch.setitem(EXTRACTORS, ".txt", EXTRACTORS[".txt"])
+
+        @register_extractor(".txt")
+        def upper(stream):
+            text = stream.read().decode().upper()
+            return Extraction(text, [SourceSpan(0, len(text), ())])
+
+        assert extract_document("a.txt", io.BytesIO(b"hi")).text == "HI"
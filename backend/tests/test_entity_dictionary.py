@@ -0,0 +1,88 @@
+from backend.app import entity_dictionary
+from backend.app.entity_dictionary import EntityDictionary, replace_known
+
+
+def make_dictionary(tmp_path, **kwargs) -> EntityDictionary:
+    return EntityDictionary(str(tmp_path / "entities.db"), **kwargs)
+
+
+class TestEntityDictionary:
+    def test_learn_and_match(self, tmp_path):
+        entities = make_dictionary(tmp_path)
+        added = entities.learn("m1", [
+            {"type": "Name", "original": "Ann Lee"},
+            {"type": "phone", "original": "010-12345678"},
+            {"type": "name", "original": "A"},  # too short
+        ])
+        assert added == 2
+        text = "Call Ann Lee on 010-12345678."
+        assert [(d["type"], d["original"], d["start"]) for d in entities.match("m1", text, ["name", "phone"])] == [
+            ("name", "Ann Lee", 5), ("phone", "010-12345678", 16),
+        ]
+        # Only requested categories, spelled as requested
+        assert [d["type"] for d in entities.match("m1", text, ["NAME"])] == ["NAME"]
+
+    def test_match_respects_ascii_word_boundaries(self, tmp_path):
+        entities = make_dictionary(tmp_path)
+        entities.learn("m1", [{"type": "name", "original": "Ann"}, {"type": "name", "original": "张三"}])
+        assert entities.match("m1", "Annual report", ["name"]) == []
+        assert [d["original"] for d in entities.match("m1", "Ann, 张三和李四", ["name"])] == ["Ann", "张三"]
+
+    def test_persists_across_instances(self, tmp_path):
+        make_dictionary(tmp_path).learn("m1", [{"type": "name", "original": "Bob Li"}])
+        entities = make_dictionary(tmp_path)
+        assert len(entities.match("m1", "Bob Li", ["name"])) == 1
+        assert entities.match("m2", "Bob Li", ["name"]) == []
+
+    def test_learning_extends_loaded_automaton(self, tmp_path):
+        entities = make_dictionary(tmp_path)
+        entities.learn("m1", [{"type": "name", "original": "Bob Li"}])
+        assert len(entities.match("m1", "Bob Li and Cai Wu", ["name"])) == 1
+        assert entities.learn("m1", [{"type": "name", "original": "Bob Li"}, {"type": "name", "original": "Cai Wu"}]) == 1
+        assert len(entities.match("m1", "Bob Li and Cai Wu", ["name"])) == 2
+
+    def test_learning_does_not_rebuild_main_automaton(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(entity_dictionary, "RECENT_MIN", 2)
+        entities = make_dictionary(tmp_path)
+        entities.add("m1", [("name", "张三丰"), ("name", "三丰")])
+        text = "张三丰、李四、王五、赵六"
+        assert len(entities.match("m1", text, ["name"])) == 2
+        main = entities._tenants["m1"].main
+
+        for value in ("李四", "王五"):
+            entities.learn("m1", [{"type": "name", "original": value}])
+            assert len(entities.match("m1", text, ["name"])) == len(entities.entries("m1"))
+        assert entities._tenants["m1"].main is main and main._built
+
+        # A third recent entity folds the recent automaton into the main one
+        entities.learn("m1", [{"type": "name", "original": "赵六"}])
+        assert len(entities.match("m1", text, ["name"])) == 5
+        assert len(main.patterns) == 5 and entities._tenants["m1"].recent_types == []
+
+    def test_add_retype_and_remove(self, tmp_path):
+        entities = make_dictionary(tmp_path)
+        entities.add("m1", [("name", "Acme Law"), ("name", "Bob Li")])
+        entities.add("m1", [("address", "Acme Law")])
+        assert entities.entries("m1") == [
+            {"type": "name", "value": "Bob Li"}, {"type": "address", "value": "Acme Law"},
+        ]
+        assert entities.remove("m1", ["Acme Law"]) == 1
+        assert entities.match("m1", "Acme Law", ["address"]) == []
+        assert entities.remove("m1") == 1
+        assert entities.entries("m1") == []
+
+
+class TestReplaceKnown:
+    def test_maps_model_detections_back(self):
+        text = "Ann Lee met Bob at 5"
+        known = [{"type": "name", "start": 0, "end": 7}]
+        placeholders = replace_known(text, known)
+        assert placeholders.text == "[NAME] met Bob at 5"
+
+        model = placeholders.text
+        detections = [
+            {"type": "name", "original": "Bob", "start": model.index("Bob"), "end": model.index("Bob") + 3},
+            {"type": "name", "original": "[NAME]", "start": 0, "end": 6},
+        ]
+        mapped = placeholders.map_detections(text, detections)
+        assert mapped == [{"type": "name", "original": "Bob", "start": 12, "end": 15}]
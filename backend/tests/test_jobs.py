@@ -0,0 +1,148 @@
+import io
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.chunker import TextChunk
+from backend.app.config import settings
+from backend.app.jobs import DONE, FAILED, JobManager
+from backend.app.main import app
+
+TEXT = "Call Ann on 555-1234."
+
+
+def fake_service(fail_first: int = 0):
+    """An llm_service stand-in whose stream finds "Ann" in a single chunk."""
+    service = MagicMock()
+    service.calls = []
+    service.aclose = AsyncMock()
+
+    async def stream(text, categories, skip=()):
+        service.calls.append(set(skip))
+        if len(service.calls) <= fail_first:
+            yield 0, TextChunk(0, text), {"detections": [], "error": "backend down"}
+            return
+        if 0 not in skip:
+            start = text.index("Ann")
+            yield 0, TextChunk(0, text), {
+                "detections": [{"type": "name", "original": "Ann", "start": start, "end": start + 3}],
+            }
+
+    service.detect_pii_stream = stream
+    return service
+
+
+async def finish(manager: JobManager, job_id: str) -> dict:
+    await manager._queue.join()
+    return manager.status(job_id)
+
+
+class TestJobManager:
+    @pytest.mark.asyncio
+    async def test_text_job_runs_to_completion(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=3, retention=0)
+        with patch("backend.app.llm_service.llm_service", fake_service()):
+            job_id = manager.submit_text(TEXT, ["name"], "tag")
+            status = await finish(manager, job_id)
+        await manager.stop()
+
+        assert status["status"] == DONE
+        assert status["progress"] == {"chunks_done": 1, "chunks_total": 1}
+        assert status["result"]["masked_text"] == "Call [NAME_1] on 555-1234."
+        assert status["result"]["detections"][0]["original"] == "Ann"
+
+    @pytest.mark.asyncio
+    async def test_failed_chunks_are_retried(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=3, retention=0)
+        service = fake_service(fail_first=1)
+        with patch("backend.app.llm_service.llm_service", service):
+            status = await finish(manager, manager.submit_text(TEXT, ["name"], "block"))
+        await manager.stop()
+        assert status["status"] == DONE
+        assert len(service.calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=2, retention=0)
+        with patch("backend.app.llm_service.llm_service", fake_service(fail_first=5)):
+            status = await finish(manager, manager.submit_text(TEXT, ["name"], "block"))
+        await manager.stop()
+        assert status["status"] == FAILED
+        assert "backend down" in status["error"]
+
+    @pytest.mark.asyncio
+    async def test_resumes_from_stored_chunks_after_restart(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=3, retention=0)
+        manager.store.create("job1", ["name"], "block", text=TEXT)
+        manager.store.save_chunk("job1", 0, [{"type": "name", "original": "Ann", "start": 5, "end": 8}])
+        manager.store.update(
+            "job1",
+            status="detecting",
+            chunk_size=settings.LLM_CHUNK_SIZE,
+            chunk_overlap=settings.LLM_CHUNK_OVERLAP,
+        )
+
+        service = fake_service()
+        with patch("backend.app.llm_service.llm_service", service):
+            manager.start()
+            status = await finish(manager, "job1")
+        await manager.stop()
+
+        assert service.calls == [{0}]
+        assert status["status"] == DONE
+        assert status["result"]["masked_text"] == "Call ████ on 555-1234."
+
+    @pytest.mark.asyncio
+    async def test_purges_old_jobs(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=3, retention=60)
+        manager.store.create("old", ["name"], "block", text=TEXT)
+        manager.store.update("old", status=DONE)
+        manager.store._db.execute("UPDATE jobs SET updated = ?", (time.time() - 3600,))
+        manager.start()
+        assert manager.status("old") is None
+        await manager.stop()
+
+
+class TestJobsEndpoint:
+    @pytest.fixture(autouse=True)
+    def manager(self, tmp_path):
+        manager = JobManager(str(tmp_path), workers=1, max_attempts=3, retention=0)
+        with patch("backend.app.main.job_manager", manager):
+            yield manager
+
+    def test_file_job(self, tmp_path):
+        with patch("backend.app.llm_service.llm_service", fake_service()), TestClient(app) as client:
+            response = client.post(
+                "/api/jobs",
+                files={"file": ("call.txt", io.BytesIO(TEXT.encode()), "text/plain")},
+                data={"categories": ["name"], "strategy": "tag"},
+            )
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+
+            for _ in range(100):
+                status = client.get(f"/api/jobs/{job_id}").json()
+                if status["status"] in (DONE, FAILED):
+                    break
+                time.sleep(0.02)
+        assert status["status"] == DONE
+        assert status["filename"] == "call.txt"
+        assert status["result"]["masked_text"] == "Call [NAME_1] on 555-1234."
+        assert list((tmp_path / "uploads").iterdir()) == []
+
+    def test_unknown_job(self, tmp_path):
+        client = TestClient(app)
+        assert client.get("/api/jobs/missing").status_code == 404
+        assert (tmp_path / "jobs.db").exists()
+
+    def test_requires_file_or_text(self):
+        client = TestClient(app)
+        response = client.post("/api/jobs", data={"text": "  "})
+        assert response.status_code == 400
+
+    def test_unsupported_file(self):
+        client = TestClient(app)
+        response = client.post("/api/jobs", files={"file": ("a.exe", io.BytesIO(b"x"))})
+        assert response.status_code == 400
@@ -0,0 +1,214 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from backend.app.llm_router import LLMBackend, LLMRouter, NoBackendAvailable, load_backends, parse_backends
+
+
+def make_backend(name, content="ok", side_effect=None, role="primary", max_inflight=2, mode="local"):
+    client = MagicMock()
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    client.chat.completions.create = AsyncMock(return_value=response, side_effect=side_effect)
+    client.models.list = AsyncMock()
+    client.close = AsyncMock()
+    return LLMBackend(name, client, f"model-{name}", mode=mode, max_inflight=max_inflight, role=role)
+
+
+def content_of(response):
+    return response.choices[0].message.content
+
+
+class TestPick:
+    def test_least_outstanding(self):
+        a, b = make_backend("a"), make_backend("b")
+        a.outstanding = 1
+        router = LLMRouter([a, b])
+        assert router.pick() is b
+
+    def test_latency_strategy_prefers_faster_backend(self):
+        slow, fast = make_backend("slow"), make_backend("fast")
+        slow.ewma_latency, fast.ewma_latency = 4.0, 1.0
+        fast.outstanding = 1
+        assert LLMRouter([slow, fast], strategy="latency").pick() is fast
+
+    def test_overflow_only_when_primaries_saturated(self):
+        local = make_backend("local", max_inflight=1)
+        cloud = make_backend("cloud", role="overflow", mode="cloud")
+        router = LLMRouter([local, cloud])
+        assert router.pick() is local
+        local.outstanding = 1
+        assert router.pick() is cloud
+        cloud.outstanding = cloud.max_inflight
+        # Everything is saturated: queue on the local backend
+        assert router.pick() is local
+
+    def test_skips_open_circuit_and_unhealthy(self):
+        a, b, c = make_backend("a"), make_backend("b"), make_backend("c")
+        with patch("backend.app.llm_router.settings.LLM_CIRCUIT_FAILURES", 1):
+            a.record_failure()
+        b.healthy = False
+        assert LLMRouter([a, b, c]).pick() is c
+        assert LLMRouter([a, b]).pick() is None
+
+
+class TestComplete:
+    @pytest.mark.asyncio
+    async def test_sends_backend_model_and_cloud_params(self):
+        cloud = make_backend("cloud", mode="cloud")
+        router = LLMRouter([cloud])
+        await router.complete([{"role": "user", "content": "hi"}], temperature=0)
+        kwargs = cloud.client.chat.completions.create.call_args.kwargs
+        assert kwargs["model"] == "model-cloud"
+        assert kwargs["temperature"] == 0
+        assert kwargs["extra_body"] == {"enable_thinking": False}
+        assert cloud.outstanding == 0
+        assert cloud.ewma_latency > 0
+
+    @pytest.mark.asyncio
+    async def test_fails_over_to_another_backend(self):
+        bad = make_backend("bad", side_effect=ConnectionError("down"))
+        good = make_backend("good", content="from good")
+        router = LLMRouter([bad, good])
+        response = await router.complete([])
+        assert content_of(response) == "from good"
+        assert bad.failures == 1
+        assert bad.outstanding == 0
+
+    @pytest.mark.asyncio
+    async def test_raises_last_error_when_all_fail(self):
+        router = LLMRouter([make_backend("a", side_effect=ConnectionError("down"))])
+        with pytest.raises(ConnectionError):
+            await router.complete([])
+
+    @pytest.mark.asyncio
+    async def test_no_backend_available(self):
+        backend = make_backend("a")
+        backend.healthy = False
+        with pytest.raises(NoBackendAvailable):
+            await LLMRouter([backend]).complete([])
+
+    @pytest.mark.asyncio
+    @patch.multiple(
+        "backend.app.llm_router.settings",
+        LLM_HEDGE_ENABLED=True,
+        LLM_HEDGE_MIN_SAMPLES=1,
+    )
+    async def test_hedges_slow_call(self):
+        slow = make_backend("slow")
+        fast = make_backend("fast", content="hedged")
+        slow.record_success(0.01)
+        fast.outstanding = 1  # make sure the slow backend is picked first
+
+        async def hang(**kwargs):
+            await asyncio.sleep(10)
+
+        slow.client.chat.completions.create = AsyncMock(side_effect=hang)
+        response = await asyncio.wait_for(LLMRouter([slow, fast]).complete([]), 2)
+        assert content_of(response) == "hedged"
+        await asyncio.sleep(0)
+        assert slow.outstanding == 0
+        assert slow.failures == 0
+
+
+class TestStructuredOutput:
+    SCHEMA = {"type": "object"}
+
+    def test_auto_picks_by_mode(self):
+        assert LLMBackend("a", None, "m", mode="local", structured_output="auto").structured_output == "json_schema"
+        assert LLMBackend("b", None, "m", mode="cloud", structured_output="auto").structured_output == "json_object"
+
+    def test_request_params(self):
+        cloud = LLMBackend("c", None, "m", mode="cloud", structured_output="json_object")
+        assert cloud.request_params(self.SCHEMA) == {
+            "response_format": {"type": "json_object"},
+            "extra_body": {"enable_thinking": False},
+        }
+        guided = LLMBackend("g", None, "m", structured_output="guided_json")
+        assert guided.request_params(self.SCHEMA) == {"extra_body": {"guided_json": self.SCHEMA}}
+        off = LLMBackend("o", None, "m")
+        assert off.request_params(self.SCHEMA) == {}
+
+    @pytest.mark.asyncio
+    async def test_schema_is_passed_through(self):
+        backend = make_backend("a")
+        backend.structured_output = "json_schema"
+        await LLMRouter([backend]).complete([], schema=self.SCHEMA)
+        kwargs = backend.client.chat.completions.create.call_args.kwargs
+        assert kwargs["response_format"]["json_schema"]["schema"] == self.SCHEMA
+        assert "schema" not in kwargs
+
+
+class TestHealth:
+    @pytest.mark.asyncio
+    async def test_check_health_marks_backends(self):
+        a, b = make_backend("a"), make_backend("b")
+        b.client.models.list = AsyncMock(side_effect=ConnectionError("down"))
+        router = LLMRouter([a, b])
+        await router.check_health()
+        assert a.healthy and not b.healthy
+
+        b.client.models.list = AsyncMock()
+        await router.check_health()
+        assert b.healthy
+
+    def test_circuit_closes_after_success(self):
+        backend = make_backend("a")
+        with patch("backend.app.llm_router.settings.LLM_CIRCUIT_FAILURES", 2):
+            backend.record_failure()
+            assert backend.available(backend.open_until)
+            backend.record_failure()
+        assert backend.open_until > 0
+        backend.record_success(0.5)
+        assert backend.failures == 0 and backend.open_until == 0
+
+    @pytest.mark.asyncio
+    async def test_half_open_circuit_lets_one_trial_call_through(self):
+        release = asyncio.Event()
+        backend = make_backend("a")
+        create = backend.client.chat.completions.create
+
+        async def slow_trial(**kwargs):
+            await release.wait()
+            return create.return_value
+
+        with patch("backend.app.llm_router.settings.LLM_CIRCUIT_FAILURES", 1):
+            backend.record_failure()
+        backend.open_until = 1e-9
+        create.side_effect = slow_trial
+        router = LLMRouter([backend])
+        trial = asyncio.create_task(router.complete([]))
+        await asyncio.sleep(0)
+        with pytest.raises(NoBackendAvailable):
+            await router.complete([])
+        release.set()
+        await trial
+        assert backend.open_until == 0
+        assert content_of(await router.complete([])) == "ok"
+
+
+class TestLoadBackends:
+    def test_default_single_backend(self):
+        with patch.multiple(
+            "backend.app.llm_router.settings", LLM_BACKENDS="", LLM_MODEL="m", LLM_MODE="local"
+        ):
+            backends = load_backends()
+        assert [(b.name, b.model, b.mode) for b in backends] == [("default", "m", "local")]
+
+    def test_backends_from_json(self):
+        spec = [
+            {"name": "v1", "base_url": "http://v1:8001/v1", "model": "qwen", "max_inflight": 4},
+            {"base_url": "https://cloud/v1", "api_key": "k", "mode": "cloud", "role": "overflow"},
+        ]
+        with patch("backend.app.llm_router.settings.LLM_BACKENDS", json.dumps(spec)):
+            backends = load_backends()
+        assert [b.name for b in backends] == ["v1", "backend-1"]
+        assert backends[0].max_inflight == 4
+        assert backends[1].role == "overflow" and backends[1].mode == "cloud"
+
+    def test_empty_list_is_rejected(self):
+        with pytest.raises(ValueError):
+            parse_backends("[]")
@@ -1,7 +1,39 @@
+import asyncio
 import json
 import pytest
-from unittest.mock import patch, MagicMock
-from backend.app.llm_service import extract_json_from_text, LLMService
+from unittest.mock import patch, MagicMock, AsyncMock
+from backend.app.detection_cache import DetectionCache
+from backend.app.aho_corasick import AhoCorasick
+from backend.app.entity_dictionary import EntityDictionary
+from backend.app.llm_router import LLMBackend, LLMRouter
+from backend.app.llm_service import (
+    CASCADE_TRIGGERS,
+    LLMService,
+    extract_json_from_text,
+    parse_compact_detections,
+    parse_detections_json,
+)
+from backend.app.scheduler import LLMScheduler
+
+
+def make_service(content: str | None = None, side_effect=None) -> LLMService:
+    """Build an LLMService with a mocked async client, bypassing __init__."""
+    service = LLMService.__new__(LLMService)
+    service.router = LLMRouter([LLMBackend("test", MagicMock(), "qwen3-0.6b", mode="cloud")])
+    service.scheduler = LLMScheduler(4)
+    service.cache = None
+    service.entities = None
+    service.cascade_router = None
+    service.prompt_version = "v2"
+    service.output_format = "json"
+
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = content
+    service.client.chat.completions.create = AsyncMock(
+        return_value=mock_response, side_effect=side_effect
+    )
+    return service
 
 
 class TestExtractJsonFromText:
@@ -46,45 +78,92 @@ class TestExtractJsonFromText:
         assert result is not None
 
 
+class TestParseDetectionsJson:
+    def test_bare_json(self):
+        assert parse_detections_json('{"detections": []}') == {"detections": []}
+
+    def test_falls_back_to_extraction(self):
+        result = parse_detections_json('<think>x</think>\n{"detections": []}')
+        assert result == {"detections": []}
+
+    def test_non_object_is_rejected(self):
+        assert parse_detections_json("[1, 2]") is None
+
+
+class TestParseCompactDetections:
+    def test_codes_map_to_categories(self):
+        content = "1|张三\n2|138-0000-0000\n\nnot a detection\n9|unknown code\nphone|021-1234"
+        assert parse_compact_detections(content, ["name", "phone"]) == [
+            {"type": "name", "original": "张三"},
+            {"type": "phone", "original": "138-0000-0000"},
+            {"type": "phone", "original": "021-1234"},
+        ]
+
+    def test_batch_item_prefix(self):
+        content = "<think>\n</think>\n2|1|Bob\n1|1|a|b"
+        assert parse_compact_detections(content, ["name"]) == [
+            {"type": "name", "original": "Bob", "item": 2},
+            {"type": "name", "original": "a|b", "item": 1},
+        ]
+
+    @pytest.mark.parametrize("content", ['{"detections": []}', "Name: 张三", "1. 张三"])
+    def test_reply_without_valid_lines_is_a_parse_failure(self, content):
+        assert parse_compact_detections(content, ["name"]) is None
+
+    def test_empty_reply_means_no_pii(self):
+        assert parse_compact_detections("<think>\n</think>\n", ["name"]) == []
+
+
 class TestLLMServiceConfig:
-    @patch("backend.app.llm_service.settings")
-    def test_cloud_mode_init(self, mock_settings):
-        mock_settings.LLM_API_KEY = "test-key"
-        mock_settings.LLM_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-        mock_settings.LLM_MODEL = "qwen3-0.6b"
-        mock_settings.LLM_MODE = "cloud"
+    @patch.multiple(
+        "backend.app.llm_service.settings",
+        LLM_API_KEY="test-key",
+        LLM_API_BASE="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        LLM_MODEL="qwen3-0.6b",
+        LLM_MODE="cloud",
+    )
+    def test_cloud_mode_init(self):
         service = LLMService()
         assert service.mode == "cloud"
         assert service.model == "qwen3-0.6b"
 
-    @patch("backend.app.llm_service.settings")
-    def test_local_mode_init(self, mock_settings):
-        mock_settings.LLM_API_KEY = "EMPTY"
-        mock_settings.LLM_API_BASE = "http://localhost:8001/v1"
-        mock_settings.LLM_MODEL = "Qwen/Qwen3-0.6B"
-        mock_settings.LLM_MODE = "local"
+    @patch.multiple(
+        "backend.app.llm_service.settings",
+        LLM_API_KEY="EMPTY",
+        LLM_API_BASE="http://localhost:8001/v1",
+        LLM_MODEL="Qwen/Qwen3-0.6B",
+        LLM_MODE="local",
+    )
+    def test_local_mode_init(self):
         service = LLMService()
         assert service.mode == "local"
         assert service.model == "Qwen/Qwen3-0.6B"
 
+    @patch.multiple(
+        "backend.app.llm_service.settings",
+        LLM_TIMEOUT=15.0,
+        LLM_MAX_RETRIES=0,
+        LLM_POOL_SIZE=8,
+        LLM_MAX_CONCURRENCY=3,
+    )
+    def test_async_client_pool_settings(self):
+        service = LLMService()
+        assert service.client.timeout.read == 15.0
+        assert service.client.max_retries == 0
+        pool = service.client._client._transport._pool
+        assert pool._max_connections == 8
+        assert service.scheduler.max_concurrency == 3
+
 
 class TestLLMServiceDetectPII:
     @pytest.mark.asyncio
     async def test_detect_pii_mock(self):
-        service = LLMService.__new__(LLMService)
-        service.mode = "cloud"
-        service.model = "qwen3-0.6b"
-        service.client = MagicMock()
-
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = json.dumps({
+        service = make_service(json.dumps({
             "detections": [
                 {"type": "name", "original": "John Smith"},
                 {"type": "phone", "original": "138-1234-5678"}
             ]
-        })
-        service.client.chat.completions.create.return_value = mock_response
+        }))
 
         text = "My name is John Smith, phone 138-1234-5678"
         result = await service.detect_pii(text, ["name", "phone"])
@@ -95,11 +174,7 @@ class TestLLMServiceDetectPII:
 
     @pytest.mark.asyncio
     async def test_detect_pii_api_error(self):
-        service = LLMService.__new__(LLMService)
-        service.mode = "cloud"
-        service.model = "qwen3-0.6b"
-        service.client = MagicMock()
-        service.client.chat.completions.create.side_effect = Exception("API error")
+        service = make_service(side_effect=Exception("API error"))
 
         result = await service.detect_pii("test text", ["name"])
         assert "error" in result
@@ -107,15 +182,448 @@ class TestLLMServiceDetectPII:
 
     @pytest.mark.asyncio
     async def test_detect_pii_malformed_response(self):
-        service = LLMService.__new__(LLMService)
-        service.mode = "cloud"
-        service.model = "qwen3-0.6b"
-        service.client = MagicMock()
-
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = "Not valid JSON at all"
-        service.client.chat.completions.create.return_value = mock_response
+        service = make_service("Not valid JSON at all")
 
         result = await service.detect_pii("test", ["name"])
         assert "error" in result
+        # One repair attempt by default
+        assert service.client.chat.completions.create.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_malformed_response_is_repaired(self):
+        service = make_service()
+        good = MagicMock()
+        good.choices = [MagicMock()]
+        good.choices[0].message.content = '{"detections": [{"type": "name", "original": "Ann"}]}'
+        bad = MagicMock()
+        bad.choices = [MagicMock()]
+        bad.choices[0].message.content = '{"detections": [{"type": "name", "original": "Ann"'
+        service.client.chat.completions.create = AsyncMock(side_effect=[bad, good])
+
+        result = await service.detect_pii("Ann", ["name"])
+        assert "error" not in result
+        assert result["detections"][0]["original"] == "Ann"
+        assert result["usage"]["calls"] == 2
+        repair = service.client.chat.completions.create.call_args.kwargs["messages"]
+        assert repair[-2] == {"role": "assistant", "content": bad.choices[0].message.content}
+        assert "not valid JSON" in repair[-1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_structured_output_sends_schema(self):
+        service = make_service('{"detections": []}')
+        service.router.primary.structured_output = "json_schema"
+        await service.detect_pii("text", ["name"])
+        response_format = service.client.chat.completions.create.call_args.kwargs["response_format"]
+        assert response_format["type"] == "json_schema"
+        assert "detections" in response_format["json_schema"]["schema"]["properties"]
+
+    @pytest.mark.asyncio
+    async def test_detect_pii_runs_concurrently(self):
+        in_flight = 0
+        peak = 0
+
+        async def slow_create(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = '{"detections": []}'
+            return response
+
+        service = make_service()
+        service.scheduler = LLMScheduler(2)
+        service.client.chat.completions.create = AsyncMock(side_effect=slow_create)
+
+        await asyncio.gather(*(service.detect_pii("text", ["name"]) for _ in range(5)))
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    @patch.multiple(
+        "backend.app.llm_service.settings",
+        LLM_CHUNK_SIZE=40,
+        LLM_CHUNK_OVERLAP=10,
+        LLM_CHUNK_CONCURRENCY=4,
+    )
+    async def test_detect_pii_chunks_map_to_global_offsets(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "phone", "original": "021-12345678"}]
+        }))
+        text = "Contact one: 021-12345678.\nFiller line number two.\nContact two: 021-12345678."
+        result = await service.detect_pii(text, ["phone"])
+
+        assert service.client.chat.completions.create.await_count > 1
+        starts = [d["start"] for d in result["detections"]]
+        assert starts == [13, text.rindex("021-12345678")]
+        for det in result["detections"]:
+            assert text[det["start"]:det["end"]] == "021-12345678"
+
+    @pytest.mark.asyncio
+    @patch.multiple(
+        "backend.app.llm_service.settings",
+        LLM_CHUNK_SIZE=20,
+        LLM_CHUNK_OVERLAP=0,
+        LLM_CHUNK_CONCURRENCY=1,
+    )
+    async def test_failed_chunk_is_reported(self):
+        service = make_service()
+        ok = MagicMock()
+        ok.choices = [MagicMock()]
+        ok.choices[0].message.content = '{"detections": [{"type": "phone", "original": "13812345678"}]}'
+        service.client.chat.completions.create = AsyncMock(
+            side_effect=[ok, Exception("API error"), ok, ok]
+        )
+        text = "\n".join(f"Line {i}: 13812345678" for i in range(4))
+        result = await service.detect_pii(text, ["phone"])
+
+        assert service.client.chat.completions.create.await_count == 4
+        assert "API error" in result["error"]
+        assert len(result["detections"]) == 3
+
+
+class TestDetectionModes:
+    @pytest.mark.asyncio
+    @patch("backend.app.llm_service.settings.DETECTION_MODE", "rules")
+    async def test_rules_mode_skips_llm_for_rule_categories(self):
+        service = make_service('{"detections": []}')
+        result = await service.detect_pii("Call 13812345678 or a@b.com", ["phone", "email"])
+
+        service.client.chat.completions.create.assert_not_awaited()
+        assert [d["type"] for d in result["detections"]] == ["phone", "email"]
+
+    @pytest.mark.asyncio
+    @patch("backend.app.llm_service.settings.DETECTION_MODE", "rules")
+    async def test_rules_mode_sends_remaining_categories(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "name", "original": "Bob"}]
+        }))
+        result = await service.detect_pii("Bob: 13812345678", ["name", "phone"])
+
+        user_prompt = service.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert "Categories to detect: name\n" in user_prompt
+        assert [d["type"] for d in result["detections"]] == ["name", "phone"]
+
+    @pytest.mark.asyncio
+    @patch("backend.app.llm_service.settings.DETECTION_MODE", "hybrid")
+    async def test_hybrid_mode_merges_rule_and_llm_hits(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "Phone", "original": "13812345678"}]
+        }))
+        result = await service.detect_pii("Tel 13812345678, a@b.com", ["phone", "email"])
+
+        service.client.chat.completions.create.assert_awaited_once()
+        assert [(d["type"], d["start"]) for d in result["detections"]] == [
+            ("Phone", 4),
+            ("email", 17),
+        ]
+
+
+class TestDetectionCacheIntegration:
+    @pytest.mark.asyncio
+    async def test_repeated_text_hits_cache(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "name", "original": "Bob"}]
+        }))
+        service.cache = DetectionCache()
+
+        first = await service.detect_pii("Bob called", ["name"])
+        second = await service.detect_pii("Bob called", ["name"])
+
+        assert first["detections"] == second["detections"]
+        assert (first["usage"]["calls"], second["usage"]["calls"]) == (1, 0)
+        service.client.chat.completions.create.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch("backend.app.llm_service.settings.DETECTION_CACHE_MIN_PARAGRAPH", 10)
+    async def test_cached_paragraph_is_not_resent(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "name", "original": "Bob"}]
+        }))
+        service.cache = DetectionCache()
+        boilerplate = "Contact Bob at the firm office."
+        await service.detect_pii(boilerplate, ["name"])
+
+        text = "New preamble line here.\n" + boilerplate
+        result = await service.detect_pii(text, ["name"])
+
+        user_prompt = service.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert boilerplate not in user_prompt
+        assert [d["start"] for d in result["detections"]] == [text.index("Bob")]
+
+
+class TestEntityDictionaryIntegration:
+    @pytest.mark.asyncio
+    @patch("backend.app.llm_service.settings.ENTITY_DICT_LEARN", True)
+    async def test_learned_entity_is_masked_and_hidden_from_model(self, tmp_path):
+        service = make_service(json.dumps({
+            "detections": [{"type": "name", "original": "Alice Wong"}]
+        }))
+        service.entities = EntityDictionary(str(tmp_path / "entities.db"))
+        await service.detect_pii("Alice Wong signed.", ["name"], tenant="m1")
+
+        service.client.chat.completions.create.return_value.choices[0].message.content = json.dumps({
+            "detections": [{"type": "name", "original": "Bob Li"}]
+        })
+        text = "Bob Li met Alice Wong."
+        result = await service.detect_pii(text, ["name"], tenant="m1")
+
+        user_prompt = service.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert "Alice Wong" not in user_prompt and "[NAME]" in user_prompt
+        assert [(d["original"], d["start"]) for d in result["detections"]] == [
+            ("Bob Li", 0), ("Alice Wong", text.index("Alice")),
+        ]
+        # Other tenants do not see m1's entities
+        assert service.entities.match("m2", text, ["name"]) == []
+
+    @pytest.mark.asyncio
+    async def test_model_detections_are_not_learned_by_default(self, tmp_path):
+        service = make_service(json.dumps({"detections": [{"type": "name", "original": "Bob"}]}))
+        service.entities = EntityDictionary(str(tmp_path / "entities.db"))
+        await service.detect_pii("Bob called", ["name"], tenant="m1")
+        assert service.entities.entries("m1") == []
+
+    @pytest.mark.asyncio
+    async def test_without_tenant_dictionary_is_unused(self, tmp_path):
+        service = make_service(json.dumps({"detections": [{"type": "name", "original": "Bob"}]}))
+        service.entities = EntityDictionary(str(tmp_path / "entities.db"))
+        await service.detect_pii("Bob called", ["name"])
+        assert service.entities.entries("") == []
+
+
+def add_cascade(service: LLMService, content: str, policy=CASCADE_TRIGGERS) -> AsyncMock:
+    """Give service a mocked cascade backend answering content; return its create mock."""
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=response)
+    service.cascade_router = LLMRouter([LLMBackend("large", client, "qwen3-4b", mode="cloud")])
+    service.cascade_policy = frozenset(policy)
+    service.cascade_anchors = AhoCorasick(["电话", "email"])
+    return client.chat.completions.create
+
+
+class TestCascade:
+    @pytest.mark.asyncio
+    async def test_confident_chunk_is_not_escalated(self):
+        service = make_service(json.dumps({
+            "detections": [{"type": "name", "original": "Bob"}, {"type": "phone", "original": "13812345678"}]
+        }))
+        large = add_cascade(service, '{"detections": []}')
+
+        result = await service.detect_pii("Bob 电话 13812345678", ["name", "phone"])
+        large.assert_not_awaited()
+        assert "escalations" not in result["usage"]
+
+    @pytest.mark.asyncio
+    async def test_anchor_without_nearby_detection_escalates(self):
+        service = make_service('{"detections": []}')
+        large = add_cascade(service, json.dumps({"detections": [{"type": "name", "original": "王芳"}]}))
+
+        result = await service.detect_pii("联系电话：王芳", ["name"])
+        large.assert_awaited_once()
+        assert [d["original"] for d in result["detections"]] == ["王芳"]
+        assert result["usage"]["escalations"] == 1
+        assert result["usage"]["calls"] == 2
+
+    @pytest.mark.asyncio
+    async def test_rule_hits_missed_by_model_escalate_and_merge(self):
+        service = make_service(json.dumps({"detections": [{"type": "name", "original": "Bob"}]}))
+        large = add_cascade(
+            service, json.dumps({"detections": [{"type": "phone", "original": "13812345678"}]}), {"rules"}
+        )
+
+        result = await service.detect_pii("Bob 13812345678", ["name", "phone"])
+        large.assert_awaited_once()
+        assert [d["original"] for d in result["detections"]] == ["Bob", "13812345678"]
+
+    @pytest.mark.asyncio
+    async def test_parse_failure_escalates(self):
+        service = make_service("Not valid JSON at all")
+        add_cascade(service, json.dumps({"detections": [{"type": "name", "original": "Ann"}]}))
+
+        result = await service.detect_pii("Ann", ["name"])
+        assert "error" not in result
+        assert result["detections"][0]["original"] == "Ann"
+
+    @pytest.mark.asyncio
+    async def test_failed_escalation_keeps_primary_result(self):
+        service = make_service('{"detections": []}')
+        large = add_cascade(service, "")
+        large.side_effect = Exception("down")
+
+        result = await service.detect_pii("email: none", ["name"])
+        assert "error" not in result
+        assert result["detections"] == []
+        assert result["usage"]["escalations"] == 1
+
+    @pytest.mark.asyncio
+    async def test_latin_anchor_needs_whole_word(self):
+        service = make_service('{"detections": []}')
+        large = add_cascade(service, '{"detections": []}', {"anchors"})
+        service.cascade_anchors = AhoCorasick(["tel"])
+
+        await service.detect_pii("Hilton hotel offers telecom deals", ["name"])
+        large.assert_not_awaited()
+        await service.detect_pii("Tel: none given", ["name"])
+        large.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_trigger_outside_policy_is_ignored(self):
+        service = make_service("Not valid JSON at all")
+        large = add_cascade(service, '{"detections": []}', {"anchors"})
+
+        result = await service.detect_pii("Ann", ["name"])
+        large.assert_not_awaited()
+        assert "error" in result
+
+
+class TestPrefilterIntegration:
+    @pytest.mark.asyncio
+    @patch("backend.app.prefilter.settings.PREFILTER_THRESHOLD", 1.0)
+    async def test_pii_free_text_skips_model(self):
+        service = make_service('{"detections": []}')
+        result = await service.detect_pii("第十二条 合同应当依法履行。", ["name", "phone"])
+
+        service.client.chat.completions.create.assert_not_awaited()
+        assert result["detections"] == []
+        assert result["usage"]["calls"] == 0
+
+    @pytest.mark.asyncio
+    @patch("backend.app.prefilter.settings.PREFILTER_THRESHOLD", 1.0)
+    @patch("backend.app.llm_service.settings.DETECTION_MODE", "hybrid")
+    async def test_skipped_batch_item_keeps_rule_hits(self):
+        service = make_service(json.dumps({"detections": [{"type": "name", "original": "张律师"}]}))
+        results = await service.detect_pii_batch(
+            ["合同应当依法履行。", "张律师", "Call 13812345678"], [["name", "phone"]] * 3
+        )
+
+        # Only the item with a name signal is sent; the phone is a rule hit
+        service.client.chat.completions.create.assert_awaited_once()
+        assert results[0]["detections"] == []
+        assert [d["original"] for d in results[1]["detections"]] == ["张律师"]
+        assert [d["type"] for d in results[2]["detections"]] == ["phone"]
+
+
+class TestDetectPiiStream:
+    @pytest.mark.asyncio
+    @patch.multiple("backend.app.llm_service.settings", LLM_CHUNK_SIZE=20, LLM_CHUNK_OVERLAP=0)
+    async def test_yields_each_chunk_with_global_offsets(self):
+        service = make_service(json.dumps({"detections": [{"type": "name", "original": "Bob"}]}))
+        text = "Bob is first here.\nThen comes Bob again"
+        results = [item async for item in service.detect_pii_stream(text, ["name"])]
+
+        assert sorted(index for index, _, _ in results) == [0, 1]
+        for _, chunk, result in results:
+            for det in result["detections"]:
+                assert chunk.start <= det["start"] < chunk.end
+                assert text[det["start"]:det["end"]] == "Bob"
+
+
+class TestDetectPiiBatch:
+    @pytest.mark.asyncio
+    async def test_packs_items_into_one_call_and_demultiplexes(self):
+        service = make_service(json.dumps({
+            "detections": [
+                {"type": "name", "original": "Bob", "item": 1},
+                {"type": "name", "original": "Alice", "item": 2},
+                {"type": "name", "original": "Carol"},
+            ]
+        }))
+        texts = ["Bob and Alice", "Alice wrote", "Carol here"]
+        results = await service.detect_pii_batch(texts, [["name"]] * 3)
+
+        service.client.chat.completions.create.assert_awaited_once()
+        user_prompt = service.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert "### ITEM 3\nCarol here" in user_prompt
+        # "Alice" was tagged for item 2 only
+        assert [d["original"] for d in results[0]["detections"]] == ["Bob"]
+        assert results[1]["detections"] == [{"type": "name", "original": "Alice", "start": 0, "end": 5}]
+        assert results[2]["detections"][0]["original"] == "Carol"
+
+    @pytest.mark.asyncio
+    @patch.multiple("backend.app.llm_service.settings", LLM_BATCH_PACK_ITEMS=2)
+    async def test_splits_packs_and_groups_by_categories(self):
+        service = make_service('{"detections": []}')
+        results = await service.detect_pii_batch(
+            ["a", "b", "c", "d", ""],
+            [["name"], ["name"], ["name"], ["address"], ["name"]],
+        )
+        # name: packs of 2 + 1, address: 1; the empty item is skipped
+        assert service.client.chat.completions.create.await_count == 3
+        assert results[4] == {"detections": []}
+
+    @pytest.mark.asyncio
+    async def test_pack_error_is_reported_per_item(self):
+        service = make_service(side_effect=Exception("API error"))
+        results = await service.detect_pii_batch(["a", "b"], [["name"], ["name"]])
+        assert all(r["error"] == "API error" for r in results)
+
+
+class TestCompactOutput:
+    @pytest.mark.asyncio
+    async def test_detect_pii_with_compact_prompt(self):
+        service = make_service("1|Ann\n2|555-1234")
+        service.prompt_version, service.output_format = "v3", "compact"
+        service.router.primary.structured_output = "json_schema"
+
+        result = await service.detect_pii("Ann: 555-1234", ["name", "phone"])
+        assert [(d["type"], d["start"], d["end"]) for d in result["detections"]] == [
+            ("name", 0, 3), ("phone", 5, 13),
+        ]
+        kwargs = service.client.chat.completions.create.call_args.kwargs
+        assert "response_format" not in kwargs
+        assert "1=name\n2=phone" in kwargs["messages"][1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_batch_demultiplexes_compact_items(self):
+        service = make_service("2|1|Bob\n1|1|Ann")
+        service.prompt_version, service.output_format = "v3", "compact"
+        results = await service.detect_pii_batch(["Ann", "Bob"], [["name"], ["name"]])
+        assert results[0]["detections"][0]["original"] == "Ann"
+        assert results[1]["detections"][0]["original"] == "Bob"
+        user_prompt = service.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert "n|CODE|EXACT_SUBSTRING" in user_prompt
+
+    @pytest.mark.asyncio
+    async def test_malformed_compact_reply_is_repaired_then_fails(self):
+        service = make_service("Name: Ann")
+        service.prompt_version, service.output_format = "v3", "compact"
+
+        result = await service.detect_pii("Ann", ["name"])
+        assert result["error"] == "Failed to parse LLM response as JSON"
+        assert result["detections"] == []
+        calls = service.client.chat.completions.create.call_args_list
+        assert len(calls) == 2
+        assert "CODE|EXACT_SUBSTRING" in calls[1].kwargs["messages"][-1]["content"]
+
+
+class TestPromptLayout:
+    @pytest.mark.asyncio
+    async def test_system_prompt_is_static_prefix(self):
+        from backend.app.prompts import SYSTEM_PROMPT_V2
+        service = make_service('{"detections": []}')
+        service.router.primary.mode = "local"
+        await service.detect_pii("first text", ["name"])
+        await service.detect_pii("second text", ["phone", "custom rule"])
+
+        calls = service.client.chat.completions.create.call_args_list
+        systems = [c.kwargs["messages"][0]["content"] for c in calls]
+        assert systems == [SYSTEM_PROMPT_V2, SYSTEM_PROMPT_V2]
+        assert "{USER_DEFINED_CATEGORIES}" not in SYSTEM_PROMPT_V2
+        assert "Categories to detect: phone, custom rule" in calls[1].kwargs["messages"][1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_usage_is_reported_per_request(self):
+        service = make_service('{"detections": []}')
+        response = service.client.chat.completions.create.return_value
+        response.usage.prompt_tokens = 1200
+        response.usage.completion_tokens = 10
+        response.usage.prompt_tokens_details.cached_tokens = 1000
+
+        result = await service.detect_pii("text", ["name"])
+        assert result["usage"] == {
+            "calls": 1, "prompt_tokens": 1200, "cached_tokens": 1000, "completion_tokens": 10,
+        }
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import pytest
+
+from backend.app.masking import MaskRenderer, merge_spans, render_masked_text
+
+
+def det(t, start, end):
+    return {"type": t, "original": "", "start": start, "end": end}
+
+
+class TestMergeSpans:
+    def test_overlapping_spans_merge(self):
+        spans = merge_spans([det("Social_Media", 4, 12), det("Email", 0, 10), det("Name", 20, 23)], 30)
+        assert spans == [(0, 12, "Email"), (20, 23, "Name")]
+
+    def test_out_of_range_spans_dropped(self):
+        assert merge_spans([det("Name", 5, 50), det("Name", 3, 3)], 10) == []
+
+
+class TestRenderMaskedText:
+    text = "Alice 13812345678 Alice a@b.com"
+    dets = [det("Name", 0, 5), det("Phone", 6, 17), det("Name", 18, 23), det("Email", 24, 31)]
+
+    def test_block(self):
+        assert render_masked_text(self.text, self.dets) == "████ ████ ████ ████"
+
+    def test_same_email_detected_twice_masks_once(self):
+        text = "mail a@b.com now"
+        dets = [det("Email", 5, 12), det("Social_Media", 5, 12)]
+        assert render_masked_text(text, dets) == "mail ████ now"
+
+    def test_tag(self):
+        assert render_masked_text(self.text, self.dets, "tag") == "[NAME_1] [PHONE_1] [NAME_1] [EMAIL_1]"
+
+    def test_length(self):
+        masked = render_masked_text(self.text, self.dets, "length")
+        assert len(masked) == len(self.text)
+        assert masked.startswith("█████ ")
+
+    def test_partial(self):
+        text = "Tel 138-1234-5678"
+        assert render_masked_text(text, [det("Phone", 4, 17)], "partial") == "Tel ***-****-5678"
+
+    def test_partial_fully_masks_names_emails_and_short_values(self):
+        text = "张三住在北京市朝阳区，邮箱a@b.cn，卡号12345678"
+        dets = [det("Name", 0, 2), det("Address", 4, 10), det("Email", 13, 19), det("Bank_Card", 22, 30)]
+        assert render_masked_text(text, dets, "partial") == "████住在████，邮箱████，卡号████"
+
+    @patch("backend.app.masking.settings.MASK_PSEUDONYM_SECRET", "k")
+    def test_pseudonym_is_deterministic(self):
+        masked = render_masked_text(self.text, self.dets, "pseudonym")
+        names = [w for w in masked.split() if w.startswith("NAME_")]
+        assert len(names) == 2 and names[0] == names[1]
+        assert masked == render_masked_text(self.text, self.dets, "pseudonym")
+
+    @patch("backend.app.masking.settings.MASK_PSEUDONYM_SECRET", "")
+    def test_pseudonym_needs_secret(self):
+        with pytest.raises(ValueError):
+            MaskRenderer("pseudonym")
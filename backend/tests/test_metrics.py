@@ -0,0 +1,129 @@
+import io
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+from backend.app import metrics
+from backend.app.llm_service import parse_detections_json
+from backend.app.main import app
+
+client = TestClient(app)
+
+
+class TestMetricTypes:
+    def test_counter_render(self):
+        counter = metrics.Counter("test_events_total", "Test events.", ("kind",))
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        counter.inc('b"')
+        text = metrics.render()
+        assert "# TYPE test_events_total counter" in text
+        assert 'test_events_total{kind="a"} 3' in text
+        assert 'test_events_total{kind="b\\""} 1' in text
+
+    def test_gauge_keeps_last_value(self):
+        gauge = metrics.Gauge("test_ratio", "Test ratio.")
+        gauge.set(0.25)
+        gauge.set(0.5)
+        text = metrics.render()
+        assert "# TYPE test_ratio gauge" in text
+        assert "test_ratio 0.5" in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_latency_seconds", "Test latency.", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        lines = [l for l in metrics.render().splitlines() if l.startswith("test_latency_seconds")]
+        assert lines == [
+            'test_latency_seconds_bucket{le="0.1"} 1',
+            'test_latency_seconds_bucket{le="1"} 3',
+            'test_latency_seconds_bucket{le="+Inf"} 4',
+            "test_latency_seconds_sum 6.05",
+            "test_latency_seconds_count 4",
+        ]
+
+    def test_disabled(self):
+        counter = metrics.Counter("test_disabled_total", "Disabled.")
+        with patch("backend.app.metrics.settings.METRICS_ENABLED", False):
+            counter.inc()
+        assert counter.value() == 0
+
+    def test_stage_timings(self):
+        histogram = metrics.Histogram("test_stage_seconds", "Stage.")
+        with metrics.collect_timings() as timings:
+            with metrics.timed(histogram, stage="parse"):
+                pass
+            metrics.record_stage("llm", 0.25)
+            metrics.record_stage("llm", 0.25)
+        assert histogram.count() == 1
+        header = metrics.format_server_timing(timings)
+        assert 'llm;dur=500.0;desc="2x"' in header
+        assert header.startswith("parse;dur=")
+        # Outside a request nothing is collected
+        metrics.record_stage("llm", 1.0)
+
+
+class TestInstrumentation:
+    def test_reply_parse_strategy(self):
+        before = metrics.REPLY_PARSE.value("code_block")
+        parse_detections_json('```json\n{"detections": []}\n```')
+        assert metrics.REPLY_PARSE.value("code_block") == before + 1
+
+    def test_detection_types_are_bounded(self):
+        before = metrics.DETECTIONS.value("other")
+        metrics.count_detections([{"type": "Custom: project codes"}, {"type": "Phone"}])
+        assert metrics.DETECTIONS.value("other") == before + 1
+
+    def test_upload_metrics(self):
+        before = metrics.PARSE_SECONDS.count(".txt")
+        response = client.post("/api/upload", files={"file": ("a.txt", io.BytesIO(b"hello"), "text/plain")})
+        assert response.status_code == 200
+        assert metrics.PARSE_SECONDS.count(".txt") == before + 1
+
+        failures = metrics.PARSE_FAILURES.value("other", "unsupported")
+        client.post("/api/upload", files={"file": ("a.exe", io.BytesIO(b"x"), "application/octet-stream")})
+        assert metrics.PARSE_FAILURES.value("other", "unsupported") == failures + 1
+
+
+class TestEndpoints:
+    def test_metrics_endpoint(self):
+        response = client.get("/api/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE pii_llm_request_seconds histogram" in response.text
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_server_timing_header(self, mock_llm):
+        async def detect(text, categories, tenant=None):
+            metrics.record_stage("llm", 0.1)
+            return {"detections": [{"type": "name", "original": "Ann", "start": 0, "end": 3}]}
+
+        mock_llm.detect_pii = AsyncMock(side_effect=detect)
+        with patch("backend.app.metrics.settings.METRICS_SERVER_TIMING", True):
+            response = client.post("/api/mask", json={"text": "Ann", "categories": ["name"]})
+        assert response.status_code == 200
+        timing = response.headers["server-timing"]
+        assert 'llm;dur=100.0;desc="1x"' in timing
+        assert "mask;dur=" in timing
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_no_server_timing_by_default(self, mock_llm):
+        mock_llm.detect_pii = AsyncMock(return_value={"detections": []})
+        response = client.post("/api/mask", json={"text": "Ann", "categories": ["name"]})
+        assert "server-timing" not in response.headers
+
+    @patch("backend.app.llm_service.llm_service")
+    def test_prompt_tokens_are_observed_once_per_request(self, mock_llm):
+        async def detect(text, categories, tenant=None):
+            metrics.record_prompt_tokens(1200)
+            metrics.record_prompt_tokens(800)
+            return {"detections": []}
+
+        mock_llm.detect_pii = AsyncMock(side_effect=detect)
+        requests = metrics.REQUEST_PROMPT_TOKENS.count()
+        response = client.post("/api/mask", json={"text": "Ann", "categories": ["name"]})
+        assert response.status_code == 200
+        assert metrics.REQUEST_PROMPT_TOKENS.count() == requests + 1
+        # One observation of 2000 tokens, not two of 1200 and 800
+        counts, _ = metrics.REQUEST_PROMPT_TOKENS._series[()]
+        assert counts[metrics.REQUEST_TOKEN_BUCKETS.index(2048)] >= 1
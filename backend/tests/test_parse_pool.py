@@ -0,0 +1,92 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+from fastapi import UploadFile
+
+from backend.app import parse_pool as parse_pool_module
+from backend.app.parse_pool import ParsePool, UploadTooLarge, spool_upload
+
+
+def make_upload(content: bytes, filename: str = "doc.txt") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+class TestSpoolUpload:
+    @pytest.mark.asyncio
+    async def test_spools_to_temp_file(self):
+        path = await spool_upload(make_upload(b"hello"), max_bytes=100)
+        try:
+            assert path.endswith(".txt")
+            with open(path, "rb") as f:
+                assert f.read() == b"hello"
+        finally:
+            os.unlink(path)
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_upload(self, monkeypatch):
+        monkeypatch.setattr(parse_pool_module, "SPOOL_BLOCK_SIZE", 4)
+        with pytest.raises(UploadTooLarge):
+            await spool_upload(make_upload(b"x" * 20), max_bytes=10)
+
+
+class TestParsePool:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("kind", ["inline", "thread", "process"])
+    async def test_parses_file(self, kind, tmp_path):
+        path = tmp_path / "a.csv"
+        path.write_bytes(b"name,phone\nAlice,123\n")
+        pool = ParsePool(kind=kind, workers=1, max_tasks_per_child=1, timeout=30)
+        try:
+            text = await pool.parse("a.csv", str(path))
+        finally:
+            pool.shutdown()
+        assert "Alice" in text
+
+    @pytest.mark.asyncio
+    async def test_timeout_recycles_executor(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(parse_pool_module, "parse_file", lambda filename, path: time.sleep(0.5))
+        pool = ParsePool(kind="thread", workers=1, max_tasks_per_child=0, timeout=0.05)
+        first = pool.executor
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.parse("a.txt", str(tmp_path / "a.txt"))
+        assert pool.executor is not first
+        pool.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_timeout_terminates_process_workers(self):
+        pool = ParsePool(kind="process", workers=1, max_tasks_per_child=0, timeout=1)
+        task = asyncio.create_task(pool.run(time.sleep, 30))
+        await asyncio.sleep(0.5)
+        workers = list(pool.executor._processes.values())
+        with pytest.raises(asyncio.TimeoutError):
+            await task
+        assert workers
+        assert not any(process.is_alive() for process in workers)
+        pool.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_long_pdf_is_split_into_page_ranges(self, monkeypatch, tmp_path):
+        from backend.benchmarks.corpus import make_pdf
+        monkeypatch.setattr(parse_pool_module.settings, "PDF_PARALLEL_MIN_PAGES", 2)
+        submitted = []
+        original = parse_pool_module.pdf_page_texts
+
+        def page_texts(path, first, stop):
+            submitted.append((first, stop))
+            return original(path, first, stop)
+
+        monkeypatch.setattr(parse_pool_module, "pdf_page_texts", page_texts)
+        path = tmp_path / "long.pdf"
+        path.write_bytes(make_pdf("\n".join(f"line {i}" for i in range(5)), lines_per_page=1))
+        pool = ParsePool(kind="thread", workers=2, max_tasks_per_child=0, timeout=30)
+        try:
+            extraction = await pool.extract("long.pdf", str(path))
+            text = await pool.parse("long.pdf", str(path))
+        finally:
+            pool.shutdown()
+        assert set(submitted) == {(0, 3), (3, 5)}
+        assert text == extraction.text == parse_pool_module.parse_file("long.pdf", str(path))
+        assert [span.location for span in extraction.spans] == [(i,) for i in range(5)]
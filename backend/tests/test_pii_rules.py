@@ -0,0 +1,58 @@
+from backend.app.pii_rules import (
+    detect_rules,
+    is_luhn_valid,
+    is_valid_id_number,
+    rule_categories,
+)
+
+ALL_RULES = ["phone", "email", "id_number", "bank_card"]
+
+
+class TestValidators:
+    def test_id_number_checksum(self):
+        assert is_valid_id_number("11010519491231002X")
+        assert is_valid_id_number("11010519491231002x")
+        assert not is_valid_id_number("110105194912310021")
+
+    def test_id_number_legacy_15_digits(self):
+        assert is_valid_id_number("110105491231002")
+        assert not is_valid_id_number("110105491331002")
+
+    def test_luhn(self):
+        assert is_luhn_valid("4111111111111111")
+        assert not is_luhn_valid("4111111111111112")
+
+
+class TestDetectRules:
+    def test_contact_block(self):
+        text = "电话: 021-12345678 / 13812345678 传真: (021) 5080-1234 邮箱: a@firm.com; b.c@firm.cn"
+        dets = detect_rules(text, ALL_RULES)
+        assert [(d["type"], d["original"]) for d in dets] == [
+            ("phone", "021-12345678"),
+            ("phone", "13812345678"),
+            ("phone", "(021) 5080-1234"),
+            ("email", "a@firm.com"),
+            ("email", "b.c@firm.cn"),
+        ]
+        for det in dets:
+            assert text[det["start"]:det["end"]] == det["original"]
+
+    def test_id_and_bank_card_adjacent_to_chinese(self):
+        text = "身份证11010519491231002X，卡号4111 1111 1111 1111，尾号6222021234567890"
+        dets = detect_rules(text, ALL_RULES)
+        assert [(d["type"], d["original"]) for d in dets] == [
+            ("id_number", "11010519491231002X"),
+            ("bank_card", "4111 1111 1111 1111"),
+        ]
+
+    def test_excludes_dates_and_case_numbers(self):
+        text = "2026-02-10 签署，案号 (2024)沪0101民初123号，金额 100000 元"
+        assert detect_rules(text, ALL_RULES) == []
+
+    def test_only_requested_categories_keep_spelling(self):
+        text = "Email: a@b.com Phone: 13812345678"
+        dets = detect_rules(text, ["Email", "name"])
+        assert [(d["type"], d["original"]) for d in dets] == [("Email", "a@b.com")]
+
+    def test_rule_categories(self):
+        assert rule_categories(["Phone", "name", "email"]) == {"phone", "email"}
@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+import pytest
+
+from backend.app import metrics
+from backend.app.prefilter import chunk_features, screens, should_skip
+
+CATEGORIES = ["name", "phone", "email", "address"]
+
+
+class TestFeatures:
+    @pytest.mark.parametrize("text", [
+        "联系电话：021-12345678",
+        "Tel: see below",
+        "请发送至 a@b.com",
+        "身份证号一一零一零五一九四九",
+        "张律师认为合同有效",
+        "李某于当日签收",
+        "Mr. Smith agreed",
+        "送达至中山路100号",
+        "李明与赵强于2024年签订协议",
+        "John Smith signed the agreement.",
+        "住在北京市朝阳区",
+    ])
+    def test_pii_signals_reach_threshold(self, text):
+        assert chunk_features(text).score >= 1
+
+    @pytest.mark.parametrize("text", [
+        "第十二条 合同当事人应当遵守合同约定，不得擅自变更或者解除合同。",
+        "The parties shall perform the contract in good faith at the hotel.",
+        "合计 1,234.56 7,890.12 100.00",
+        "诉讼程序的规定适用于本章。",
+        "The Company shall keep records.",
+    ])
+    def test_pii_free_text_scores_low(self, text):
+        assert chunk_features(text).score < 1
+
+    def test_ascii_anchor_needs_word_boundary(self):
+        assert chunk_features("hotel intel").anchors == 0
+        assert chunk_features("tel: x").anchors == 1
+
+    def test_digit_density(self):
+        features = chunk_features("12 ab")
+        assert features.digit_density == 0.5
+        assert features.digit_runs == 0
+
+
+class TestShouldSkip:
+    def test_disabled_by_default(self):
+        with patch("backend.app.prefilter.settings.PREFILTER_THRESHOLD", 0):
+            assert not should_skip("第十二条 合同应当履行。", CATEGORIES)
+
+    @patch("backend.app.prefilter.settings.PREFILTER_THRESHOLD", 1.0)
+    def test_skips_below_threshold_and_records_ratio(self):
+        skipped = metrics.PREFILTER_CHUNKS.value("skipped")
+        assert should_skip("第十二条 合同应当履行。", CATEGORIES)
+        assert not should_skip("电话：13812345678", CATEGORIES)
+        assert metrics.PREFILTER_CHUNKS.value("skipped") == skipped + 1
+        assert metrics.PREFILTER_THRESHOLD.value() == 1.0
+        assert 0 < metrics.PREFILTER_SKIPPED_RATIO.value() < 1
+
+    @patch("backend.app.prefilter.settings.PREFILTER_THRESHOLD", 1.0)
+    def test_custom_categories_are_not_screened(self):
+        assert screens(["Name", "phone"])
+        assert not screens(["name", "case number"])
+        assert not should_skip("第十二条 合同应当履行。", ["name", "case number"])
@@ -0,0 +1,49 @@
+import pytest
+
+from backend.app.prompts import (
+    SYSTEM_PROMPTS,
+    build_batch_instructions,
+    build_messages,
+    build_repair_messages,
+    get_output_format,
+    get_system_prompt,
+    mark_prefix_cacheable,
+)
+
+
+class TestPromptRegistry:
+    def test_unknown_version(self):
+        with pytest.raises(ValueError, match="Unknown prompt version"):
+            get_system_prompt("v999")
+
+    def test_messages_share_prefix_across_requests(self):
+        a = build_messages("v2", "text a", ["name"])
+        b = build_messages("v2", "text b", ["phone"], "extra\n\n")
+        assert a[0] == b[0]
+        assert a[0]["content"] is SYSTEM_PROMPTS["v2"]
+        assert b[1]["content"] == "Categories to detect: phone\n\nextra\n\nText to analyze:\ntext b"
+
+    def test_cache_prefix_marks_system_message(self):
+        messages = mark_prefix_cacheable(build_messages("v2", "text", ["name"]))
+        part = messages[0]["content"][0]
+        assert part["text"] == SYSTEM_PROMPTS["v2"]
+        assert part["cache_control"] == {"type": "ephemeral"}
+
+    def test_repair_messages_keep_original_prompt(self):
+        messages = build_messages("v2", "text", ["name"])
+        repair = build_repair_messages(messages, "{broken")
+        assert repair[:2] == messages
+        assert repair[2] == {"role": "assistant", "content": "{broken"}
+        assert repair[3]["role"] == "user"
+
+    def test_compact_prompt_numbers_categories(self):
+        assert get_output_format("v3") == "compact"
+        assert "CODE|EXACT_SUBSTRING" in SYSTEM_PROMPTS["v3"]
+        assert '{"detections"' not in SYSTEM_PROMPTS["v3"]
+        messages = build_messages("v3", "text", ["name", "phone"])
+        assert messages[1]["content"] == "Categories to detect:\n1=name\n2=phone\n\nText to analyze:\ntext"
+
+    def test_batch_instructions_follow_output_format(self):
+        assert '"item" field' in build_batch_instructions("v2", "### ITEM {}", 3)
+        compact = build_batch_instructions("v3", "### ITEM {}", 3)
+        assert '"### ITEM n"' in compact and "n|CODE|" in compact
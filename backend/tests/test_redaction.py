@@ -0,0 +1,148 @@
+import os
+import zipfile
+
+import pytest
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+from backend.app.document_parser import Extraction, SourceSpan, extract_document
+from backend.app.redaction import Edit, extract_redactable, is_redactable, plan_edits, write_docx
+
+
+def save(doc, tmp_path) -> str:
+    path = tmp_path / "in.docx"
+    doc.save(path)
+    return str(path)
+
+
+def find(text: str, value: str, det_type: str = "name") -> dict:
+    start = text.index(value)
+    return {"type": det_type, "original": value, "start": start, "end": start + len(value)}
+
+
+def add_hyperlink(paragraph, text: str, target: str) -> None:
+    r_id = paragraph.part.relate_to(target, RT.HYPERLINK, is_external=True)
+    paragraph._p.append(parse_xml(
+        f'<w:hyperlink {nsdecls("w", "r")} r:id="{r_id}"><w:r><w:t>{text}</w:t></w:r></w:hyperlink>'
+    ))
+
+
+def add_footnotes(doc, text: str) -> None:
+    xml = (
+        f'<w:footnotes {nsdecls("w")}><w:footnote w:id="1"><w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+        "</w:footnote></w:footnotes>"
+    )
+    part = Part(
+        PackURI("/word/footnotes.xml"),
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml",
+        xml.encode(),
+        doc.part.package,
+    )
+    doc.part.relate_to(part, RT.FOOTNOTES)
+
+
+def package_text(path: str) -> str:
+    with zipfile.ZipFile(path) as archive:
+        return "".join(archive.read(name).decode("utf-8", errors="replace") for name in archive.namelist())
+
+
+class TestPlanEdits:
+    def test_span_across_runs(self):
+        extraction = Extraction("John Smith", [SourceSpan(0, 5, (0, 0)), SourceSpan(5, 10, (0, 1))])
+        edits = plan_edits(extraction, [find("John Smith", "John Smith")], "tag")
+        assert edits == [Edit((0, 0), 0, 5, "[NAME_1]"), Edit((0, 1), 0, 5, "")]
+
+    def test_overlapping_detections_merge(self):
+        extraction = Extraction("a@b.com", [SourceSpan(0, 7, (0, 0))])
+        dets = [find("a@b.com", "a@b.com", "email"), find("a@b.com", "b.com", "social_media")]
+        assert plan_edits(extraction, dets) == [Edit((0, 0), 0, 7, "████")]
+
+
+class TestWriteDocx:
+    def test_masks_runs_and_keeps_formatting(self, tmp_path):
+        doc = Document()
+        p = doc.add_paragraph("Client: ")
+        p.add_run("John").bold = True
+        p.add_run(" Smith, tel 13812345678")
+        table = doc.add_table(rows=1, cols=1)
+        table.cell(0, 0).text = "John Smith"
+        doc.sections[0].header.paragraphs[0].text = "Prepared for John Smith"
+        path = save(doc, tmp_path)
+
+        with open(path, "rb") as f:
+            extraction = extract_document("in.docx", f)
+        text = extraction.text
+        detections = []
+        pos = 0
+        while (pos := text.find("John Smith", pos)) != -1:
+            detections.append({"type": "name", "original": "John Smith", "start": pos, "end": pos + 10})
+            pos += 10
+        detections.append(find(text, "13812345678", "phone"))
+
+        out = write_docx(path, plan_edits(extraction, detections, "tag"))
+        try:
+            result = Document(out)
+        finally:
+            os.unlink(out)
+        runs = result.paragraphs[0].runs
+        assert [r.text for r in runs] == ["Client: ", "[NAME_1]", ", tel [PHONE_1]"]
+        assert runs[1].bold
+        assert result.tables[0].cell(0, 0).text == "[NAME_1]"
+        assert result.sections[0].header.paragraphs[0].text == "Prepared for [NAME_1]"
+
+    def test_no_edits_roundtrip(self, tmp_path):
+        doc = Document()
+        doc.add_paragraph("Nothing here")
+        out = write_docx(save(doc, tmp_path), [])
+        try:
+            assert Document(out).paragraphs[0].text == "Nothing here"
+        finally:
+            os.unlink(out)
+
+
+    def test_scrubs_hyperlink_targets_and_properties(self, tmp_path):
+        doc = Document()
+        paragraph = doc.add_paragraph("Email: ")
+        add_hyperlink(paragraph, "zhang.san@firm.com", "mailto:zhang.san@firm.com")
+        add_hyperlink(doc.add_paragraph("See "), "the rules", "https://example.com/rules")
+        doc.core_properties.author = "张三"
+        doc.core_properties.last_modified_by = "张三"
+        path = save(doc, tmp_path)
+
+        extraction = extract_redactable("in.docx", path)
+        detections = [find(extraction.text, "zhang.san@firm.com", "email")]
+        out = write_docx(path, plan_edits(extraction, detections, "tag"))
+        try:
+            content = package_text(out)
+            result = Document(out)
+        finally:
+            os.unlink(out)
+        assert "zhang.san" not in content
+        assert "张三" not in content
+        assert result.paragraphs[0].text == "Email: [EMAIL_1]"
+        assert [h.address for h in result.paragraphs[1].hyperlinks] == ["https://example.com/rules"]
+
+    def test_refuses_footnotes_and_text_boxes(self, tmp_path):
+        doc = Document()
+        doc.add_paragraph("Body")
+        add_footnotes(doc, "张三")
+        with pytest.raises(ValueError, match="footnotes"):
+            extract_redactable("in.docx", save(doc, tmp_path))
+
+        doc = Document()
+        doc.add_paragraph()._p.append(parse_xml(
+            f'<w:r {nsdecls("w")} xmlns:v="urn:schemas-microsoft-com:vml"><w:pict><v:shape><v:textbox><w:txbxContent>'
+            "<w:p><w:r><w:t>张三</w:t></w:r></w:p></w:txbxContent></v:textbox></v:shape></w:pict></w:r>"
+        ))
+        with pytest.raises(ValueError, match="text boxes"):
+            extract_redactable("in.docx", save(doc, tmp_path))
+
+
+def test_is_redactable():
+    assert is_redactable("a.DOCX")
+    assert not is_redactable("a.pdf")
+    assert not is_redactable("a.exe")
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from backend.app.scheduler import (
+    BULK,
+    INTERACTIVE,
+    DeadlineExceeded,
+    LLMScheduler,
+    QueueFull,
+    request_context,
+)
+
+
+async def queued(scheduler, order, name, priority):
+    with request_context(priority, None):
+        async with scheduler.slot():
+            order.append(name)
+
+
+class TestLLMScheduler:
+    @pytest.mark.asyncio
+    async def test_interactive_served_before_bulk(self):
+        scheduler = LLMScheduler(1)
+        order = []
+        await scheduler.acquire()
+        tasks = [
+            asyncio.ensure_future(queued(scheduler, order, "bulk-1", BULK)),
+            asyncio.ensure_future(queued(scheduler, order, "bulk-2", BULK)),
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(queued(scheduler, order, "interactive", INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 3
+
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "bulk-1", "bulk-2"]
+        assert scheduler.active == 0
+
+    @pytest.mark.asyncio
+    async def test_admit_rejects_when_queue_full(self):
+        scheduler = LLMScheduler(1, {BULK: 1})
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(queued(scheduler, [], "bulk", BULK))
+        await asyncio.sleep(0)
+
+        scheduler.admit(INTERACTIVE)
+        with pytest.raises(QueueFull) as exc_info:
+            scheduler.admit(BULK)
+        assert exc_info.value.retry_after >= 1
+
+        scheduler.release()
+        await waiter
+
+    @pytest.mark.asyncio
+    async def test_deadline_exceeded_while_queued(self):
+        scheduler = LLMScheduler(1)
+        await scheduler.acquire()
+        with request_context(INTERACTIVE, 0.01):
+            with pytest.raises(DeadlineExceeded):
+                await scheduler.acquire()
+        assert scheduler.queue_depth() == 0
+        scheduler.release()
+        assert scheduler.active == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        scheduler = LLMScheduler(1)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(queued(scheduler, [], "w", INTERACTIVE))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 0
+
+        scheduler.release()
+        assert scheduler.active == 0
@@ -0,0 +1,51 @@
+from backend.app.aho_corasick import AhoCorasick
+from backend.app.span_resolver import normalize_with_map, resolve_spans
+
+
+class TestAhoCorasick:
+    def test_finds_overlapping_matches(self):
+        ac = AhoCorasick(["he", "she", "his", "hers"])
+        matches = sorted((s, e, ac.patterns[p]) for s, e, p in ac.iter_matches("ushers"))
+        assert matches == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+    def test_repeated_pattern(self):
+        ac = AhoCorasick(["aa"])
+        assert [m[:2] for m in ac.iter_matches("aaaa")] == [(0, 2), (1, 3), (2, 4)]
+
+    def test_add_after_search_does_not_repeat_matches(self):
+        ac = AhoCorasick(["张三丰", "三丰"])
+        assert len(list(ac.iter_matches("张三丰"))) == 2
+        ac.add("李四")
+        assert len(list(ac.iter_matches("张三丰"))) == 2
+        ac.add("王五")
+        assert sorted(ac.iter_matches("张三丰李四")) == [(0, 3, 0), (1, 3, 1), (3, 5, 2)]
+
+
+class TestResolveSpans:
+    def test_exact_all_occurrences(self):
+        text = "Bob met Alice; Bob left."
+        spans = resolve_spans(text, ["Bob", "Alice", "Carol"])
+        assert spans["Bob"] == [(0, 3, "Bob"), (15, 18, "Bob")]
+        assert spans["Alice"] == [(8, 13, "Alice")]
+        assert spans["Carol"] == []
+
+    def test_case_insensitive_fallback(self):
+        text = "Contact JOHN SMITH today"
+        assert resolve_spans(text, ["John Smith"])["John Smith"] == [(8, 18, "JOHN SMITH")]
+
+    def test_whitespace_and_full_width_variants(self):
+        text = "电话：１３８ １２３４ ５６７８，邮箱 Ａ@b.com"
+        spans = resolve_spans(text, ["13812345678", "a@b.com"])
+        start, end, actual = spans["13812345678"][0]
+        assert actual == "１３８ １２３４ ５６７８"
+        assert text[start:end] == actual
+        assert spans["a@b.com"][0][2] == "Ａ@b.com"
+
+    def test_exact_match_preferred_over_fuzzy(self):
+        text = "id abc and ABC"
+        assert resolve_spans(text, ["abc"])["abc"] == [(3, 6, "abc")]
+
+    def test_normalize_map(self):
+        norm, index_map = normalize_with_map("A b")
+        assert norm == "ab"
+        assert index_map == [0, 2]
@@ -0,0 +1,165 @@
+import os
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from backend.app import tabular
+from backend.app.tabular import (
+    RULES, SKIP, TEXT, WHOLE, ColumnProfile, TableMaskError, TableMasker, header_type, mask_table,
+)
+
+
+def fake_batch(found: dict[str, list[tuple[str, str]]] | None = None, error: str | None = None):
+    """detect_pii_batch stand-in: found maps text -> [(type, substring)]."""
+    found = found or {}
+    calls = []
+
+    async def detect(texts, categories):
+        calls.append(list(texts))
+        results = []
+        for text in texts:
+            dets = [
+                {"type": t, "original": s, "start": text.index(s), "end": text.index(s) + len(s)}
+                for t, s in found.get(text, [])
+            ]
+            results.append({"detections": dets, "error": error} if error else {"detections": dets})
+        return results
+
+    detect.calls = calls
+    return detect
+
+
+def text_frame(**columns) -> pd.DataFrame:
+    return pd.DataFrame(columns, dtype=str)
+
+
+class TestProfile:
+    def test_header_hints(self):
+        assert header_type("Customer Name", ["name", "phone"]) == "name"
+        assert header_type("手机号", ["name", "phone"]) == "phone"
+        assert header_type("E-mail address", ["email"]) == "email"
+        assert header_type("phone", ["name"]) is None
+        assert header_type("amount", ["name", "phone"]) is None
+
+    @pytest.mark.parametrize("header", ["Hotel", "Intel CPU", "Telecom plan", "Hostname", "Filename"])
+    def test_header_hints_match_whole_words(self, header):
+        assert header_type(header, ["name", "phone"]) is None
+
+    @pytest.mark.asyncio
+    async def test_header_hint_needs_confirming_values(self):
+        detect = fake_batch()
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = detect
+            masker = TableMasker(["name"])
+            frame = text_frame(**{"Product name": ["Widget Pro", "Gadget Max", "Widget Pro"]})
+            masked = await masker.mask(frame)
+        assert masker.profiles[0].kind == SKIP
+        assert list(masked["Product name"]) == ["Widget Pro", "Gadget Max", "Widget Pro"]
+
+    @pytest.mark.asyncio
+    async def test_rule_column_is_masked_whole_without_model(self):
+        detect = fake_batch()
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = detect
+            masker = TableMasker(["name", "phone"])
+            frame = text_frame(contact=["13812345678", "13912345678", "13712345678"])
+            masked = await masker.mask(frame)
+        assert masker.profiles[0] == ColumnProfile("contact", WHOLE, "phone")
+        assert list(masked["contact"]) == ["████"] * 3
+        assert detect.calls == []
+
+    @pytest.mark.asyncio
+    async def test_rules_inside_cells(self):
+        masker = TableMasker(["phone", "email"])
+        frame = text_frame(notes=["call 13812345678 today", "no contact", "mail a@b.com"])
+        masked = await masker.mask(frame)
+        assert masker.profiles[0].kind == RULES
+        assert list(masked["notes"]) == ["call ████ today", "no contact", "mail ████"]
+
+    @pytest.mark.asyncio
+    async def test_free_text_goes_to_model_once_per_distinct_value(self):
+        detect = fake_batch({"met Alice": [("name", "Alice")], "met Bob": [("name", "Bob")]})
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = detect
+            masker = TableMasker(["name"], "tag")
+            frame = text_frame(notes=["met Alice", "met Bob", "met Alice", "nothing", ""])
+            masked = await masker.mask(frame)
+        assert masker.profiles[0] == ColumnProfile("notes", TEXT)
+        assert list(masked["notes"]) == ["met [NAME_1]", "met [NAME_2]", "met [NAME_1]", "nothing", ""]
+        # One call to profile the sample, one for the column's distinct values
+        assert detect.calls[1] == ["met Alice", "met Bob", "nothing"]
+        assert masker.masked_cells == 3
+
+    @pytest.mark.asyncio
+    async def test_numeric_column_is_skipped_without_model(self):
+        detect = fake_batch()
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = detect
+            masker = TableMasker(["name"])
+            masked = await masker.mask(text_frame(amount=["12.5", "7", "2024-01-02"]))
+        assert masker.profiles[0].kind == SKIP
+        assert list(masked["amount"]) == ["12.5", "7", "2024-01-02"]
+        assert detect.calls == []
+
+    @pytest.mark.asyncio
+    async def test_empty_column_is_profiled_later(self):
+        masker = TableMasker(["phone"])
+        await masker.mask(text_frame(extra=["", ""]))
+        assert 0 not in masker.profiles
+        masked = await masker.mask(text_frame(extra=["13812345678", ""]))
+        assert masker.profiles[0].kind == WHOLE
+        assert list(masked["extra"]) == ["████", ""]
+
+    @pytest.mark.asyncio
+    async def test_model_error_raises(self):
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = fake_batch(error="down")
+            with pytest.raises(TableMaskError):
+                await TableMasker(["name"]).mask(text_frame(notes=["met Alice"]))
+
+
+class TestMaskTable:
+    @pytest.mark.asyncio
+    async def test_csv_in_batches_keeps_tags_consistent(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(tabular, "ROW_BATCH_SIZE", 2)
+        path = tmp_path / "people.csv"
+        path.write_text("姓名,amount\nAlice,1\nBob,2\nAlice,3\n", encoding="utf-8")
+
+        # The sample holds only Alice: the 姓名 header lowers the share needed to one half
+        with patch("backend.app.llm_service.llm_service") as llm:
+            llm.detect_pii_batch = fake_batch({"Alice": [("name", "Alice")]})
+            result = await mask_table("people.csv", str(path), ["name"], "tag")
+        try:
+            with open(result.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        finally:
+            os.unlink(result.path)
+        assert lines == ["姓名,amount", "[NAME_1],1", "[NAME_2],2", "[NAME_1],3"]
+        assert result.columns == [ColumnProfile("姓名", WHOLE, "name"), ColumnProfile("amount", SKIP)]
+        assert result.masked_cells == 3
+
+    @pytest.mark.asyncio
+    async def test_xlsx_keeps_unmasked_cell_types(self, tmp_path):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["phone", 2024, None])
+        sheet.append([13812345678, 12.5, None])
+        sheet.append([13912345678, 3, "x"])
+        path = tmp_path / "t.xlsx"
+        workbook.save(path)
+
+        result = await mask_table("t.xlsx", str(path), ["phone"])
+        try:
+            rows = list(load_workbook(result.path).active.iter_rows(values_only=True))
+        finally:
+            os.unlink(result.path)
+        assert rows == [("phone", 2024, None), ("████", 12.5, None), ("████", 3, "x")]
+
+    @pytest.mark.asyncio
+    async def test_invalid_xlsx(self, tmp_path):
+        path = tmp_path / "bad.xlsx"
+        path.write_bytes(b"not a zip")
+        with pytest.raises(ValueError):
+            await mask_table("bad.xlsx", str(path), ["name"])